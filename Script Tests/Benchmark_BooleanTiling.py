@@ -0,0 +1,42 @@
+# Benchmark of the tiled boolean engine against the standard operations on a 
+# layer with many small polygons. Tiling must not be slower, even without 
+# process pool.
+
+import time
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+def best_time(fn, repeat=3):
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter()-t0)
+    return min(times)
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    n = 50000
+    x = rng.uniform(0,2000,n)
+    y = rng.uniform(0,2000,n)
+    A = sm.GeomGroup()
+    B = sm.GeomGroup()
+    for xi,yi in zip(x,y):
+        A.group.append(sm.make_rect(xi,yi,2,1).group[0])
+        B.group.append(sm.make_rect(xi+1,yi,2,1,layer=2).group[0])
+    A.pack()
+    B.pack()
+    ops = {"union": lambda g: g.boolean_union(1),
+           "resize": lambda g: g.poly_resize(0.2,1),
+           "difference": lambda g: g.boolean_difference(B,1,2),
+           "xor": lambda g: g.boolean_xor(B,1,2)}
+    for name,op in ops.items():
+        res = []
+        for tile in [0,250]:
+            smsh.set_boolean_tiling(tile,processes=1,min_polygons=1000)
+            res.append(best_time(lambda: op(A.copy())))
+        smsh.set_boolean_tiling(0)
+        print("%-10s untiled %.2f s, tiled %.2f s"%(name,res[0],res[1]))
+        assert res[1]<=res[0], name+": tiled operation slower than untiled"
+    print("Boolean tiling benchmark passed")
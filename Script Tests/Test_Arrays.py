@@ -0,0 +1,49 @@
+# Checks of the lattice search (samplemaker.spatial.find_lattices) and of the
+# extraction of array references from regular SRef placements.
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+from samplemaker.spatial import find_lattices
+
+rng = np.random.default_rng(5)
+
+# Lattices are found among noise and duplicates, members match the vectors
+pts = [(100+i*30+j*5,-40+j*20) for i in range(6) for j in range(4)]
+pts+= [(5000+i*11,0) for i in range(10)]
+noise = rng.integers(-10**6,10**6,(200,2)).tolist()
+allpts = np.array(pts+noise+pts[:3])
+perm = rng.permutation(len(allpts))
+allpts = allpts[perm]
+found = find_lattices(allpts,3)
+assert sorted([(nc*nr) for m,nc,nr,a,b in found])==[10,24]
+for members,ncols,nrows,a,b in found:
+    o = allpts[members[0]]
+    expected = set([(o[0]+c*a[0]+r*b[0],o[1]+c*a[1]+r*b[1]) for r in range(nrows) for c in range(ncols)])
+    assert set([tuple(allpts[k]) for k in members])==expected
+assert find_lattices(np.zeros((0,2)),3)==[]
+assert find_lattices(rng.integers(0,10**9,(500,2)),3)==[]
+
+# Array extraction from references
+cell = sm.make_rect(0,0,1,1)+sm.make_circle(2,0,0.5)
+geom = sm.GeomGroup()
+for i in range(5):
+    for j in range(3):
+        geom+=sm.make_sref(i*4,j*3+i*0.5,"CELL",cell)
+geom+=sm.make_sref(100,100,"CELL",cell)             # isolated
+for i in range(4):
+    geom+=sm.make_sref(i*10,-50,"CELL",cell,angle=90)   # other rotation
+flat = geom.flatten()
+assert geom.extract_arrays(3)==19
+arefs = [g for g in geom.group if type(g)==smsh.ARef]
+assert sorted([(a.ncols*a.nrows) for a in arefs])==[4,15]
+assert len([g for g in geom.group if type(g)==smsh.SRef])==1
+flat2 = geom.flatten()
+assert np.isclose(flat2.get_area(),flat.get_area())
+bb1 = flat.bounding_box()
+bb2 = flat2.bounding_box()
+assert np.allclose([bb1.llx,bb1.lly,bb1.width,bb1.height],[bb2.llx,bb2.lly,bb2.width,bb2.height])
+xs,ys = np.meshgrid(np.arange(-1,20,0.25),np.arange(-1,10,0.25))
+assert np.all(flat.points_inside(xs,ys)==flat2.points_inside(xs,ys))
+
+print("Array checks passed")
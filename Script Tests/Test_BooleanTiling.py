@@ -0,0 +1,83 @@
+# Checks that the tiled boolean engine (set_boolean_tiling) gives the same 
+# geometry as the standard operations, serially and with a process pool.
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+def total_area(g, layer):
+    return sum(p.area() for p in g.select_layer(layer).group)
+
+def same_geometry(g1, g2, layer):
+    d = g1.copy()
+    d.boolean_xor(g2, layer, layer)
+    return total_area(d, layer)<1e-3
+
+def random_rects(n, layer, seed):
+    rng = np.random.default_rng(seed)
+    g = sm.GeomGroup()
+    for x,y,w,h in zip(rng.uniform(0,100,n),rng.uniform(0,100,n),
+                       rng.uniform(0.5,8,n),rng.uniform(0.5,8,n)):
+        g += sm.make_rect(x,y,w,h,layer=layer)
+    return g
+
+def run_all(A, B):
+    res = {}
+    g = A.copy()
+    g.boolean_union(1)
+    res["union"] = g
+    for op in ["difference","xor","intersection"]:
+        g = A.copy()
+        getattr(g,"boolean_"+op)(B,1,2)
+        res[op] = g
+    g = A.copy()
+    g.poly_resize(0.3,1)
+    res["resize"] = g
+    g = A.copy()
+    g.poly_resize(-0.2,1)
+    res["shrink"] = g
+    g = A.copy()
+    g.invert(1,offset=2)
+    res["invert"] = g
+    return res
+
+if __name__ == "__main__":
+    A = random_rects(400,1,1)
+    B = random_rects(400,2,2)
+    smsh.set_boolean_tiling(0)
+    ref = run_all(A,B)
+    for tile,proc in [(13,1),(7,2),(1000,1)]:
+        smsh.set_boolean_tiling(tile,processes=proc,min_polygons=10)
+        res = run_all(A,B)
+        for op in ref:
+            assert abs(total_area(res[op],1)-total_area(ref[op],1))<1e-3, (op,tile,proc)
+            assert same_geometry(res[op],ref[op],1), (op,tile,proc)
+    
+    # Operands with no polygons in some (or all) tiles
+    smsh.set_boolean_tiling(5,processes=2,min_polygons=1)
+    g = sm.make_rect(0,0,1,1,layer=1)+sm.make_rect(50,50,1,1,layer=1)
+    g.boolean_intersection(sm.GeomGroup(),1,2)
+    assert len(g.select_layer(1).group)==0
+    g = sm.make_rect(0,0,1,1,layer=1)+sm.make_rect(50,50,1,1,layer=1)
+    g.boolean_difference(sm.make_rect(50,50,1,1,layer=2),1,2)
+    assert abs(total_area(g,1)-1)<1e-6
+    
+    # Layers below min_polygons use the standard operations
+    smsh.set_boolean_tiling(5,min_polygons=1000)
+    g = random_rects(50,1,3)
+    g.boolean_union(1)
+    smsh.set_boolean_tiling(0)
+    h = random_rects(50,1,3)
+    h.boolean_union(1)
+    assert same_geometry(g,h,1)
+    
+    # Invalid settings are rejected
+    for bad in [dict(tile_size=-1),dict(tile_size=10,processes=0)]:
+        try:
+            smsh.set_boolean_tiling(**bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("set_boolean_tiling accepted "+str(bad))
+    smsh.set_boolean_tiling(0)
+    print("Boolean tiling checks passed")
@@ -0,0 +1,68 @@
+# Checks of the bulk transfer of polygons to and from boopy 
+# (PolyGroup.addPolyArray and PolyGroup.getPolyArray).
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.resources.boopy as boopy
+
+# Same polygons as with addPolyData
+idata = np.array([0,0,1000,0,1000,1000,0,1000, 2000,0,3000,0,2500,800],dtype="int64")
+offsets = np.array([0,4,7],dtype="int64")
+pg1 = boopy.PolyGroup()
+pg1.addPolyArray(idata,offsets)
+pg2 = boopy.PolyGroup()
+pg2.addPolyData([0,0,1000,0,1000,1000,0,1000])
+pg2.addPolyData([2000,0,3000,0,2500,800])
+assert pg1.getPolyCount()==2
+assert pg1.getPoly(0)==pg2.getPoly(0) and pg1.getPoly(1)==pg2.getPoly(1)
+d,o = pg1.getPolyArray()
+assert np.array_equal(d,idata) and np.array_equal(o,offsets)
+assert pg1.area()==pg2.area()
+
+# Empty buffers
+pg = boopy.PolyGroup()
+pg.addPolyArray(np.zeros(0,dtype="int64"),np.zeros(1,dtype="int64"))
+assert pg.getPolyCount()==0
+d,o = pg.getPolyArray()
+assert d.size==0 and list(o)==[0]
+
+# Copies are independent
+pg3 = pg1.copy()
+pg3.clear()
+assert pg3.getPolyCount()==0 and pg1.getPolyCount()==2
+
+# Coordinates outside the int range are rejected, not wrapped around
+for v in [2**31, -2**31-1, 2**40]:
+    bad = idata.copy()
+    bad[2] = v
+    pg = boopy.PolyGroup()
+    try:
+        pg.addPolyArray(bad,offsets)
+    except OverflowError:
+        pass
+    else:
+        raise AssertionError("addPolyArray accepted "+str(v))
+    assert pg.getPolyCount()==0
+pg = boopy.PolyGroup()
+pg.addPolyArray(np.array([2**31-1,-2**31,0,0,5,5],dtype="int64"),np.array([0,3]))
+assert pg.getPolyCount()==1
+
+# Offsets must match the buffer
+for bad in [[0,4,8],[0,5,4],[-1,4,7],[0,4,7,9]]:
+    pg = boopy.PolyGroup()
+    try:
+        pg.addPolyArray(idata,np.array(bad,dtype="int64"))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("addPolyArray accepted offsets "+str(bad))
+
+# Geometry far from the origin fails loudly in boolean operations
+g = sm.make_rect(0,0,1,1,layer=1)+sm.make_rect(3e6,0,1,1,layer=1)
+try:
+    g.boolean_union(1)
+except OverflowError:
+    pass
+else:
+    raise AssertionError("boolean_union accepted coordinates beyond 2^31 nm")
+print("boopy array checks passed")
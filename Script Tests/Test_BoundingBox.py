@@ -0,0 +1,75 @@
+# Checks of the bounding boxes cached in GeomGroup.
+# The cached box must follow any change of the elements, also when they are
+# modified through another group sharing them or inside a referenced cell.
+
+import pickle
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+geom = sm.make_rect(0,0,2,2,numkey=1)+sm.make_rect(4,0,2,2,numkey=1)
+assert geom.bounding_box().width==6
+
+# Elements modified through a selection (the selection shares the elements)
+sel = geom.select("x<3")
+sel.translate(10,0)
+assert geom.bounding_box().width==8
+
+# Elements modified directly
+geom.group[0].translate(-14,0)
+assert geom.bounding_box().llx==-4
+
+# Elements shared by another group
+other = smsh.GeomGroup()
+other.group = list(geom.group)
+other.translate(1,0)
+assert geom.bounding_box().llx==-3
+
+# Referenced cells (nested)
+cell = sm.make_rect(0,0,2,2,numkey=1)
+mid = sm.make_sref(0,0,"CELL",cell)
+top = sm.make_sref(10,0,"MID",mid)
+assert top.bounding_box().width==2
+cell.add(sm.make_rect(5,0,2,2,numkey=1).group[0])
+assert top.bounding_box().width==7
+cell.group[1].translate(5,0)
+assert top.bounding_box().width==12
+
+# Attributes changed directly need invalidate_cache
+geom.group[0].layer = 5
+geom.invalidate_cache()
+assert len(geom.select("L==5").group)==1
+
+# Validating an unchanged cache does not visit the elements, whatever 
+# happens elsewhere
+class CountingList(list):
+    visits = 0
+    def __iter__(self):
+        CountingList.visits+=1
+        return list.__iter__(self)
+
+big = sm.make_rect(0,0,1,1,numkey=1)+sm.make_sref(0,0,"CELL",cell)
+big.group = CountingList(big.group)
+bb = big.bounding_box()
+visits = CountingList.visits
+unrelated = sm.make_rect(0,0,1,1)
+for i in range(10):
+    unrelated.translate(1,0)
+    assert big.bounding_box().width==bb.width
+assert CountingList.visits==visits
+# ... while changes below are still seen (element, nested cell, pickled copy)
+big.group[0].translate(-1,0)
+assert big.bounding_box().llx==-1
+cell.group[0].translate(0,-3)
+assert big.bounding_box().lly==-3
+assert top.bounding_box().lly==-3
+big2 = pickle.loads(pickle.dumps(big))
+assert big2.bounding_box().llx==-1
+big2.group[0].translate(-1,0)
+assert big2.bounding_box().llx==-2 and big.bounding_box().llx==-1
+# Copies do not invalidate the caches of the original
+c = big.copy()
+visits = CountingList.visits
+c.group[0].translate(-5,0)
+assert big.bounding_box().llx==-1 and CountingList.visits==visits
+
+print("Bounding box checks passed")
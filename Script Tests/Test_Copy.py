@@ -0,0 +1,97 @@
+# Checks of GeomGroup.copy: the copy shares the coordinate buffers with the
+# original, modifying either side must not change the other.
+
+import numpy as np
+from copy import deepcopy
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+def signature(geom):
+    sig = []
+    for g in geom.group:
+        if(type(g)==smsh.Poly or type(g)==smsh.PolyArray):
+            sig.append((type(g).__name__,g.layer,tuple(np.round(g.data,6))))
+        elif(type(g)==smsh.Path):
+            sig.append(("W",g.layer,tuple(g.xpts),tuple(g.ypts),g.width))
+        elif(type(g)==smsh.Text):
+            sig.append(("T",g.layer,g.text,g.x0,g.y0))
+        elif(type(g)==smsh.SRef):
+            sig.append(("S",g.cellname,g.x0,g.y0,id(g.group)))
+        else:
+            sig.append((type(g).__name__,g.layer,g.x0,g.y0))
+    return sig
+
+cell = sm.make_rect(0,0,1,1)
+def make_geom():
+    geom = sm.make_rect(0,0,4,2)+sm.make_circle(10,0,3)+sm.make_ellipse(0,10,2,1,0)
+    geom+= sm.make_path([0,5,5],[-10,-8,0],0.5)+sm.make_text(20,0,"A",2,0.3)
+    geom+= sm.make_ring(20,20,3,2,0,0.5)+sm.make_sref(30,0,"CELL",cell)
+    geom+= sm.make_rect(5,5,1,1,layer=2)
+    return geom
+
+geom = make_geom()
+orig = signature(geom)
+
+operations = [
+    lambda g: g.translate(1,2),
+    lambda g: g.rotate_translate(1,2,30),
+    lambda g: g.rotate(1,2,45),
+    lambda g: g.scale(0,0,2,3),
+    lambda g: g.mirrorX(1),
+    lambda g: g.mirrorY(1),
+    lambda g: g.set_layer(7),
+    lambda g: g.pack().translate(1,1),
+    lambda g: g.poly_resize(0.1,1),
+    lambda g: g.boolean_union(1),
+    lambda g: g.all_to_poly(),
+    lambda g: [p.set_data(p.data+1) for p in g.group if type(p)==smsh.Poly],
+    lambda g: [p.set_int_data(np.zeros(8,dtype=np.int32)) for p in g.group if type(p)==smsh.Poly],
+    ]
+
+for op in operations:
+    c = geom.copy()
+    op(c)
+    assert signature(geom)==orig
+
+    # The other direction
+    g2 = make_geom()
+    c = g2.copy()
+    op(g2)
+    assert signature(c)==orig
+
+# References point to the same cell
+c = geom.copy()
+assert c.group[6].group is cell
+# Copies of copies
+c2 = c.copy().copy()
+c2.translate(5,5)
+assert signature(c)==orig
+
+# Shared coordinate buffers cannot be edited in place
+g = make_geom()
+g.group.append(smsh.PolyArray.from_polys([p for p in g.group if type(p)==smsh.Poly],1))
+gi = g.copy()
+gi.set_int_storage(True)
+for src in [g,gi]:
+    c = src.copy()
+    for elem in c.group:
+        if(type(elem)==smsh.Poly or type(elem)==smsh.PolyArray):
+            before = src.group[c.group.index(elem)].int_data().tolist()
+            arrays = [elem._data,elem._idata]
+            if(type(elem)==smsh.PolyArray):
+                arrays.append(elem.offsets)
+            for arr in arrays:
+                if(arr is None):
+                    continue
+                try:
+                    arr[0] += 1
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("shared buffer edited in place")
+            assert src.group[c.group.index(elem)].int_data().tolist()==before
+    # Transformations still work on both
+    c.translate(1,0)
+    src.rotate(0,0,90)
+
+print("Copy checks passed")
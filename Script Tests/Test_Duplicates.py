@@ -0,0 +1,59 @@
+# Checks of the canonical polygon form, Poly.identical_to and 
+# GeomGroup.remove_duplicates.
+
+import pickle
+import numpy as np
+from copy import deepcopy
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+x = [0,2,2,1,0]
+y = [0,0,1,2,1]
+p1 = smsh.Poly(x,y,1)
+p2 = smsh.Poly(x[2:]+x[:2],y[2:]+y[:2],1) # other starting vertex
+p3 = smsh.Poly(x,y,1)
+p3.set_data(p1.data[:-2])                 # without closing point
+p4 = smsh.Poly(x,[v+0.0004 for v in y],1) # same on the nm grid
+p5 = smsh.Poly(x,[v+0.002 for v in y],1)  # moved by 2 nm
+assert p1.identical_to(p2) and p1.identical_to(p3) and p1.identical_to(p4)
+assert not p1.identical_to(p5)
+assert p1.canonical_form()==p3.canonical_form()
+assert p1.signature()==p5.signature()
+
+# The cached canonical form follows the changes of the polygon
+cf = p5.canonical_form()
+p5.translate(0,-0.002)
+assert p5.canonical_form()!=cf and p1.identical_to(p5)
+
+# The cached form is not stored nor copied, and is dropped on data changes
+p6 = smsh.Poly(x,y,1)
+cf = p6.canonical_form()
+for c in [pickle.loads(pickle.dumps(p6)),deepcopy(p6)]:
+    assert "_canonical" not in c.__dict__ and c.canonical_form()==cf
+p6.set_int_data(p6.int_data())
+assert "_canonical" not in p6.__dict__
+p6.canonical_form()
+p6.set_data(p6.data+1)
+assert "_canonical" not in p6.__dict__ and p6.canonical_form()!=cf
+pa = smsh.PolyArray.from_polys([p1,p6],1)
+pa._canonical = None
+assert "_canonical" not in pickle.loads(pickle.dumps(pa)).__dict__
+
+# Duplicates on the same layer are removed, the first occurrence is kept
+geom = sm.GeomGroup()
+for p in [p1,p2,p3,p4,p5]:
+    geom.group.append(p)
+other = smsh.Poly(x,y,2)
+geom.group.append(other)
+geom+= sm.make_rect(10,0,1,1)+sm.make_rect(10,0,1,1)+sm.make_circle(0,0,1)
+assert geom.remove_duplicates()==5
+assert geom.group[0] is p1 and other in geom.group
+assert len(geom.group)==4
+
+# Packed polygons are compared too
+geom = sm.make_rect(0,0,1,1)+sm.make_rect(0,0,1,1)+sm.make_rect(2,0,1,1)
+geom.pack()
+assert geom.remove_duplicates()==1
+assert np.isclose(geom.get_area(),2)
+
+print("Duplicate checks passed")
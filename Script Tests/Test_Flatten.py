@@ -0,0 +1,56 @@
+# Checks of GeomGroup.flatten (composed reference transforms) against the
+# level by level placement of copies (SRef.place_group).
+
+import numpy as np
+from copy import deepcopy
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+def flatten_by_level(geom):
+    out = sm.GeomGroup()
+    for g in geom.group:
+        if(type(g)==smsh.SRef or type(g)==smsh.ARef):
+            out+=g.place_group(flatten_by_level(g.group))
+        else:
+            out.group.append(deepcopy(g))
+    return out
+
+def signature(geom):
+    # Sorted rounded coordinates of each element type
+    sig = []
+    for g in geom.group:
+        if(type(g)==smsh.Poly):
+            sig.append(("P",g.layer,tuple(sorted(np.round(g.data.reshape(-1,2),4).tolist()))))
+        elif(type(g)==smsh.Circle):
+            sig.append(("C",g.layer,round(g.x0,4),round(g.y0,4),round(g.r,4)))
+        elif(type(g)==smsh.Path):
+            sig.append(("W",g.layer,tuple(np.round(g.xpts,4)),tuple(np.round(g.ypts,4))))
+    return sorted(sig)
+
+leaf = sm.make_rect(0,0,2,1,numkey=1,layer=1)+sm.make_circle(3,0,0.5,layer=2)
+leaf+= sm.make_path([0,4],[2,3],0.2,layer=3)
+mid = sm.make_sref(5,0,"LEAF",leaf,angle=30)
+mid+= sm.make_sref(0,5,"LEAF",leaf,mirror=1,mag=2)
+mid+= sm.make_aref(-10,-10,"LEAF",leaf,3,2,6,0,1,4)
+mid+= sm.make_rect(0,0,1,1,layer=4)
+top = sm.make_sref(100,50,"MID",mid,angle=90,mirror=1)
+top+= sm.make_aref(0,0,"MID",mid,2,2,60,0,0,60,mag=0.5,angle=45)
+
+flat = top.flatten()
+assert signature(flat)==signature(flatten_by_level(top))
+assert len([g for g in flat.group if type(g)==smsh.SRef or type(g)==smsh.ARef])==0
+
+# Layer selection and packing
+flat1 = top.flatten(layer_list=[1])
+assert set([g.layer for g in flat1.group])=={1}
+assert len(flat1.group)==len([g for g in flat.group if g.layer==1])
+packed = top.flatten(packed=True)
+assert np.isclose(sum([g.area() for g in packed.group if type(g)==smsh.PolyArray]),
+                  sum([g.area() for g in flat.group if type(g)==smsh.Poly]))
+
+# The flattened geometry is detached from the cells
+flat.translate(1000,0)
+assert top.bounding_box().urx()<1000
+assert leaf.group[0].bounding_box().llx==0
+
+print("Flatten checks passed")
@@ -0,0 +1,116 @@
+# Checks of the content-hash keyed GDS cache (GDSWriter.cell_digests and 
+# GDSWriter.write_pool_use_cache). Writing with the cache must give the same
+# structures as writing without it, reusing only the unchanged structures.
+
+import io
+import os
+import tempfile
+import contextlib
+import samplemaker.makers as sm
+import samplemaker.layout as smlay
+from samplemaker.gdswriter import GDSWriter
+from samplemaker.gdsreader import GDSReader
+
+os.chdir(tempfile.mkdtemp())
+
+def make_pool(size_b=2, name_b="B"):
+    a = sm.make_rect(0,0,1,1)+sm.make_circle(3,0,1)+sm.make_text(0,5,"A",1,0.1)
+    b = sm.make_rect(0,0,size_b,1,layer=2)+sm.make_path([0,1],[0,1],0.1)
+    c = sm.make_sref(0,0,"A",a)+sm.make_sref(10,0,name_b,b,angle=90)
+    top = sm.make_aref(0,0,"C",c,2,2,50,0,0,50)+sm.make_sref(0,-20,"A",a)
+    return {"A":a,name_b:b,"C":c,"TOP":top}
+
+def write(filename, pool, cache=None, cache_digests=None):
+    gdsw = GDSWriter()
+    gdsw.open_library(filename)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        if(cache is None):
+            gdsw.write_pool(pool)
+            digests = gdsw.cell_digests(pool)
+        else:
+            digests = gdsw.write_pool_use_cache(pool,cache,cache_digests)
+    gdsw.close_library()
+    gdsr = GDSReader()
+    gdsr.quick_read(filename)
+    cached = [l.split()[-1] for l in out.getvalue().splitlines() if l.startswith("Writing cached")]
+    return gdsr.celldata,digests,sorted(cached)
+
+def same_cells(c1, c2):
+    # Cells equal apart from the time stamps in BGNSTR
+    return sorted(c1.keys())==sorted(c2.keys()) and all([c1[k][28:]==c2[k][28:] for k in c1])
+
+cache,digests,cached = write("first.gds",make_pool())
+
+# Digests do not depend on the session or on the object identity
+assert GDSWriter().cell_digests(make_pool())==digests
+
+# Nothing changed: all structures come from the cache
+cells,_,cached = write("same.gds",make_pool(),cache,digests)
+assert cached==["A","B","C","TOP"]
+assert same_cells(cells,cache)
+
+# One cell changed: the cell and the cells referencing it are encoded again
+pool = make_pool(size_b=3)
+cells,digests2,cached = write("changed.gds",pool,cache,digests)
+assert cached==["A"]
+assert same_cells(cells,write("ref.gds",pool)[0])
+
+# Renamed cell with the same content: copied from the cache and renamed, 
+# references to it are renamed too
+pool = make_pool(name_b="B2")
+cells,_,cached = write("renamed.gds",pool,cache,digests)
+assert cached==["A","B2","C","TOP"]
+assert same_cells(cells,write("ref.gds",pool)[0])
+
+# Two cells with the content of a cached cell, one keeps the cached name:
+# references to it must not be renamed
+pool = make_pool()
+pool["B_COPY"] = pool["B"].copy()
+pool["TOP"].add(sm.make_sref(100,100,"B_COPY",pool["B_COPY"]).group[0])
+cells,_,cached = write("copies.gds",pool,cache,digests)
+assert same_cells(cells,write("ref.gds",pool)[0])
+
+# Changing a cell in place changes its digest
+pool = make_pool()
+d0 = GDSWriter().cell_digests(pool)
+pool["A"].group[0].translate(0.001,0)
+d1 = GDSWriter().cell_digests(pool)
+assert d0["A"]!=d1["A"] and d0["TOP"]!=d1["TOP"] and d0["B"]==d1["B"]
+
+# Mask exports: the sidecar index must not be used for a GDS file written 
+# without the cache (cache on, cache off with other geometry, cache on again)
+def export_mask(width, cache, streaming=False):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        mask = smlay.Mask("cachemask")
+        mask.set_streaming(streaming)
+        mask.set_cache(cache)
+        cell = sm.make_rect(0,0,width,1,numkey=1)
+        mask.addCell("A",cell)
+        mask.addToMainCell(sm.make_sref(0,0,"A",cell))
+        mask.exportGDS()
+    gdsr = GDSReader()
+    gdsr.quick_read("cachemask.gds")
+    bb = gdsr.get_cell("A").bounding_box()
+    assert abs(bb.width-width)<1e-9, (width,cache,streaming,bb.width)
+    return "Writing cached A" in out.getvalue()
+
+for streaming in [False,True]:
+    for f in ["cachemask.gds","cachemask.gdsidx","cachemask.cache"]:
+        if(os.path.exists(f)):
+            os.remove(f)
+    assert not export_mask(1,True)
+    assert not export_mask(2,False,streaming)
+    assert not export_mask(1,True)
+    assert export_mask(1,True)
+    # Sidecar of a GDS file modified by other tools
+    with open("cachemask.gds","ab") as f:
+        f.write(b"\x00"*2048)
+    assert not export_mask(1,True)
+    # Sidecar in the format without file digest
+    with open("cachemask.gdsidx","w") as f:
+        f.write('{"A": "0"}')
+    assert not export_mask(1,True)
+
+print("GDS cache checks passed")
@@ -0,0 +1,67 @@
+# Checks of the vectorized decoding of BOUNDARY records in GDSReader against
+# a record by record decoding, on hand-written cells with unusual alignment,
+# extra records and mixed element types.
+
+import struct
+import numpy as np
+import samplemaker.shapes as smsh
+from samplemaker.gdsreader import GDSReader
+
+def rec(rtype, dtype, payload=b""):
+    return struct.pack(">HBB",4+len(payload),rtype,dtype)+payload
+
+def boundary(layer, xy, props=False):
+    r = rec(8,0)+rec(13,2,struct.pack(">h",layer))+rec(14,2,struct.pack(">h",0))
+    r+= rec(16,3,struct.pack(">%di"%len(xy),*xy))
+    if(props):
+        r+= rec(43,2,struct.pack(">h",1))+rec(44,6,b"ab") # shifts the alignment by 2
+    return r+rec(17,0)
+
+def path(layer, xy, width):
+    r = rec(9,0)+rec(13,2,struct.pack(">h",layer))+rec(14,2,struct.pack(">h",0))
+    r+= rec(15,3,struct.pack(">i",width))+rec(16,3,struct.pack(">%di"%len(xy),*xy))
+    return r+rec(17,0)
+
+def cell(name, elements):
+    return rec(5,2,bytes(24))+rec(6,6,name)+b"".join(elements)+rec(7,0)
+
+rng = np.random.default_rng(3)
+polys = []
+elements = []
+for i in range(50):
+    n = rng.integers(3,20)
+    xy = rng.integers(-2**31,2**31,2*n).tolist()
+    xy+= xy[0:2]
+    layer = int(rng.integers(0,400))
+    polys.append((layer,xy))
+    elements.append(boundary(layer,xy,props=(i%7==3)))
+    if(i%10==5):
+        elements.append(path(1,[0,0,1000,-1000],50))
+
+gdsr = GDSReader()
+for name in [b"TEST",b"TESTAB"]: # 4-byte aligned and 2-byte aligned XY data
+    gdsr.celldata[name.decode()] = cell(name,elements)
+    for packed in [False,True]:
+        gg = gdsr.get_cell(name.decode(),packed)
+        paths = [g for g in gg.group if type(g)==smsh.Path]
+        assert len(paths)==5
+        if(packed):
+            res = []
+            for g in gg.group:
+                if(type(g)==smsh.PolyArray):
+                    res+=[(p.layer,p.int_data().tolist()) for p in g.to_polygon().group]
+            assert sorted(res)==sorted(polys)
+        else:
+            res = [(p.layer,p.int_data().tolist()) for p in gg.group if type(p)==smsh.Poly]
+            assert res==polys
+            # Paths keep their position between the polygons
+            types = [type(g) for g in gg.group]
+            assert types.index(smsh.Path)==6
+
+# Cell without boundaries and empty cell
+gdsr.celldata["PATHS"] = cell(b"PATHS",[path(2,[0,0,10,10],5)])
+gdsr.celldata["EMPTY"] = cell(b"EMPTY",[])
+assert len(gdsr.get_cell("PATHS").group)==1
+assert len(gdsr.get_cell("EMPTY").group)==0
+
+print("GDS decode checks passed")
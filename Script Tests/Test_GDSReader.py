@@ -0,0 +1,76 @@
+# Checks of the memory-mapped GDSReader (open_library) against the in-memory
+# reader (quick_read), including the lazy cell index and failing scans.
+
+import os
+import tempfile
+import numpy as np
+import samplemaker.layout as smlay
+import samplemaker.makers as sm
+from samplemaker.gdsreader import GDSReader
+
+os.chdir(tempfile.mkdtemp())
+
+mask = smlay.Mask("test_reader")
+top = sm.GeomGroup()
+for i in range(20):
+    cell = sm.make_rect(0,0,1+i,1)+sm.make_path([0,5],[0,i],0.1)+sm.make_text(0,0,"C%i"%i,1,0.1)
+    mask.addCell("C%i"%i,cell)
+    top+=sm.make_sref(0,10*i,"C%i"%i,cell)
+top+=sm.make_aref(100,0,"C3",mask.getCell("C3"),3,2,10,0,0,10)
+mask.addToMainCell(top)
+mask.exportGDS()
+
+ref = GDSReader()
+ref.quick_read("test_reader.gds")
+
+# Only the cells up to the requested one are scanned
+gdsr = GDSReader()
+gdsr.open_library("test_reader.gds")
+assert len(gdsr.cellindex)==0
+assert bytes(gdsr.get_cell_data("C2"))==bytes(ref.get_cell_data("C2"))
+assert "C2" in gdsr.cellindex and "C10" not in gdsr.cellindex
+assert bytes(gdsr.get_cell_data("C0"))==bytes(ref.get_cell_data("C0"))
+
+# Full scan
+assert sorted(gdsr.cell_names())==sorted(ref.cell_names())
+for cname in ref.cell_names():
+    assert bytes(gdsr.get_cell_data(cname))==bytes(ref.get_cell_data(cname))
+    a = gdsr.get_cell(cname)
+    b = ref.get_cell(cname)
+    assert len(a.group)==len(b.group)
+    assert np.isclose(a.get_area(),b.get_area())
+cells = gdsr.get_cells(["C5","C1","CELL00"])
+assert len(cells["CELL00"].group)==21
+
+# Index passed from a previous scan, the file is not scanned again
+index = dict(gdsr.cellindex)
+gdsr.close_library()
+gdsr.open_library("test_reader.gds",{"C7":index["C7"]})
+assert bytes(gdsr.get_cell_data("C7"))==bytes(ref.get_cell_data("C7"))
+gdsr.close_library()
+
+# A scan that fails closes the file
+with open("test_reader.gds","rb") as f:
+    data = bytearray(f.read())
+pos = data.find(b"C15")
+data[pos] = 0xFF # not ascii
+with open("test_broken.gds","wb") as f:
+    f.write(data)
+gdsr = GDSReader()
+gdsr.open_library("test_broken.gds")
+assert bytes(gdsr.get_cell_data("C1"))==bytes(ref.get_cell_data("C1"))
+try:
+    gdsr.cell_names()
+    assert False, "No error for broken file"
+except UnicodeDecodeError:
+    pass
+assert gdsr._GDSReader__fid is None and gdsr._GDSReader__mm is None
+os.remove("test_broken.gds") # would fail on Windows if the file was still open
+
+# Empty file
+open("test_empty.gds","wb").close()
+gdsr.open_library("test_empty.gds")
+assert gdsr.cell_names()==[]
+gdsr.close_library()
+
+print("GDS reader checks passed")
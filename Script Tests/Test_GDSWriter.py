@@ -0,0 +1,64 @@
+# Checks of the GDS records written by GDSWriter. Polygons written in bulk
+# must give the same records as the element by element encoding, and 
+# coordinates that do not fit in 4 bytes must raise an error instead of 
+# wrapping around.
+
+import os
+import struct
+import tempfile
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+import samplemaker.layout as smlay
+from samplemaker.gdsreader import GDSReader
+
+def boundary_record(poly):
+    # Element by element encoding of a BOUNDARY
+    idata = poly.int_data()
+    rec = struct.pack(">2H",4,0x0800)
+    rec+= struct.pack(">2HH",6,0x0D02,poly.layer)
+    rec+= struct.pack(">2HH",6,0x0E02,0)
+    rec+= struct.pack(">2H",4*len(idata)+4,0x1003)
+    for v in idata:
+        rec+= struct.pack(">i",v)
+    rec+= struct.pack(">2H",4,0x1100)
+    return rec
+
+os.chdir(tempfile.mkdtemp())
+
+geom = sm.make_rect(0,0,4,2,layer=1)+sm.make_circle(10,0,3,to_poly=True,layer=2)
+geom+= sm.make_poly([-1000,1000,0],[-2000,-2000,2000],layer=3)
+mask = smlay.Mask("test_gdswriter")
+mask.addToMainCell(geom)
+mask.exportGDS()
+
+gdsr = GDSReader()
+gdsr.quick_read("test_gdswriter.gds")
+data = bytes(gdsr.get_cell_data("CELL00"))
+for p in geom.group:
+    assert boundary_record(p) in data
+
+# Packed polygons give the same records
+mask = smlay.Mask("test_gdswriter_packed")
+mask.addToMainCell(geom.copy().pack())
+mask.exportGDS()
+gdsr = GDSReader()
+gdsr.quick_read("test_gdswriter_packed.gds")
+assert bytes(gdsr.get_cell_data("CELL00"))[28:]==data[28:] # after BGNSTR (dates)
+
+# Read back
+cell = gdsr.get_cell("CELL00")
+assert np.isclose(cell.get_area(),geom.get_area())
+
+# Out of range coordinates (2^31 nm = 2147 mm)
+for big in [sm.make_rect(2200000,0,1,1),sm.make_path([0,2200000],[0,0],1),
+            sm.make_rect(0,-2200000,1,1).pack()]:
+    mask = smlay.Mask("test_gdswriter_range")
+    mask.addToMainCell(big)
+    try:
+        mask.exportGDS()
+        assert False, "No error for out of range coordinates"
+    except struct.error:
+        pass
+
+print("GDS writer checks passed")
@@ -0,0 +1,137 @@
+# Checks of the hierarchical boolean operations (boolean_union, poly_resize
+# and trapezoids with hierarchical=True): the referenced cells are processed
+# once and the flattened result matches the flat operation.
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+from samplemaker import LayoutPool
+
+def total_area(g, layer):
+    return sum(p.area() for p in g.select_layer(layer).group)
+
+def make_cell(name):
+    cell = sm.make_rect(0,0,2,1,layer=1)+sm.make_rect(1,0,2,1,layer=1)
+    LayoutPool[name] = cell
+    return cell
+
+LayoutPool.clear()
+cell = make_cell("UNIT")
+top = sm.make_rect(20,20,4,4,layer=1)
+top += sm.make_sref(0,0,"UNIT",cell)
+top += sm.make_sref(10,0,"UNIT",cell,angle=90,mirror=True)
+top += sm.make_aref(0,10,"UNIT",cell,3,2,5,0,0,3)
+flat = top.flatten()
+flat.poly_resize(0.2,1)
+top.poly_resize(0.2,1,hierarchical=True)
+assert len([g for g in top.group if type(g)==smsh.SRef or type(g)==smsh.ARef])==3
+# Cells are resized once, shapes in the cell are merged
+assert len(LayoutPool["UNIT"].group)==1
+assert abs(total_area(LayoutPool["UNIT"],1)-3.4*1.4)<1e-6
+assert abs(total_area(top.flatten(),1)-total_area(flat,1))<1e-6
+
+# Overall magnification of 1 through nested references is accepted
+LayoutPool.clear()
+cell = make_cell("UNIT")
+mid = sm.make_sref(0,0,"UNIT",cell,mag=2)
+LayoutPool["MID"] = mid
+top = sm.make_sref(0,0,"MID",mid,mag=0.5)
+top.poly_resize(0.1,1,hierarchical=True)
+assert abs(total_area(LayoutPool["UNIT"],1)-3.2*1.2)<1e-6
+
+# Magnified cells are rejected, nothing is modified
+for mags in [(2,),(1,3)]:
+    LayoutPool.clear()
+    cell = make_cell("UNIT")
+    top = sm.GeomGroup()
+    for i,m in enumerate(mags):
+        top += sm.make_sref(10*i,0,"UNIT",cell,mag=m)
+    top += sm.make_rect(20,20,4,4,layer=1)
+    try:
+        top.poly_resize(0.2,1,hierarchical=True)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("poly_resize accepted magnification "+str(mags))
+    assert len(cell.group)==2 and abs(total_area(cell,1)-4)<1e-9
+    assert abs(total_area(top,1)-16)<1e-9
+    # The flat operation and the scale invariant ones are still allowed
+    top.poly_resize(0.2,1)
+    top.boolean_union(1,hierarchical=True)
+    assert len(cell.group)==1 and abs(total_area(cell,1)-3)<1e-9
+
+# Packed cells are checked as well
+LayoutPool.clear()
+cell = make_cell("UNIT")
+cell.pack()
+top = sm.make_sref(0,0,"UNIT",cell,mag=2)
+try:
+    top.poly_resize(0.2,1,hierarchical=True)
+except ValueError:
+    pass
+else:
+    raise AssertionError("poly_resize accepted a magnified packed cell")
+
+# Cells are shared through the LayoutPool: other references see the change
+LayoutPool.clear()
+cell = make_cell("UNIT")
+a = sm.make_sref(0,0,"UNIT",cell)
+b = sm.make_sref(5,5,"UNIT",cell)
+a.poly_resize(0.1,1,hierarchical=True)
+assert abs(total_area(b.flatten(),1)-3.2*1.2)<1e-6
+
+# Trapezoid decomposition of the cells
+LayoutPool.clear()
+cell = make_cell("UNIT")
+top = sm.make_sref(0,0,"UNIT",cell,mag=3)
+top.trapezoids(1,hierarchical=True)
+assert abs(total_area(top.flatten(),1)-9*3)<1e-6
+
+# Trapezoids must keep vertical parallel sides once placed: rotations other
+# than multiples of 180 degrees are rejected, nothing is modified
+def vertical_sides(g):
+    for p in g.select_layer(1).group:
+        x = p.int_data()[0::2]
+        if(np.count_nonzero(np.diff(np.append(x,x[0]))==0)<2):
+            return False
+    return True
+
+def make_l(name):
+    cell = sm.make_rect(0,0,4,1,layer=1,numkey=1)+sm.make_rect(0,0,1,3,layer=1,numkey=1)
+    cell.boolean_union(1)
+    LayoutPool[name] = cell
+    return cell
+
+for angle,mirror in [(90,False),(270,True),(45,False)]:
+    LayoutPool.clear()
+    cell = make_l("L")
+    top = sm.make_sref(0,0,"L",cell,angle=angle,mirror=mirror)
+    try:
+        top.trapezoids(1,hierarchical=True)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("trapezoids accepted rotation "+str(angle))
+    assert len(cell.group)==1
+    flat = top.flatten()
+    flat.trapezoids(1)
+    assert vertical_sides(flat)
+
+# Overall rotations multiple of 180 degrees are accepted, a mirrored parent
+# reverses the rotation of its references
+for chain in [[(180,False)],[(90,False),(90,False)],[(90,True),(90,False)],[(45,False),(45,True)]]:
+    LayoutPool.clear()
+    cell = make_l("L")
+    g = cell
+    name = "L"
+    for i,(angle,mirror) in enumerate(chain):
+        g = sm.make_sref(5,3,name,g,angle=angle,mirror=mirror)
+        name = "P%i"%i
+        LayoutPool[name] = g
+    g.trapezoids(1,hierarchical=True)
+    assert len(cell.group)==2
+    flat = g.flatten()
+    assert vertical_sides(flat)
+    assert abs(total_area(flat,1)-6)<1e-6
+LayoutPool.clear()
+print("Hierarchical boolean checks passed")
@@ -0,0 +1,50 @@
+# Checks of GeomGroup.extract_hierarchy: repeated polygons are moved to new 
+# cells, the flattened geometry must stay the same.
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+from samplemaker import LayoutPool
+
+def poly_set(geom):
+    return sorted([(p.layer,)+p.canonical_form() for p in geom.group if type(p)==smsh.Poly])
+
+LayoutPool.clear()
+geom = sm.GeomGroup()
+rng = np.random.default_rng(2)
+# A pair of polygons repeated together on a lattice and at random places
+for i in range(6):
+    for j in range(2):
+        geom+=sm.make_rect(i*10,j*10,2,1)+sm.make_circle(i*10+3,j*10,0.5,to_poly=True,vertices=8)
+for x,y in rng.integers(100,1000,(5,2)):
+    geom+=sm.make_rect(x,y,2,1)+sm.make_circle(x+3,y,0.5,to_poly=True,vertices=8)
+# A polygon repeated alone, on another layer
+for i in range(4):
+    geom+=sm.make_poly([0,1,0.5],[0,0,1],layer=3).translate(50*i,-30)
+# Unique polygons
+geom+=sm.make_rect(-50,-50,7,3)+sm.make_rect(-50,-50,7,3,layer=4)
+
+before = poly_set(geom)
+nref = geom.extract_hierarchy(4)
+assert nref==2*17+4
+refs = [g for g in geom.group if type(g)==smsh.SRef or type(g)==smsh.ARef]
+assert len(refs)!=0 and len([g for g in refs if type(g)==smsh.ARef])!=0
+assert len([g for g in geom.group if type(g)==smsh.Poly])==2
+# New cells are in the layout pool
+for r in refs:
+    assert LayoutPool[r.cellname] is r.group
+assert len(set([r.cellname for r in refs]))==2
+assert poly_set(geom.flatten())==before
+
+# Identical content in another group shares the cells
+geom2 = sm.GeomGroup()
+for i in range(4):
+    geom2+=sm.make_poly([0,1,0.5],[0,0,1],layer=3).translate(0,20*i)
+geom2.extract_hierarchy(4)
+assert geom2.group[0].cellname in [r.cellname for r in refs]
+
+# Nothing repeated enough
+geom3 = sm.make_rect(0,0,1,1)+sm.make_rect(5,0,1,1)
+assert geom3.extract_hierarchy(4)==0 and len(geom3.group)==2
+
+print("Hierarchy checks passed")
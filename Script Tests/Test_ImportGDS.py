@@ -0,0 +1,60 @@
+# Checks of Mask.importGDS: importing with a process pool must give the same
+# layout as the serial import, and exporting the imported layout must give
+# the same file.
+
+import os
+import tempfile
+import numpy as np
+import samplemaker.layout as smlay
+import samplemaker.makers as sm
+from samplemaker import LayoutPool
+from samplemaker.gdsreader import GDSReader
+
+if __name__ == "__main__": # needed for the process pool on Windows
+    os.chdir(tempfile.mkdtemp())
+    
+    mask = smlay.Mask("test_import")
+    top = sm.GeomGroup()
+    for i in range(12):
+        cell = sm.GeomGroup()
+        for j in range(50*(i+1)):
+            cell+=sm.make_rect(j*2,0,1,1+i%3,layer=1+j%3)
+        cell+=sm.make_path([0,5],[0,i],0.1)+sm.make_text(0,-5,"C%i"%i,1,0.1)
+        if(i>0):
+            cell+=sm.make_sref(0,20,"C%i"%(i-1),mask.getCell("C%i"%(i-1)),angle=90)
+        mask.addCell("C%i"%i,cell)
+        top+=sm.make_sref(0,100*i,"C%i"%i,cell)
+    top+=sm.make_aref(5000,0,"C3",mask.getCell("C3"),3,2,300,0,0,300)
+    mask.addToMainCell(top)
+    mask.exportGDS()
+    
+    def import_pool(processes):
+        mask = smlay.Mask("test_reimport_%i"%processes)
+        mask.importGDS("test_import.gds",processes)
+        pool = dict(LayoutPool)
+        mask.exportGDS()
+        return mask,pool
+    
+    mask1,pool1 = import_pool(1)
+    mask2,pool2 = import_pool(2)
+    assert mask1.mainsymbol=="CELL00" and mask2.mainsymbol=="CELL00"
+    assert sorted(pool1.keys())==sorted(pool2.keys())
+    for cname in pool1:
+        assert len(pool1[cname].group)==len(pool2[cname].group)
+        assert np.isclose(pool1[cname].get_area(),pool2[cname].get_area())
+    # References are linked to the imported cells
+    assert pool2["C5"].group[-1].group is pool2["C4"]
+    assert np.isclose(pool2["CELL00"].bounding_box().width,
+                      pool1["CELL00"].bounding_box().width)
+    
+    # Same cells written again
+    ref = GDSReader()
+    ref.quick_read("test_import.gds")
+    for name in ["test_reimport_1.gds","test_reimport_2.gds"]:
+        gdsr = GDSReader()
+        gdsr.quick_read(name)
+        assert sorted(gdsr.cell_names())==sorted(ref.cell_names())
+        for cname in ref.cell_names():
+            assert bytes(gdsr.get_cell_data(cname))[28:]==bytes(ref.get_cell_data(cname))[28:]
+    
+    print("Import checks passed")
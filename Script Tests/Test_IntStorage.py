@@ -0,0 +1,98 @@
+# Checks of the integer polygon storage (set_int_storage): cached canonical
+# forms and bounding boxes with int storage, and the storage of the polygons
+# decoded by GDSReader worker processes.
+
+import os
+import struct
+import tempfile
+import multiprocessing
+import numpy as np
+import samplemaker.layout as smlay
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+import samplemaker.gdsreader as smgr
+from samplemaker.gdsreader import GDSReader
+
+def rec(rtype, dtype, payload=b""):
+    return struct.pack(">HBB",4+len(payload),rtype,dtype)+payload
+
+if __name__ == "__main__":
+    # Workers do not inherit the storage setting of this process
+    multiprocessing.set_start_method("spawn")
+    os.chdir(tempfile.mkdtemp())
+
+    # The canonical form is cached for both storages
+    for use_int in [False,True]:
+        p = sm.make_poly([0,2,2,0],[0,0,1,1]).group[0]
+        if(use_int):
+            p.set_int_data(p.int_data())
+        cf = p.canonical_form()
+        assert p.canonical_form() is cf
+        p.translate(1,0)
+        cf2 = p.canonical_form()
+        assert cf2 is not cf and cf2[0]==(1000,0)
+        assert p.canonical_form() is cf2
+        p.set_int_data(p.int_data())
+        assert p.canonical_form() is not cf2 and p.canonical_form()==cf2
+
+    # Bounding boxes of int, float and mixed groups agree
+    g = sm.make_rect(-3.5,1,2,2)+sm.make_circle(10,-4,1.25,to_poly=True)
+    g += sm.make_path([0,4],[20,21],0.5)
+    gi = g.copy()
+    gi.set_int_storage(True)
+    gm = g.copy()
+    gm.group[1].set_int_data(gm.group[1].int_data())
+    bb = g.bounding_box()
+    for h in [gi,gm]:
+        hb = h.bounding_box()
+        assert (hb.llx,hb.lly,hb.urx(),hb.ury())==(bb.llx,bb.lly,bb.urx(),bb.ury())
+    pa = smsh.PolyArray.from_polys([p for p in gi.group if type(p)==smsh.Poly],1)
+    assert pa.is_int_storage()
+    pb = smsh.PolyArray.from_polys([p for p in gm.group if type(p)==smsh.Poly],1)
+    assert not pb.is_int_storage()
+    assert np.array_equal(pa.int_data(),pb.int_data())
+
+    # GDS file with many cells, read by a process pool
+    mask = smlay.Mask("test_storage")
+    top = sm.GeomGroup()
+    for i in range(8):
+        cell = sm.make_rect(0,0,1+i,1)+sm.make_circle(3,0,0.5,to_poly=True)
+        mask.addCell("C%i"%i,cell)
+        top += sm.make_sref(0,10*i,"C%i"%i,cell)
+    mask.addToMainCell(top)
+    mask.exportGDS()
+    names = ["C%i"%i for i in range(8)]
+    for use_int in [True,False]:
+        smsh.set_int_storage(use_int)
+        gdsr = GDSReader()
+        gdsr.open_library("test_storage.gds")
+        for packed in [False,True]:
+            cells = gdsr.get_cells(names,processes=2,packed=packed)
+            for cname in names:
+                polys = [g for g in cells[cname].group if type(g)==smsh.Poly or type(g)==smsh.PolyArray]
+                assert len(polys)!=0
+                assert all(p.is_int_storage()==use_int for p in polys), (use_int,packed)
+                single = gdsr.get_cell(cname,packed)
+                assert [p.int_data().tolist() for p in single.group if type(p) in (smsh.Poly,smsh.PolyArray)]==\
+                       [p.int_data().tolist() for p in polys]
+        gdsr.close_library()
+
+    # The setting is passed explicitly to the workers: boundaries decoded
+    # one by one (here without LAYER record) follow it as well
+    path = os.path.abspath("odd.gds")
+    data = rec(5,2,bytes(24))+rec(6,6,b"ODD!")
+    data += rec(8,0)+rec(16,3,struct.pack(">10i",0,0,1000,0,1000,1000,0,1000,0,0))+rec(17,0)
+    data += rec(7,0)
+    with open(path,"wb") as f:
+        f.write(data)
+    for use_int in [True,False]:
+        smsh.set_int_storage(not use_int)
+        cells = smgr._decode_cells(path,{"ODD!":(0,len(data))},use_int)
+        decoded = cells[0][1]
+        p = decoded[4][0][1].group[0]
+        assert p.is_int_storage()==use_int
+        assert p.int_data().tolist()==[0,0,1000,0,1000,1000,0,1000,0,0]
+        gg = smgr._assemble_cell(decoded,False,use_int)
+        assert gg.group[0].is_int_storage()==use_int
+    smsh.set_int_storage(False)
+    print("Int storage checks passed")
@@ -0,0 +1,83 @@
+# Checks of LayerAlgebra: chained operations between layers must give the
+# same result as the GeomGroup boolean operations, operands are not changed
+# and invalid apply requests leave the geometry untouched.
+
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+def total_area(g, layer):
+    return sum(p.area() for p in g.select_layer(layer).group)
+
+geom = sm.make_rect(0,0,10,10,layer=1)
+geom += sm.make_rect(5,5,10,10,layer=2)
+geom += sm.make_rect(-5,-5,4,4,layer=4)
+geom += sm.make_circle(0,0,3,layer=6,to_poly=True)
+
+la = smsh.LayerAlgebra(geom)
+la[3] = (la[1] | la[2]) - la[4].resize(0.5)
+la[5] = la[1] & la[2]
+la[7] = la[1] ^ la[2]
+la[8] = la[1] - la[1]
+# Re-using a layer many times as owned operand does not modify it
+la[9] = (la[6] | la[1]) & (la[6] | la[2])
+la[10] = la[6].resize(1) | la[6].resize(1)
+
+# Unassigned layers are rejected before anything is written
+for bad in [[3,11],[12]]:
+    try:
+        la.apply(bad)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("apply accepted "+str(bad))
+    assert len(geom.select_layer(3).group)==0
+
+# Results written on request only
+ref = geom.copy()
+la.apply([5,5])
+assert len(geom.select_layer(3).group)==0
+assert abs(total_area(geom,5)-25)<1e-6
+try:
+    la.apply([5]) # already written
+except ValueError:
+    pass
+else:
+    raise AssertionError("apply wrote a layer twice")
+la.apply()
+
+u = (ref.select_layer(1)+ref.select_layer(2)).copy()
+u.set_layer(3)
+u.boolean_union(3)
+m = ref.select_layer(4).copy()
+m.poly_resize(0.5,4)
+u.boolean_difference(m,3,4)
+assert abs(total_area(geom,3)-total_area(u,3))<1e-6
+assert abs(total_area(geom,7)-150)<1e-6
+assert total_area(geom,8)==0
+# Rectangles are centered: the circle overlaps layers 1 and 2 on one quadrant
+assert abs(total_area(geom,9)-0.75*total_area(ref,6)-25)<1e-2
+big = ref.select_layer(6).copy()
+big.poly_resize(1,6)
+assert abs(total_area(geom,10)-total_area(big,6))<1e-6
+# Source layers are unchanged
+for layer in [1,2,4,6]:
+    assert abs(total_area(geom,layer)-total_area(ref,layer))<1e-9
+
+# evaluate does not write to the geometry
+g = la.evaluate(la[1] | la[4],20)
+assert abs(total_area(g,20)-112)<1e-6
+assert len(geom.select_layer(20).group)==0
+# Builds of boopy without PolyGroup.copy (nor bulk transfer) are supported
+class OldPolyGroup:
+    def __init__(self, pg):
+        self.pg = pg
+    def getPolyCount(self):
+        return self.pg.getPolyCount()
+    def getPoly(self, n):
+        return self.pg.getPoly(n)
+old = la.get_boopy(1)
+pg = smsh._polygroup_copy(OldPolyGroup(old))
+assert pg is not old and pg.area()==old.area()
+pg.clear()
+assert old.area()!=0
+print("LayerAlgebra checks passed")
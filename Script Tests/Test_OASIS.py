@@ -0,0 +1,315 @@
+# Checks of the OASIS export against the GDS export of the same layout.
+# The OASIS file is decoded by the small reader below (only the records and
+# encodings written by OASISWriter are supported), flattened and compared
+# with the GDS file read back by samplemaker. The geometry is also compared
+# with gdstk when it is installed (not a dependency of samplemaker).
+
+import os
+import math
+import struct
+import tempfile
+import numpy as np
+import samplemaker.layout as smlay
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+class OASISDecoder:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+        self.seen = set() # decoded records, encodings and reused modal variables
+
+    def uint(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            b = self.data[self.pos]
+            self.pos+=1
+            value |= (b & 127)<<shift
+            shift+=7
+            if(b<128):
+                return value
+
+    def sint(self) -> int:
+        value = self.uint()
+        return -(value>>1) if value & 1 else value>>1
+
+    def real(self) -> float:
+        rtype = self.uint()
+        if(rtype==0 or rtype==1):
+            return (-1)**rtype*self.uint()
+        if(rtype==7):
+            self.pos+=8
+            return struct.unpack("<d",self.data[self.pos-8:self.pos])[0]
+        raise ValueError("Unsupported real type %i" % rtype)
+
+    def string(self) -> str:
+        n = self.uint()
+        self.pos+=n
+        return self.data[self.pos-n:self.pos].decode()
+
+    def gdelta(self) -> tuple:
+        # Only the second form (general displacement) is written
+        value = self.uint()
+        if(value & 1==0):
+            raise ValueError("Unsupported g-delta form")
+        dx = -(value>>2) if value & 2 else value>>2
+        return dx,self.sint()
+
+    def point_list(self) -> list:
+        ltype = self.uint()
+        self.seen.add(("point list",ltype))
+        n = self.uint()
+        pts = [(0,0)]
+        for i in range(n):
+            if(ltype==2):
+                value = self.uint()
+                mag = value>>2
+                dx,dy = [(mag,0),(0,mag),(-mag,0),(0,-mag)][value & 3]
+            elif(ltype==4):
+                dx,dy = self.gdelta()
+            else:
+                raise ValueError("Unsupported point list type %i" % ltype)
+            pts.append((pts[-1][0]+dx,pts[-1][1]+dy))
+        return pts
+
+    def repetition(self) -> list:
+        # Returns the list of displacements of the repetition
+        rtype = self.uint()
+        self.seen.add(("repetition",rtype))
+        if(rtype==1):
+            nx,ny,sx,sy = [self.uint() for i in range(4)]
+            return [(i*sx,j*sy) for i in range(nx+2) for j in range(ny+2)]
+        if(rtype==2):
+            n,s = self.uint(),self.uint()
+            return [(i*s,0) for i in range(n+2)]
+        if(rtype==3):
+            n,s = self.uint(),self.uint()
+            return [(0,i*s) for i in range(n+2)]
+        if(rtype==8):
+            n,m = self.uint(),self.uint()
+            a,b = self.gdelta(),self.gdelta()
+            return [(i*a[0]+j*b[0],i*a[1]+j*b[1]) for i in range(n+2) for j in range(m+2)]
+        if(rtype==9):
+            n = self.uint()
+            a = self.gdelta()
+            return [(i*a[0],i*a[1]) for i in range(n+2)]
+        if(rtype==10):
+            out = [(0,0)]
+            for i in range(self.uint()+1):
+                dx,dy = self.gdelta()
+                out.append((out[-1][0]+dx,out[-1][1]+dy))
+            return out
+        raise ValueError("Unsupported repetition type %i" % rtype)
+
+    def read(self) -> dict:
+        # Returns the cells (name -> list of elements) in file order
+        assert self.data[:13]==b"%SEMI-OASIS\r\n"
+        self.pos = 13
+        names = []
+        cells = dict()
+        elements = None
+        while True:
+            rtype = self.uint()
+            if(rtype==1):
+                assert self.string()=="1.0"
+                assert self.real()==1000
+                assert self.uint()==0
+                assert [self.uint() for i in range(12)]==[0]*12
+                continue
+            if(rtype==2):
+                self.string()
+                assert self.uint()==0
+                assert self.pos==len(self.data)
+                return cells
+            if(rtype==3):
+                names.append(self.string())
+                continue
+            if(rtype==13):
+                elements = cells.setdefault(names[self.uint()],[])
+                modal = dict()
+                continue
+            self.seen.add(("record",rtype))
+            info = self.data[self.pos]
+            self.pos+=1
+            def field(bit,name,read):
+                # Modal variables must be defined when a field is omitted
+                if(info & bit):
+                    modal[name] = read()
+                else:
+                    self.seen.add(("modal",name))
+                return modal[name]
+            if(rtype==17 or rtype==18):
+                if(info & 0x80):
+                    modal["cell"] = names[self.uint()] if info & 0x40 else self.string()
+                else:
+                    self.seen.add(("modal","cell"))
+                cell = modal["cell"]
+                if(rtype==17):
+                    mag = 1
+                    angle = 90*((info>>1) & 3)
+                else:
+                    mag = self.real() if info & 0x04 else 1
+                    angle = self.real() if info & 0x02 else 0
+                x = field(0x20,"placement-x",self.sint)
+                y = field(0x10,"placement-y",self.sint)
+                rep = self.repetition() if info & 0x08 else [(0,0)]
+                for dx,dy in rep:
+                    elements.append(("ref",cell,x+dx,y+dy,mag,angle,bool(info & 1)))
+                continue
+            if(rtype==19):
+                text = field(0x40,"text",self.string)
+                layer = field(0x01,"textlayer",self.uint)
+                field(0x02,"texttype",self.uint)
+                x = field(0x10,"text-x",self.sint)
+                y = field(0x08,"text-y",self.sint)
+                assert info & 0x04==0
+                elements.append(("text",layer,text,x,y))
+                continue
+            layer = field(0x01,"layer",self.uint)
+            assert field(0x02,"datatype",self.uint)==0
+            if(rtype==20):
+                w = field(0x40,"width",self.uint)
+                if(info & 0x80):
+                    assert info & 0x20==0
+                    modal["height"] = w
+                h = field(0x20,"height",self.uint)
+                pts = [(0,0),(w,0),(w,h),(0,h)]
+            elif(rtype==21):
+                pts = field(0x20,"polygon",self.point_list)
+            elif(rtype==22):
+                hw = field(0x40,"halfwidth",self.uint)
+                assert field(0x80,"extension",self.uint)==10
+                pts = field(0x20,"path",self.point_list)
+            else:
+                raise ValueError("Unsupported record type %i" % rtype)
+            x = field(0x10,"geometry-x",self.sint)
+            y = field(0x08,"geometry-y",self.sint)
+            rep = self.repetition() if info & 0x04 else [(0,0)]
+            for dx,dy in rep:
+                p = [(px+x+dx,py+y+dy) for px,py in pts]
+                if(rtype==22):
+                    elements.append(("path",layer,tuple(p),hw))
+                else:
+                    elements.append(("poly",layer,p))
+
+def canonical(layer: int, pts) -> tuple:
+    # Polygon starting from its smallest vertex, orientation with the smallest next vertex
+    pts = [tuple(p) for p in pts]
+    if(len(pts)>1 and pts[0]==pts[-1]):
+        pts = pts[:-1]
+    k = pts.index(min(pts))
+    pts = pts[k:]+pts[:k]
+    if(pts[-1]<pts[1]):
+        pts = pts[:1]+pts[:0:-1]
+    return (layer,tuple(pts))
+
+def flatten_oasis(cells: dict, name: str, M = None) -> dict:
+    # Polygons, paths and texts of a cell, references are transformed as in GDS:
+    # mirror along x, magnification, rotation and translation
+    if(M is None):
+        M = np.array([[1.,0.,0.],[0.,1.,0.]])
+    out = {"poly":[],"path":[],"text":[]}
+    def transform(pts):
+        p = np.array(pts,dtype=np.float64)
+        return np.round(p@M[:,:2].T+M[:,2]).astype(np.int64)
+    for e in cells[name]:
+        if(e[0]=="ref"):
+            cell,x,y,mag,angle,mirror = e[1:]
+            c = math.cos(math.radians(angle))
+            s = math.sin(math.radians(angle))
+            f = -1 if mirror else 1
+            T = np.array([[mag*c,-f*mag*s,x],[mag*s,f*mag*c,y]])
+            T = np.hstack([M[:,:2]@T[:,:2],(M[:,:2]@T[:,2]+M[:,2])[:,None]])
+            for key,items in flatten_oasis(cells,cell,T).items():
+                out[key]+=items
+        elif(e[0]=="poly"):
+            out["poly"].append(canonical(e[1],transform(e[2])))
+        elif(e[0]=="path"):
+            out["path"].append((e[1],tuple(map(tuple,transform(e[2]))),e[3]))
+        else:
+            x,y = transform([e[3:5]])[0]
+            out["text"].append((e[1],e[2],x,y))
+    return out
+
+def flatten_gds(group) -> dict:
+    out = {"poly":[],"path":[],"text":[]}
+    for geom in group.flatten().group:
+        if(type(geom)==smsh.Poly):
+            pts = np.round(np.array(geom.data,dtype=np.float64).reshape(-1,2)*1000).astype(np.int64)
+            out["poly"].append(canonical(geom.layer,pts))
+        elif(type(geom)==smsh.Path):
+            pts = np.round(np.array([geom.xpts,geom.ypts],dtype=np.float64).T*1000).astype(np.int64)
+            out["path"].append((geom.layer,tuple(map(tuple,pts)),int(round(geom.width*500))))
+        elif(type(geom)==smsh.Text):
+            out["text"].append((geom.layer,geom.text,int(round(geom.x0*1000)),int(round(geom.y0*1000))))
+    return out
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+
+    mask = smlay.Mask("test_oasis")
+    cell = sm.make_rect(0,0,2,1)+sm.make_circle(3,0,0.5)+sm.make_poly([0,1,0.5],[0,0,1],layer=2)
+    cell+= sm.make_ellipse(0,5,2,1,30)
+    cell+= sm.make_rect(-3,-3,1,1,numkey=1)
+    top = sm.GeomGroup()
+    for i in range(10):
+        for j in range(6):
+            top+=sm.make_sref(i*10,j*10,"CELL",cell)
+    top+=sm.make_sref(-20,0,"CELL",cell,angle=90,mag=2)
+    top+=sm.make_sref(-40,0,"CELL",cell,angle=30,mag=0.5,mirror=1)
+    top+=sm.make_sref(-60,0,"CELL",cell,angle=270,mirror=1)
+    top+=sm.make_aref(0,-100,"CELL",cell,3,4,10,2,-1,12)
+    top+=sm.make_rect(250,100,1,3,layer=4,numkey=1)
+    top+=sm.make_poly([0,2,2,1,1,0],[0,0,1,1,3,3],layer=5)
+    for i in range(30):
+        top+=sm.make_circle(200+i*3.3,0,1.2,layer=3)
+        top+=sm.make_rect(200+i*3,10+i,1,2,layer=4)
+        top+=sm.make_rect(200,30+i*2.5,0.5,0.5,layer=4)
+    for x,y in [(0,0),(1.5,-2),(7,0.25),(3,8)]:
+        top+=sm.make_poly([0,1,2,0.5],[0,-1,0.5,2],layer=5).translate(x-300,y)
+    top+=sm.make_path([0,10,10,25],[-50,-50,-40,-45],0.4,layer=6)
+    top+=sm.make_text(0,-20,"OASIS",2,0.2)
+    top+=sm.make_text(5,-25,"OASIS",2,0.2,layer=7)
+    mask.addCell("CELL",cell)
+    mask.addToMainCell(top)
+    mask.exportGDS()
+    mask.exportOASIS()
+    assert os.path.getsize("test_oasis.oas")<os.path.getsize("test_oasis.gds")/3
+
+    with open("test_oasis.oas","rb") as f:
+        decoder = OASISDecoder(f.read())
+    cells = decoder.read()
+    # All the encodings written by OASISWriter are used in this layout
+    assert decoder.seen>=set([("record",r) for r in (17,18,19,20,21,22)]+
+                             [("repetition",r) for r in (1,2,3,8,9,10)]+
+                             [("point list",t) for t in (2,4)]+
+                             [("modal",m) for m in ("layer","datatype","width","height","geometry-y","cell")])
+    tops = set(cells.keys())-set(e[1] for c in cells.values() for e in c if e[0]=="ref")
+    assert len(tops)==1
+    po = flatten_oasis(cells,tops.pop())
+    gds = smlay.Mask("test_gds")
+    gds.importGDS("test_oasis.gds")
+    pg = flatten_gds(smlay.LayoutPool[gds.mainsymbol])
+    assert len(po["poly"])==len(pg["poly"])==75*5+90+6
+    assert sorted(po["poly"])==sorted(pg["poly"])
+    assert po["path"]==pg["path"]
+    assert sorted(po["text"])==sorted(pg["text"])
+
+    try:
+        import gdstk
+    except ImportError:
+        gdstk = None
+    if(gdstk is not None):
+        # Paths are not compared, their ends differ (see samplemaker.oasiswriter)
+        def polygons(lib):
+            top = [c for c in lib.top_level()][0]
+            return sorted(canonical(p.layer,np.round(p.points*1000).astype(np.int64))
+                          for p in top.get_polygons(include_paths=False))
+        pg = polygons(gdstk.read_gds("test_oasis.gds"))
+        po = polygons(gdstk.read_oas("test_oasis.oas"))
+        assert len(pg)==len(po)
+        assert pg==po
+        print("Geometry compared with gdstk")
+
+    print("OASIS checks passed")
@@ -0,0 +1,29 @@
+# Checks of GeomGroup.pack / unpack (PolyArray storage of polygons).
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+geom = sm.make_path([0,10],[0,0],1,layer=3)
+geom+= sm.make_rect(0,0,2,2,layer=1)
+geom+= sm.make_rect(5,0,2,2,layer=2)
+geom+= sm.make_circle(0,5,1,layer=1)
+geom+= sm.make_rect(10,0,2,2,layer=1)
+bb = geom.bounding_box()
+
+geom.pack()
+# One array per layer, placed where the first polygon of the layer was
+types = [type(g) for g in geom.group]
+assert types==[smsh.Path,smsh.PolyArray,smsh.PolyArray,smsh.Circle]
+assert [g.layer for g in geom.group]==[3,1,2,1]
+assert len(geom.group[1])==2 and len(geom.group[2])==1
+
+# Transformations act on the packed polygons
+geom.translate(1,1)
+assert np.isclose(geom.bounding_box().llx,bb.llx+1)
+
+# Unpacking gives back single polygons
+geom.unpack()
+assert len([g for g in geom.group if type(g)==smsh.Poly])==3
+
+print("Pack checks passed")
@@ -0,0 +1,75 @@
+# Checks of the parallel GDS structure encoding (GDSWriter.write_pool with 
+# several processes): same file as the serial writer, log in file order, 
+# process pool shut down also when writing fails.
+
+import io
+import os
+import struct
+import tempfile
+import contextlib
+import multiprocessing
+import samplemaker.makers as sm
+import samplemaker.gdswriter as smgw
+from samplemaker.gdswriter import GDSWriter
+
+def make_pool():
+    pool = dict()
+    for i in range(20):
+        cell = sm.GeomGroup()
+        for j in range(20*(i%5+1)):
+            cell+=sm.make_rect(j*2,i,1,1,layer=1+j%2)
+        cell+=sm.make_circle(0,0,1)+sm.make_text(0,0,"C%i"%i,1,0.1)
+        if(i>0):
+            cell+=sm.make_sref(0,10,"C%i"%(i-1),pool["C%i"%(i-1)])
+        pool["C%i"%i] = cell
+    return pool
+
+def write(filename, pool, processes, cache=None):
+    gdsw = GDSWriter()
+    gdsw.open_library(filename)
+    gdsw.timestamp = 0 # same dates in all files
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            if(cache is None):
+                gdsw.write_pool(pool,processes)
+            else:
+                gdsw.write_pool_use_cache(pool,cache[0],cache[1],processes=processes)
+    finally:
+        gdsw.close_library()
+    with open(filename,"rb") as f:
+        data = f.read()
+    log = [l.split()[-1] for l in out.getvalue().splitlines() if l.startswith("Writing")]
+    # From the first BGNSTR, without the padding at the end of the file
+    return data[data.find(b"\x00\x1c\x05\x02"):].rstrip(b"\x00"),log
+
+if __name__ == "__main__": # needed for the process pool on Windows
+    os.chdir(tempfile.mkdtemp())
+    pool = make_pool()
+    serial,log1 = write("serial.gds",pool,1)
+    parallel,log2 = write("parallel.gds",pool,3)
+    assert serial==parallel
+    assert log1==list(pool.keys()) and log2==list(pool.keys())
+    
+    # With the cache, some structures copied and the others encoded in parallel
+    from samplemaker.gdsreader import GDSReader
+    gdsr = GDSReader()
+    gdsr.quick_read("serial.gds")
+    digests = GDSWriter().cell_digests(pool)
+    for k in ["C3","C7"]:
+        gdsr.celldata.pop(k)
+    cached,log3 = write("cached.gds",pool,3,(gdsr.celldata,digests))
+    assert cached==serial and log3==list(pool.keys())
+    assert len(multiprocessing.active_children())==0
+    
+    # An error in a worker stops the writing, the pool is shut down
+    pool["C10"]+=sm.make_rect(3e6,0,1,1)
+    try:
+        write("broken.gds",pool,3)
+        assert False, "No error for out of range coordinates"
+    except struct.error:
+        pass
+    assert len(smgw._worker_pool)==0
+    assert len(multiprocessing.active_children())==0
+    
+    print("Parallel write checks passed")
@@ -0,0 +1,36 @@
+# Checks of GeomGroup.find_matching_patterns.
+
+import numpy as np
+import samplemaker.makers as sm
+
+pattern = sm.make_poly([0,2,2,1,0],[0,0,1,2,1],layer=1)
+
+geom = sm.GeomGroup()
+positions = []
+for i in range(5):
+    for j in range(4):
+        p = pattern.copy()
+        p.translate(i*10,j*10)
+        geom+=p
+        positions.append((i*10+1,j*10+1))
+# Decoys: rotated pattern, same size different shape, other layer
+p = pattern.copy(); p.rotate(0,0,90); p.translate(100,0); geom+=p
+geom+= sm.make_rect(200,0,2,2,numkey=1,layer=1)
+p = pattern.copy(); p.set_layer(2); p.translate(300,0); geom+=p
+
+res = geom.find_matching_patterns(pattern,1)
+assert len(res)==len(positions)
+assert sorted([tuple(np.round(r,6)) for r in res])==sorted(positions)
+
+# Patterns touching each other are united before the search
+touching = pattern.copy(); touching.translate(2,0)
+geom2 = pattern.copy()+touching
+assert len(geom2.find_matching_patterns(pattern,1))==0
+
+# Repeated searches use the cached index, changes are seen
+assert len(geom.find_matching_patterns(pattern,2))==1
+geom.group[-1].translate(1,0)
+assert np.allclose(geom.find_matching_patterns(pattern,2),[[302,1]])
+assert len(geom.find_matching_patterns(sm.make_rect(0,0,2,2,layer=1),1))==1
+
+print("Pattern search checks passed")
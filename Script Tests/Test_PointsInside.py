@@ -0,0 +1,42 @@
+# Checks of the vectorized point-in-polygon tests against the single point 
+# versions (Poly.point_inside, GeomGroup.in_polygons).
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+geom = sm.make_rect(0,0,4,2)+sm.make_circle(10,0,3,to_poly=True)
+geom+= sm.make_text(0,10,"AB",2,0.3,to_poly=True)
+geom+= sm.make_path([0,5],[-10,-8],0.5,to_poly=True)
+geom.group.append(smsh.Poly([20,21],[20,20],0)) # degenerate polygon
+
+rng = np.random.default_rng(1)
+xs = rng.uniform(-5,15,2000)
+ys = rng.uniform(-12,14,2000)
+# Points on grid values (edges, vertices)
+xs = np.concatenate([xs,[-2,2,0,7,13,10]])
+ys = np.concatenate([ys,[-1,1,1,0,0,3]])
+
+full = geom.points_inside(xs,ys)
+assert full.shape==xs.shape
+for x,y,r in zip(xs,ys,full):
+    assert r==geom.in_polygons(x,y),(x,y)
+
+# Single polygon
+p = geom.group[1]
+res = p.points_inside(xs,ys)
+assert all([r==p.point_inside(x,y) for x,y,r in zip(xs,ys,res)])
+
+# Packed polygons give the same result, also after a transformation
+geom.pack()
+assert np.all(geom.points_inside(xs,ys)==full)
+geom.translate(100,0)
+assert not np.any(geom.points_inside(xs,ys))
+assert np.all(geom.points_inside(xs+100,ys)==[geom.in_polygons(x+100,y) for x,y in zip(xs,ys)])
+
+# 2D arrays and groups without polygons
+X,Y = np.meshgrid(np.linspace(95,105,11),np.linspace(-1,1,3))
+assert geom.points_inside(X,Y).shape==X.shape
+assert not np.any(sm.make_circle(0,0,1).points_inside([0],[0]))
+
+print("Points inside checks passed")
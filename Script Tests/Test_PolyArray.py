@@ -0,0 +1,45 @@
+# Checks of the vectorized polygon measures of PolyArray, including
+# arrays with empty polygons.
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+square = [0,0, 1,0, 1,1, 0,1]
+tri = [2,0, 3,0, 2,1]
+
+# Two polygons
+pa = smsh.PolyArray(np.array(square+tri,dtype=float),np.array([0,4,7]),1)
+assert np.allclose(pa.areas(),[1,0.5])
+assert np.allclose(pa.perimeters(),[4,2+np.sqrt(2)])
+cx,cy = pa.centroids()
+assert np.allclose(cx,[0.5,7/3]) and np.allclose(cy,[0.5,1/3])
+
+# Same measures as the single polygons
+polys = sm.make_rect(0,0,3,2)+sm.make_circle(5,5,1,to_poly=True)
+for p in polys.group:
+    parr = smsh.PolyArray.from_polys([p],1)
+    assert np.isclose(parr.areas()[0],p.area())
+    assert np.isclose(parr.perimeters()[0],p.perimeter())
+
+# Empty polygon in the middle
+pa = smsh.PolyArray(np.array(square+tri,dtype=float),np.array([0,4,4,7]),1)
+assert np.allclose(pa.areas(),[1,0,0.5])
+assert np.allclose(pa.perimeters(),[4,0,2+np.sqrt(2)])
+
+# Empty polygon at the end
+pa = smsh.PolyArray(np.array(square,dtype=float),np.array([0,4,4]),1)
+assert np.allclose(pa.areas(),[1,0])
+assert np.allclose(pa.perimeters(),[4,0])
+assert np.allclose(pa.centroid(),(0.5,0.5))
+
+# Only empty polygons
+pa = smsh.PolyArray(np.zeros(0),np.array([0,0,0]),1)
+assert np.allclose(pa.areas(),[0,0])
+assert pa.area()==0
+
+# Polygons without area
+pa = smsh.PolyArray(np.array([0,0,2,0,4,0],dtype=float),np.array([0,3]),1)
+assert np.allclose(pa.centroid(),(2,0))
+
+print("PolyArray checks passed")
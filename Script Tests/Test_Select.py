@@ -0,0 +1,35 @@
+# Checks of GeomGroup.select with the cached property columns.
+
+import samplemaker.makers as sm
+
+geom = sm.make_rect(0,0,2,2)+sm.make_rect(4,0,2,2)+sm.make_circle(10,0,1)
+assert len(geom.select("x<3").group)==1
+assert len(geom.select("T=='Circle'").group)==1
+assert len(geom.select("(A>3.9) & (A<4.1)").group)==2
+
+# Modifying a selection modifies the original elements, the next query must see it
+sel = geom.select("x<3")
+sel.translate(10,0)
+assert len(geom.select("x<3").group)==0
+assert len(geom.select("x>9").group)==2
+
+# Packed polygons are returned as copies, modifying them does not change the group
+geom.pack()
+sel = geom.select("(x>9) & (T=='Poly')")
+assert len(sel.group)==1
+sel.translate(100,0)
+assert len(geom.select("x>9").group)==2
+assert len(geom.select("x>100").group)==0
+
+# Queries after a translation of the group
+geom.translate(0,5)
+assert len(geom.select("(y>4.9) & (y<5.1)").group)==3
+
+# Referenced cells are flattened
+cell = sm.make_rect(0,0,1,1)
+top = sm.make_sref(0,0,"CELL",cell)+sm.make_sref(5,0,"CELL",cell)
+assert len(top.select("x>2").group)==1
+cell.group[0].translate(3,0)
+assert len(top.select("x>2").group)==2
+
+print("Select checks passed")
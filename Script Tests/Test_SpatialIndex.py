@@ -0,0 +1,40 @@
+# Checks of the spatial index queries of GeomGroup, including queries after
+# the elements have been moved.
+
+import numpy as np
+import samplemaker.makers as sm
+import samplemaker.shapes as smsh
+
+geom = sm.GeomGroup()
+for i in range(10):
+    for j in range(10):
+        geom+=sm.make_rect(i*10,j*10,2,2)
+geom+=sm.make_circle(200,0,1)
+
+assert len(geom.query_point(0,0).group)==1
+assert len(geom.query_point(5,5).group)==0
+assert len(geom.query_window(-1,-1,11,11).group)==4
+assert len(geom.nearest(199,0).group)==1 and type(geom.nearest(199,0).group[0])==smsh.Circle
+
+# Move one element directly: the index must follow
+geom.group[0].translate(5,5)
+assert len(geom.query_point(0,0).group)==0
+assert len(geom.query_point(5,5).group)==1
+
+# Move the elements through a selection sharing them
+sel = geom.select("x>=85")
+sel.translate(1000,0)
+assert len(geom.query_window(85,-5,95,95).group)==0
+assert len(geom.query_window(1085,-5,1095,95).group)==10
+
+# Translating the whole group updates the index
+geom.translate(0,-100)
+assert len(geom.query_point(10,-100).group)==1
+
+# Packed polygons are indexed one by one
+geom.pack()
+res = geom.query_window(-1,-101,11,-89)
+assert sum([len(g) if type(g)==smsh.PolyArray else 1 for g in res.group])==4
+assert np.all(geom.points_inside([10,15],[-100,-100])==[True,False])
+
+print("Spatial index checks passed")
@@ -0,0 +1,78 @@
+# Checks of the streaming GDS export: the file must contain the same cells 
+# and geometry as the normal export, including cells referenced only by 
+# streamed device cells (sub-cells, nested devices, basic elements).
+
+import os
+import tempfile
+import numpy as np
+import samplemaker.layout as smlay
+import samplemaker.makers as sm
+from samplemaker.devices import Device
+from samplemaker import LayoutPool
+from samplemaker.gdsreader import GDSReader
+
+class InnerDevice(Device):
+    def initialize(self):
+        self.set_name("TEST_INNER")
+    def parameters(self):
+        self.addparameter("W", 1, "Width")
+    def geom(self):
+        return sm.make_rect(0,0,self.get_params()["W"],1)
+    def ports(self):
+        pass
+
+class OuterDevice(Device):
+    def initialize(self):
+        self.set_name("TEST_OUTER")
+    def parameters(self):
+        self.addparameter("L", 5, "Length")
+    def geom(self):
+        p = self.get_params()
+        g = sm.make_rect(0,0,p["L"],2)
+        # Sub-cell that is not a device
+        if "SUB" not in LayoutPool:
+            LayoutPool["SUB"] = sm.make_rect(0,0,0.5,0.5,layer=2)
+        g+= sm.make_sref(10,0,"SUB",LayoutPool["SUB"])
+        # Basic element of the mask
+        g+= sm.make_sref(20,0,"_CIRCLE",LayoutPool["_CIRCLE"],mag=2)
+        # Nested device
+        inner = InnerDevice.build()
+        inner.set_position(0,10)
+        g+= inner.run()
+        return g
+    def ports(self):
+        pass
+
+def build(name, streaming):
+    mask = smlay.Mask(name)
+    mask.set_streaming(streaming)
+    dev = OuterDevice.build()
+    for i in range(3):
+        dev.set_param("L",5+i)
+        dev.set_position(0,50*i)
+        mask.addToMainCell(dev.run())
+    mask.exportGDS()
+    gdsr = GDSReader()
+    gdsr.quick_read(name+".gds")
+    return gdsr
+
+os.chdir(tempfile.mkdtemp())
+flat = build("test_flat",False)
+stream = build("test_stream",True)
+names = sorted(flat.cell_names())
+assert sorted(stream.cell_names())==names
+assert "SUB" in names and "_CIRCLE" in names and "TEST_INNER_0001" in names
+
+def area(gdsr, cellname):
+    cells = dict()
+    for cname in gdsr.cell_names():
+        cells[cname] = gdsr.get_cell(cname)
+    for cell in cells.values():
+        for g in cell.group:
+            if(hasattr(g,"cellname")):
+                g.group = cells[g.cellname]
+    return cells[cellname].flatten().get_area()
+
+assert np.isclose(area(stream,"CELL00"),area(flat,"CELL00"))
+
+print("Streaming checks passed")
@@ -1,5 +1,8 @@
 #include <iostream>
 #include <vector>
+#include <cstdint>
+#include <limits>
+#include <stdexcept>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 #include <pybind11/numpy.h>
@@ -27,6 +30,56 @@ struct PolyGroup {
         ps_.push_back(poly);
         delete [] pts;
     }
+    // Bulk transfer: flat X0,Y0,X1,Y1,... buffer of all polygons and the index 
+    // of the first vertex of each polygon followed by the total vertex count
+    void addPolyArray(py::array_t<int64_t, py::array::c_style | py::array::forcecast> data,
+                      py::array_t<int64_t, py::array::c_style | py::array::forcecast> offsets) {
+        auto d = data.unchecked<1>();
+        auto o = offsets.unchecked<1>();
+        // Same checks as the conversion of the addPolyData arguments: 
+        // coordinates must fit in int, offsets must be within the buffer
+        for(py::ssize_t i = 0; i+1 < o.shape(0); i++) {
+            if(o(i) < 0 || o(i) > o(i+1) || 2*o(i+1) > d.shape(0)) {
+                throw py::value_error("addPolyArray: offsets do not match the coordinate buffer");
+            }
+        }
+        for(py::ssize_t i = 0; i < d.shape(0); i++) {
+            if(d(i) < std::numeric_limits<int>::min() || d(i) > std::numeric_limits<int>::max()) {
+                throw std::overflow_error("addPolyArray: coordinate out of the int range");
+            }
+        }
+        std::vector<Point> pts;
+        for(py::ssize_t i = 0; i+1 < o.shape(0); i++) {
+            pts.clear();
+            for(int64_t j = o(i); j < o(i+1); j++) {
+                pts.push_back(gtl::construct<Point>(static_cast<int>(d(2*j)),static_cast<int>(d(2*j+1))));
+            }
+            Polygon poly;
+            gtl::set_points(poly,pts.begin(),pts.end());
+            ps_.push_back(poly);
+        }
+    }
+    py::tuple getPolyArray(void) const {
+        size_t npts = 0;
+        for(auto p = ps_.begin(); p!=ps_.end(); p++) {
+            npts += p->size();
+        }
+        py::array_t<int64_t> data(2*npts);
+        py::array_t<int64_t> offsets(ps_.size()+1);
+        auto d = data.mutable_unchecked<1>();
+        auto o = offsets.mutable_unchecked<1>();
+        size_t k = 0;
+        o(0) = 0;
+        for(size_t i = 0; i<ps_.size(); i++) {
+            for(auto v = ps_[i].begin(); v!=ps_[i].end(); v++) {
+                d(2*k) = v->x();
+                d(2*k+1) = v->y();
+                k++;
+            }
+            o(i+1) = k;
+        }
+        return py::make_tuple(data,offsets);
+    }
     unsigned int getPolyCount(void) {return static_cast<unsigned int>(ps_.size());}
     const std::vector<int> getPoly(unsigned int n) const {
         std::vector<int> pseq;
@@ -57,6 +110,9 @@ struct PolyGroup {
     void merge(PolyGroup &pg2) {
         ps_+=pg2.ps_;
     }
+    PolyGroup copy() const {
+        return *this;
+    }
     void assign() {
         gtl::assign(ps_,ps_);
     }
@@ -79,11 +135,14 @@ PYBIND11_MODULE(boopy, m) {
     py::class_<PolyGroup>(m, "PolyGroup")
         .def(py::init<>())
         .def("addPolyData",&PolyGroup::addPolyData)
+        .def("addPolyArray",&PolyGroup::addPolyArray)
+        .def("getPolyArray",&PolyGroup::getPolyArray)
         .def("getPolyCount", &PolyGroup::getPolyCount)
         .def("getPoly", &PolyGroup::getPoly)
         .def("area", &PolyGroup::area)
         .def("clear", &PolyGroup::clear)
         .def("empty", &PolyGroup::empty)
+        .def("copy", &PolyGroup::copy)
         .def("assign", &PolyGroup::assign)
         .def("difference", &PolyGroup::difference)
         .def("intersection", &PolyGroup::intersection)
@@ -1234,7 +1234,8 @@ def registerDevicesInModule(module_name: str):
                 print("Loaded",oj._name,":",oj._description)
 
 
-def CreateDeviceLibrary(devname: str, params: dict, filename: str):
+def CreateDeviceLibrary(devname: str, params: dict, filename: str, 
+                        extract_hierarchy: bool = False):
     """
     Generates a GDS file with a re-usable GDS-format device.
     Also exports ports as text element in GDS.
@@ -1248,6 +1249,9 @@ def CreateDeviceLibrary(devname: str, params: dict, filename: str):
         The parameters to be used when saving. Modifies the default.
     filename: str
         The output library filename
+    extract_hierarchy : bool, optional
+        If True, repeated polygons of the flattened device are moved to 
+        sub-cells (see `GeomGroup.extract_hierarchy`). The default is False.
 
     Returns
     -------
@@ -1263,10 +1267,13 @@ def CreateDeviceLibrary(devname: str, params: dict, filename: str):
         geomE += make_text(val.x0,val.y0,idtxt,0,0)
         
     geomE=geomE.flatten()
-    
+    if(extract_hierarchy):
+        geomE.extract_hierarchy()
     
     gdsw = GDSWriter()
     gdsw.open_library(filename)
+    for cellname in sorted(geomE.get_sref_list(set())):
+        gdsw.write_structure(cellname, LayoutPool[cellname])
     gdsw.write_structure(devname, geomE)
     gdsw.close_library()
     
@@ -1311,6 +1318,7 @@ def ExportDeviceSchematics(filename: str = "SampleMakerLibrary.lel"):
         dev = oj.build()
         geomE = dev.run()
         geomE = geomE.flatten()
+        geomE.unpack()
         bb = geomE.bounding_box()
         scale =1
         #scale = bb.width
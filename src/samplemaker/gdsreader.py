@@ -5,6 +5,11 @@ Binary import of GDS files.
 This class does not import GDS files directly into geometries. 
 It only imports the binary streams for reuse.
 Not to be used in actual scripts, unless it is for very special purposes.
+
+Files can be loaded in memory with `GDSReader.quick_read` or memory-mapped with
+`GDSReader.open_library`. The latter scans the structure positions only as far
+as needed and reads the cells on demand, which is much faster for large 
+libraries when only a few cells are needed.
 """
 
 import math
@@ -13,11 +18,55 @@ import struct
 import time
 import array
 import os
-from copy import deepcopy
+import mmap
+from concurrent.futures import ProcessPoolExecutor
 import samplemaker.shapes as smsh
 from samplemaker.shapes import GeomGroup
 import samplemaker.makers as sm
 
+def _assemble_cell(decoded: tuple, packed: bool, int_storage: bool) -> GeomGroup:
+    # Builds the geometry of a cell from GDSReader.decode_cell
+    iend,layers,xy,offsets,elements = decoded
+    gg = GeomGroup()
+    if(packed):
+        for r,g in elements:
+            gg.group+=g.group
+        for layer in np.unique(layers):
+            sel = np.flatnonzero(layers==layer)
+            nint = offsets[sel+1]-offsets[sel]
+            ioff = np.zeros(sel.size+1,dtype=np.int64)
+            ioff[1:] = np.cumsum(nint)
+            idx = np.repeat(offsets[sel]-ioff[:-1],nint)+np.arange(ioff[-1])
+            gg.group.append(smsh._make_polyarray(xy[idx],ioff//2,int(layer),int_storage))
+        if(len([g for g in gg.group if type(g)==smsh.Poly])!=0):
+            gg.pack()
+        return gg
+    polys = []
+    for i,p in enumerate(smsh._make_polys(xy,offsets//2,0,int_storage)):
+        p.layer = int(layers[i])
+        polys.append((iend[i],p))
+    if(len(elements)==0):
+        gg.group = [p for r,p in polys]
+        return gg
+    # Merge in record order
+    order = sorted(polys+elements,key=lambda e: e[0])
+    for r,g in order:
+        if(type(g)==GeomGroup):
+            gg.group+=g.group
+        else:
+            gg.group.append(g)
+    return gg
+
+def _decode_cells(filename: str, cellindex: dict, int_storage: bool):
+    # Worker for GDSReader.get_cells, maps the file and decodes a batch of cells
+    # The index and the storage setting come from the parent process, the file 
+    # is not scanned again
+    gdsr = GDSReader()
+    gdsr.open_library(filename,cellindex)
+    cells = [(cname,gdsr.decode_cell(cname,int_storage)) for cname in cellindex]
+    gdsr.close_library()
+    return cells
+
 class GDSRecord:
     def __init__(self,size: int, rectype: int, datatype: int, bheader, data=""):
         self.size = size
@@ -42,6 +91,11 @@ class GDSReader:
         self.buf = ''
         self.ptr = 0
         self.celldata=dict() # store binary GDS celldata
+        self.cellindex=dict() # (offset,length) of each cell in the mapped file scanned so far
+        self.__mm = None
+        self.__fid = None
+        self.__scan_pos = -1 # where the scan of the mapped file resumes, -1 when complete
+        self.filename = ""
         
     def __read_rec(self,f):
         # Reads next record in file
@@ -55,12 +109,6 @@ class GDSReader:
             recdata = f.read(hlen-4)
         return GDSRecord(hlen, htpl[1],htpl[2],header,recdata)
     
-    def __read_rec_buf(self):
-        htpl = struct.unpack(">Hbb",self.buf[self.ptr:(self.ptr+4)])
-        hlen = htpl[0]
-        self.ptr+=hlen
-        return (htpl[1],self.ptr-hlen,hlen)
-    
     def __read_real8(self, data):
         sign = 1
         if(data[0]>>7): 
@@ -73,14 +121,139 @@ class GDSReader:
         
         return mantissa/math.pow(2,4*ex)/math.pow(2,56)
     
-    def get_cell(self, cellname: str):
-        if cellname not in self.celldata:
-            print("Cellname",cellname,"does not exist in GDS record")
-        
-        gg = GeomGroup()
-        
-        self.buf = self.celldata[cellname]
-        self.ptr=0
+    def __scan(self, buf, index: dict, ptr: int = 0, stop: str = None) -> int:
+        # Adds to index the (offset,length) of each structure (between BGNSTR 
+        # and ENDSTR) starting from ptr. Stops after the structure named stop
+        # and returns the position to resume the scan, -1 at the end of the library.
+        bgnstr = -1
+        cellname = ''
+        unpack = struct.Struct(">HBB").unpack_from
+        size = len(buf)
+        while ptr+4<=size:
+            (hlen,rtype,dtype) = unpack(buf,ptr)
+            if(hlen == 0): 
+                break
+            if(rtype == 5): #BGNSTR
+                bgnstr=ptr
+            if(rtype == 6): #STRNAME
+                cellname = bytes(buf[(ptr+4):(ptr+hlen)]).decode('ascii')
+                if(cellname[-1]=='\x00'):
+                    cellname=cellname[0:-1]
+            if(rtype == 7): #ENDSTR
+                index[cellname]=(bgnstr,ptr+hlen-bgnstr)
+                if(cellname==stop):
+                    return ptr+hlen
+            if(rtype == 4): #ENDLIB
+                break
+            ptr+=hlen
+        return -1
+    
+    def __index(self, cellname: str = None):
+        # Continues the scan of the mapped file until cellname is found 
+        # (until the end if None). The file is closed if the scan fails.
+        if(self.__scan_pos<0 or (cellname is not None and cellname in self.cellindex)):
+            return
+        try:
+            self.__scan_pos = self.__scan(self.__mm,self.cellindex,self.__scan_pos,cellname)
+        except:
+            self.close_library()
+            raise
+    
+    def get_cell_data(self, cellname: str) -> bytes:
+        """
+        Returns the binary GDS data of a cell (from BGNSTR to ENDSTR).
+
+        Parameters
+        ----------
+        cellname : str
+            The name of the cell.
+
+        Returns
+        -------
+        bytes
+            The binary data.
+
+        """
+        if cellname in self.celldata:
+            return self.celldata[cellname]
+        self.__index(cellname)
+        offset,length = self.cellindex[cellname]
+        return self.__mm[offset:offset+length]
+    
+    def cell_names(self) -> list:
+        """
+        Returns the names of all the cells read or mapped.
+
+        Returns
+        -------
+        list
+            List of cell names.
+
+        """
+        self.__index()
+        return list(self.celldata.keys())+[c for c in self.cellindex if c not in self.celldata]
+    
+    def __records(self, buf):
+        # Positions, lengths and types of all the records in a cell
+        unpack = struct.Struct(">H").unpack_from
+        positions = []
+        ptr = 0
+        size = len(buf)
+        while ptr+4<=size:
+            hlen = unpack(buf,ptr)[0]
+            if(hlen == 0): 
+                break
+            positions.append(ptr)
+            ptr+=hlen
+        head = np.frombuffer(buf,dtype=np.uint8)
+        pos = np.array(positions,dtype=np.int64)
+        hlen = (head[pos].astype(np.int64)<<8) | head[pos+1]
+        rtype = head[pos+2].astype(np.int64)
+        return pos,hlen,rtype
+    
+    def __boundaries(self, buf, pos, hlen, rtype):
+        # Decodes all BOUNDARY elements at once. Returns the index of the ENDEL
+        # record of each element, the layers and the XY data with offsets 
+        # (or None if the records do not follow the usual structure).
+        bnd = np.flatnonzero(rtype==8)
+        endel = np.flatnonzero(rtype==17)
+        ilay = np.flatnonzero(rtype==13)
+        ixy = np.flatnonzero(rtype==16)
+        if(bnd.size==0):
+            empty = np.zeros(0,dtype=np.int64)
+            return empty,empty,empty,np.zeros(1,dtype=np.int64)
+        if(ilay.size==0 or ixy.size==0 or endel.size==0):
+            return None
+        iend = np.searchsorted(endel,bnd)
+        jlay = np.searchsorted(ilay,bnd)
+        jxy = np.searchsorted(ixy,bnd)
+        if(np.any(iend>=endel.size) or np.any(jlay>=ilay.size) or np.any(jxy>=ixy.size)):
+            return None
+        iend = endel[iend]
+        jlay = ilay[jlay]
+        jxy = ixy[jxy]
+        if(np.any(jlay>iend) or np.any(jxy>iend)):
+            return None
+        head = np.frombuffer(buf,dtype=np.uint8)
+        layers = (head[pos[jlay]+4].astype(np.int64)<<8) | head[pos[jlay]+5]
+        # Bulk read of all XY payloads from the two possible 4-byte alignments
+        counts = (hlen[jxy]-4)//4
+        offsets = np.zeros(counts.size+1,dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        start = pos[jxy]+4
+        boff = np.repeat(start-4*offsets[:-1],counts)+4*np.arange(offsets[-1])
+        xy = np.empty(offsets[-1],dtype=np.int64)
+        aligned = (boff%4)==0
+        v0 = np.frombuffer(buf,dtype=">i4",count=len(buf)//4)
+        v2 = np.frombuffer(buf,dtype=">i4",offset=2,count=(len(buf)-2)//4)
+        xy[aligned] = v0[boff[aligned]//4]
+        xy[~aligned] = v2[(boff[~aligned]-2)//4]
+        return iend,layers,xy,offsets
+    
+    def __decode(self, buf, pos, hlen, rtype, records, int_storage: bool) -> list:
+        # Decodes the elements in a list of records, one at a time. 
+        # Returns pairs of ENDEL record index and element group.
+        elements = []
         cur_layer=0
         cur_width=0
         cur_el = 8; # BND
@@ -95,22 +268,21 @@ class GDSReader:
         cur_col = 1
         cur_row = 1
         
-        while self.ptr<len(self.buf):
-            (rtype,pos,hlen) = self.__read_rec_buf()
-            if(hlen == 0): 
-                break
-            if(rtype==8): # BOUNDARY
+        for r in records:
+            rtype_r = rtype[r]
+            data = buf[(pos[r]+4):(pos[r]+hlen[r])]
+            if(rtype_r==8): # BOUNDARY
                 cur_el = 8
-            if(rtype==9): # PATH
+            if(rtype_r==9): # PATH
                 cur_el = 9
                 cur_width=0
-            if(rtype==10): # SREF            
+            if(rtype_r==10): # SREF            
                 cur_el = 10
                 cur_sname = ""
                 cur_strans_mir = 0
                 cur_strans_mag = 1
                 cur_strans_angle = 0
-            if(rtype==11): # AREF            
+            if(rtype_r==11): # AREF            
                 cur_el = 11
                 cur_sname = ""
                 cur_col = 1
@@ -119,7 +291,7 @@ class GDSReader:
                 cur_strans_mag = 1
                 cur_strans_angle = 0                
 
-            if(rtype==12): # TEXT            
+            if(rtype_r==12): # TEXT            
                 cur_el = 12    
                 cur_txt_posu = 0
                 cur_txt_posv = 0
@@ -128,20 +300,20 @@ class GDSReader:
                 cur_strans_angle = 0
 
 
-            if(rtype==13): # LAYER
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r==13): # LAYER
                 cur_layer = struct.unpack(">H",data)[0];
-            if(rtype==15): #WIDTH
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r==15): #WIDTH
                 cur_width = float(struct.unpack(">i",data)[0])/1000;
-            if(rtype==16): # XY
-                data = self.buf[(pos+4):(pos+hlen)]
-                npts = int(len(data)/4)
-                cur_xy = np.array(struct.unpack(">%si"%npts,data))
-            if(rtype==17): # ENDEL
+            if(rtype_r==16): # XY
+                cur_xy = np.frombuffer(data,dtype=">i4").astype(int)
+            if(rtype_r==17): # ENDEL
+                gg = GeomGroup()
                 if(cur_el == 8): # Make a poly
                     p1 = smsh.Poly([0], [0], cur_layer)
-                    p1.set_int_data(cur_xy);
+                    if(int_storage):
+                        p1.set_int_data(cur_xy)
+                    else:
+                        p1.set_data(cur_xy/1000.0)
                     gg.add(p1)
                 if(cur_el == 9): # Make a path
                     xpts = np.copy(cur_xy[0::2]).astype(float)/1000
@@ -169,47 +341,156 @@ class GDSReader:
                                    cur_xy[1].astype(float)/1000,cur_string,cur_txt_posu,cur_txt_posv,
                                    cur_width*10,cur_width,cur_strans_angle,cur_layer)
                     gg.add(t1)    
+                elements.append((r,gg))
             
-            if(rtype == 18): #SNAME
-                data = self.buf[(pos+4):(pos+hlen)]
-                cur_sname = data.decode('ascii')
+            if(rtype_r == 18): #SNAME
+                cur_sname = bytes(data).decode('ascii')
                 if(cur_sname[-1]=='\x00'):
                     cur_sname=cur_sname[0:-1]
-            if(rtype == 19): # COLROW
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r == 19): # COLROW
                 colrw = struct.unpack(">2H",data);
                 cur_col = colrw[0]
                 cur_row = colrw[1]
-            if(rtype==23): # TEXT PRESENTATION
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r==23): # TEXT PRESENTATION
                 pres = struct.unpack(">H",data)[0];
                 cur_txt_posu = (pres-16)%4
                 cur_txt_posv = (pres-16)>>2
-            if(rtype == 25): #STRING
-                data = self.buf[(pos+4):(pos+hlen)]
-                cur_string = data.decode('ascii')
+            if(rtype_r == 25): #STRING
+                cur_string = bytes(data).decode('ascii')
                 if(cur_string[-1]=='\x00'):
                     cur_string=cur_string[0:-1]
 
-            if(rtype==26): # STRANS
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r==26): # STRANS
                 strans = struct.unpack(">H",data)[0];
                 cur_strans_mir=strans>>15
                 cur_strans_mag = 1
                 cur_strans_angle = 0
             
-            if(rtype==27): # MAG
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r==27): # MAG
                 real = struct.unpack("8B",data);
                 cur_strans_mag = self.__read_real8(real)
             
-            if(rtype==28): # ANGLE
-                data = self.buf[(pos+4):(pos+hlen)]
+            if(rtype_r==28): # ANGLE
                 real = struct.unpack("8B",data);
                 cur_strans_angle = self.__read_real8(real)
                 
-        return gg
+        return elements
+    
+    def get_cells(self, cellnames: list, processes: int = 1, packed: bool = False) -> dict:
+        """
+        Decodes several cells of a file opened with open_library().
+        With more than one process, cells are distributed in batches to a process
+        pool. Each worker maps the same file, so only the decoded arrays are
+        transferred between processes.
+
+        Parameters
+        ----------
+        cellnames : list
+            The names of the cells to decode.
+        processes : int, optional
+            Number of worker processes. The default is 1 (no pool).
+        packed : bool, optional
+            Store polygons in `PolyArray` elements (see get_cell()). The default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary of cell names and decoded GeomGroup.
+
+        """
+        if(processes<=1 or len(cellnames)<2 or self.__mm is None):
+            return {cname:self.get_cell(cname,packed) for cname in cellnames}
+        for cname in cellnames:
+            self.__index(cname)
+        # Balance the batches by cell size, largest cells first
+        nbatch = min(len(cellnames),4*processes)
+        batches = [[] for i in range(nbatch)]
+        load = [0]*nbatch
+        for cname in sorted(cellnames,key=lambda c: -self.cellindex[c][1]):
+            i = load.index(min(load))
+            batches[i].append(cname)
+            load[i]+=self.cellindex[cname][1]
+        # The storage setting is passed explicitly, workers may not share the 
+        # module state of this process
+        int_storage = smsh._int_storage["enabled"]
+        cells = dict()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            jobs = [pool.submit(_decode_cells,self.filename,{c:self.cellindex[c] for c in batch},
+                                int_storage) for batch in batches]
+            for job in jobs:
+                cells.update(job.result())
+        # Workers only return arrays, the geometry is built here
+        return {cname:_assemble_cell(cells[cname],packed,int_storage) for cname in cellnames}
+    
+    def get_cell(self, cellname: str, packed: bool = False):
+        """
+        Decodes the geometry of a cell. Boundaries (polygons) are decoded in a 
+        single vectorized pass, the other elements one by one.
+        References are created with an empty group, they have to be linked to
+        the referenced cells afterwards.
+
+        Parameters
+        ----------
+        cellname : str
+            The name of the cell.
+        packed : bool, optional
+            If True, polygons are stored in one `PolyArray` per layer, after all
+            other elements. The default is False.
+
+        Returns
+        -------
+        gg : samplemaker.shapes.GeomGroup
+            The cell geometry.
+
+        """
+        self.__index(cellname)
+        if cellname not in self.celldata and cellname not in self.cellindex:
+            print("Cellname",cellname,"does not exist in GDS record")
+        int_storage = smsh._int_storage["enabled"]
+        return _assemble_cell(self.decode_cell(cellname,int_storage),packed,int_storage)
+    
+    def decode_cell(self, cellname: str, int_storage: bool = None) -> tuple:
+        """
+        Decodes the records of a cell without building its geometry (see get_cell()).
+        Polygons are returned as plain arrays, which are cheap to transfer 
+        between processes.
+
+        Parameters
+        ----------
+        cellname : str
+            The name of the cell.
+        int_storage : bool, optional
+            Storage of the polygons that cannot be returned as arrays (see 
+            `samplemaker.shapes.set_int_storage`). The default is None (current setting).
+
+        Returns
+        -------
+        tuple
+            ENDEL record index, layer and data offset of each polygon, the 
+            XY data of all polygons (integer nm) and the list of other elements.
+
+        """
+        if(int_storage is None):
+            int_storage = smsh._int_storage["enabled"]
+        buf = self.get_cell_data(cellname)
+        pos,hlen,rtype = self.__records(buf)
+        bnd = self.__boundaries(buf,pos,hlen,rtype)
+        if(bnd is None):
+            # Unusual record order, decode everything one by one
+            empty = np.zeros(0,dtype=np.int64)
+            elements = self.__decode(buf,pos,hlen,rtype,range(pos.size),int_storage)
+            return empty,empty,empty,np.zeros(1,dtype=np.int64),elements
+        iend,layers,xy,offsets = bnd
         
+        # Records of all other elements
+        isbnd = np.zeros(pos.size+1,dtype=np.int64)
+        if(iend.size!=0):
+            np.add.at(isbnd,np.flatnonzero(rtype==8),1)
+            np.add.at(isbnd,iend+1,-1)
+        isbnd = np.cumsum(isbnd)[:-1]>0
+        elements = self.__decode(buf,pos,hlen,rtype,np.flatnonzero(~isbnd),int_storage)
+        return iend,layers,xy,offsets,elements
+    
     def quick_read(self, filename: str):
         """
         Performs a quick scan of the GDS file and stores
@@ -229,24 +510,66 @@ class GDSReader:
         with open(filename,'rb') as f:
             self.buf=f.read()
         
-        bgnstr = -1
-        cellname = ''
-        while self.ptr<len(self.buf):
-            (rtype,pos,hlen) = self.__read_rec_buf()
-            if(hlen == 0): 
-                break
-            if(rtype == 5): #BGNSTR
-                bgnstr=pos
-            if(rtype == 6): #STRNAME
-                data = self.buf[(pos+4):(pos+hlen)]
-                cellname = data.decode('ascii')
-                if(cellname[-1]=='\x00'):
-                    cellname=cellname[0:-1]
-                
-            if(rtype == 7): #ENDSTR
-                self.celldata[cellname]=deepcopy(self.buf[bgnstr:self.ptr])
+        index = dict()
+        self.__scan(self.buf,index)
+        for cellname,(offset,length) in index.items():
+            self.celldata[cellname]=self.buf[offset:offset+length]
             
         del self.buf
+        
+    def open_library(self, filename: str, cellindex: dict = None):
+        """
+        Maps a GDS file in memory. The position of the structures is scanned
+        on demand, only as far as the requested cell, and the cell data is only 
+        read when requested (e.g. by get_cell()). cell_names() scans the whole 
+        file. The file stays open until close_library() is called.
+
+        Parameters
+        ----------
+        filename : str
+            The gds file name.
+        cellindex : dict, optional
+            Cell positions from a previous scan of the same file (see `cellindex`).
+            The default is None (scan the file).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.close_library()
+        self.filename = filename
+        self.__fid = open(filename,'rb')
+        try:
+            if(os.fstat(self.__fid.fileno()).st_size!=0):
+                self.__mm = mmap.mmap(self.__fid.fileno(),0,access=mmap.ACCESS_READ)
+        except:
+            self.close_library()
+            raise
+        if(cellindex is None):
+            self.cellindex = dict()
+            if(self.__mm is not None):
+                self.__scan_pos = 0
+        else:
+            self.cellindex = cellindex
+        
+    def close_library(self):
+        """
+        Closes a file opened with open_library().
+
+        Returns
+        -------
+        None.
+
+        """
+        if(self.__mm is not None):
+            self.__mm.close()
+            self.__mm = None
+        if(self.__fid is not None):
+            self.__fid.close()
+            self.__fid = None
+        self.cellindex = dict()
+        self.__scan_pos = -1
             
     
             
\ No newline at end of file
@@ -11,10 +11,97 @@ import math
 import numpy as np
 import struct
 import time
+import hashlib
+import multiprocessing
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
 import samplemaker.shapes as smsh
 from samplemaker.shapes import GeomGroup
 
 
+def _real8(values):
+    # Encodes an array of floats in the GDS 8-byte real format 
+    # (sign, excess-64 base-16 exponent, 56-bit mantissa)
+    values = np.asarray(values,dtype="float64")
+    num = np.abs(values)
+    nz = num>0
+    exponent = np.zeros(values.size,dtype=np.int64)
+    exponent[nz] = np.floor(-np.log2(num[nz])/4)
+    fraction = num*np.exp2(4.0*exponent)
+    # Exact powers of 16 must be normalized to a fraction below 1
+    over = fraction>=1
+    fraction[over]/=16
+    exponent[over]-=1
+    mantissa = np.floor(fraction*np.exp2(56)).astype(np.uint64)
+    head = ((64-exponent) | np.where(values<0,128,0)).astype(np.uint64)
+    words = np.where(nz,(head<<np.uint64(56)) | mantissa,0).astype(">u8")
+    return words.tobytes()
+
+def _int32(values):
+    # Checked conversion of coordinates to 4-byte integers. Values out of 
+    # range raise the same error as struct.pack('>i',...) instead of wrapping.
+    values = np.asarray(values)
+    if(values.size!=0 and (values.min()<-2147483648 or values.max()>2147483647)):
+        raise struct.error("'i' format requires -2147483648 <= number <= 2147483647")
+    return values.astype(np.int32)
+
+def _digest_value(h, value):
+    # Feeds an element attribute to a hash in a representation that does not 
+    # depend on the Python session
+    if(type(value)==np.ndarray or type(value)==list or type(value)==tuple):
+        try:
+            h.update(np.asarray(value,dtype="float64").tobytes())
+            return
+        except (TypeError,ValueError):
+            pass
+    if(type(value)==int or type(value)==float or isinstance(value,np.number)):
+        value = float(value)
+    h.update(repr(value).encode())
+
+def _rename_structure(data: bytes, name: str, refnames: dict) -> bytes:
+    # Replaces the structure name (STRNAME) and the referenced cell names (SNAME)
+    # in the binary data of a structure
+    def string_record(text,tag):
+        L = len(text)
+        return struct.pack(">2H",L+L%2+4,tag)+text.encode()+bytes(L%2)
+    unpack = struct.Struct(">HBB").unpack_from
+    chunks = []
+    ptr = 0
+    start = 0
+    size = len(data)
+    while ptr+4<=size:
+        (hlen,rtype,dtype) = unpack(data,ptr)
+        if(hlen == 0):
+            break
+        if(rtype == 6 or (rtype == 18 and len(refnames)!=0)):
+            old = bytes(data[(ptr+4):(ptr+hlen)]).decode('ascii').rstrip('\x00')
+            if(rtype == 6):
+                new = string_record(name,0x0606)
+            else:
+                new = string_record(refnames.get(old,old),0x1206)
+            chunks+=[data[start:ptr],new]
+            start = ptr+hlen
+            if(len(refnames)==0):
+                break
+        ptr+=hlen
+    chunks.append(data[start:])
+    return b"".join(chunks)
+
+_worker_pool = dict() # pool inherited by forked workers of GDSWriter.write_pool
+
+def _encode_structures(settings: tuple, items: list) -> list:
+    # Worker for GDSWriter.write_pool, encodes a batch of structures.
+    # Items are structure names (forked workers) or (name,group) pairs
+    circleres,arcres,timestamp = settings
+    gdsw = GDSWriter(circleres,arcres)
+    gdsw.timestamp = timestamp
+    out = []
+    for item in items:
+        if(type(item)==str):
+            item = (item,_worker_pool[item])
+        out.append((item[0],gdsw.encode_structure(item[0],item[1])))
+    return out
+
 class GDSWriter:
     """
     GDS output class
@@ -43,66 +130,91 @@ class GDSWriter:
         for i in range(circleres):
             self.xc[i]=math.cos(i*2*math.pi/circleres)
             self.yc[i]=math.sin(i*2*math.pi/circleres)
-        #Init stuff goes here
+        self.timestamp = time.time() # Modification time of all structures
+        self.__chunks = []
         
         
+    def __emit(self, data: bytes):
+        # Records are collected and written in one block by __flush
+        self.__chunks.append(data)
+        
+    def __flush(self):
+        self.fid.write(b"".join(self.__chunks))
+        self.__chunks = []
+        
     def __write_string(self,text,tag):
         L=len(text)
-        self.fid.write(struct.pack(">2H",L+L%2+4,tag));
-        self.fid.write(text.encode());
+        self.__emit(struct.pack(">2H",L+L%2+4,tag));
+        self.__emit(text.encode());
         if(L%2==1):
-            self.fid.write(struct.pack('b',0))
+            self.__emit(struct.pack('b',0))
             
     def __write_real8(self,value):
-        num = value if value>=0 else -value
-        exponent = math.floor(-math.log2(num)/4)
-        mantissa = num*math.pow(2,4*exponent)*math.pow(2,56)
-        real = [0]*8
-        real[0]=(64-exponent) | (128 if value<0 else 0)
-        for i in range(6,-1,-1):
-            real[6-i+1]=math.floor(mantissa/math.pow(2,8*i))
-            mantissa-=real[6-i+1]*math.pow(2,8*i)        
-        self.fid.write(struct.pack('8B',*real))
+        self.__emit(_real8(np.array([value])))
                    
     def __write_data(self, data):
-        self.fid.write(data)
+        self.__emit(data)
+        
+    def __write_polygons(self, idata, offsets, layers):
+        # Encodes a batch of BOUNDARY elements in a single buffer. 
+        # Each polygon takes 5 words of header, the coordinates and ENDEL.
+        keep = layers>=0
+        if(not np.all(keep)):
+            npts = np.diff(offsets)
+            idx = np.repeat(keep,2*npts)
+            idata = idata[idx]
+            offsets = np.concatenate([[0],np.cumsum(npts[keep])])
+            layers = layers[keep]
+        if(len(layers)==0):
+            return
+        n = 2*np.diff(offsets)
+        start = np.concatenate([[0],np.cumsum(n+6)[:-1]])
+        words = np.empty(2*offsets[-1]+6*len(n),dtype=">u4")
+        iscoord = np.ones(words.size,dtype=bool)
+        header = [0x00040800,0x00060D02,(layers.astype(np.uint32)<<16)|6,0x0E020000,
+                  ((4*n.astype(np.uint32)+4)<<16)|0x1003]
+        for k in range(5):
+            words[start+k] = header[k]
+            iscoord[start+k] = False
+        words[start+5+n] = 0x00041100
+        iscoord[start+5+n] = False
+        words[iscoord] = _int32(idata).view(np.uint32)
+        self.__emit(words.tobytes())
         
     def __write_polygon(self,poly):
-        if(poly.layer<0): return
-        pdata = poly.int_data()
-        buf = np.array([4,0x0800,6,0x0D02,poly.layer,6,0x0E02,0,4*len(pdata)+4,0x1003]);
-        self.fid.write(struct.pack(">%sH" % buf.size,*buf))
-        self.fid.write(struct.pack(">%si" % pdata.size,*pdata))
-        self.fid.write(struct.pack(">2H",4,0x1100))
+        self.__write_polygons(poly.int_data(),np.array([0,poly.data.size//2]),np.array([poly.layer]))
+    
+    def __write_polyarray(self,parray):
+        self.__write_polygons(parray.int_data(),parray.offsets,np.full(len(parray),parray.layer))
     
     def __write_circle(self,circ):
         self.__write_polygon(smsh.Poly(circ.r*self.xc+circ.x0,circ.r*self.yc+circ.y0,circ.layer))
                 
     def __write_path(self,path):
-        buf = np.array([4,0x0900,6,0x0D02,path.layer,6,0x0E02,0,6,0x2102,1,8,0x0F03]);
-        self.fid.write(struct.pack(">%sH" % buf.size,*buf))
-        self.fid.write(struct.pack(">i",math.floor(path.width*1000)))
-        self.fid.write(struct.pack(">2H",8*len(path.xpts)+4,0x1003))
+        buf = np.array([4,0x0900,6,0x0D02,path.layer,6,0x0E02,0,6,0x2102,1,8,0x0F03],dtype=">u2");
+        self.__emit(buf.tobytes())
+        self.__emit(struct.pack(">i",math.floor(path.width*1000)))
+        self.__emit(struct.pack(">2H",8*len(path.xpts)+4,0x1003))
         data = np.transpose(np.round_((np.array([path.xpts,path.ypts])*1000)).astype(int)).reshape(-1)
-        self.fid.write(struct.pack(">%si" % data.size,*data))
-        self.fid.write(struct.pack(">2H",4,0x1100))
+        self.__emit(_int32(data).astype(">i4").tobytes())
+        self.__emit(struct.pack(">2H",4,0x1100))
         
     def __write_text(self,text):
         if(text.text.replace(" ","")==""):
             return
         buf = np.array([4,0x0C00,  6,0x0D02,text.layer,
                         6,0x1602,0,6,0x1701,text.posu+text.posv*4+16,
-                        8,0x0F03]);
-        self.fid.write(struct.pack(">%sH" % buf.size,*buf))
-        self.fid.write(struct.pack(">i",math.floor(text.width*1000)))
-        self.fid.write(struct.pack(">2H",12,0x1003))
-        self.fid.write(struct.pack(">2i",
+                        8,0x0F03],dtype=">u2");
+        self.__emit(buf.tobytes())
+        self.__emit(struct.pack(">i",math.floor(text.width*1000)))
+        self.__emit(struct.pack(">2H",12,0x1003))
+        self.__emit(struct.pack(">2i",
                                    math.floor(text.x0*1000),
                                    math.floor(text.y0*1000)))
         L=len(text.text)
-        self.fid.write(struct.pack(">2H",L+4,0x1906))
-        self.fid.write(text.text.encode())
-        self.fid.write(struct.pack(">2H",4,0x1100))
+        self.__emit(struct.pack(">2H",L+4,0x1906))
+        self.__emit(text.text.encode())
+        self.__emit(struct.pack(">2H",4,0x1100))
         
     def __write_strans(self,mag,angle,mirror):
         if(mag==1 and angle==0 and mirror==0):
@@ -114,43 +226,42 @@ class GDSWriter:
         #    strans+=4
         #if(angle!=0):
         #    strans+=2
-        buf = np.array([6,0x1A01,strans])
-        self.fid.write(struct.pack(">%sH" % buf.size,*buf))
+        self.__emit(struct.pack(">3H",6,0x1A01,strans))
         if(mag!=1):
-             self.fid.write(struct.pack(">2H",12,0x1B05))
+             self.__emit(struct.pack(">2H",12,0x1B05))
              self.__write_real8(mag)
         if(angle!=0):
-             self.fid.write(struct.pack(">2H",12,0x1C05))
+             self.__emit(struct.pack(">2H",12,0x1C05))
              self.__write_real8(angle)      
     
     def __write_sref(self,sref):
-        self.fid.write(struct.pack(">2H",4,0x0A00))
+        self.__emit(struct.pack(">2H",4,0x0A00))
         self.__write_string(sref.cellname, 0x1206)
         self.__write_strans(sref.mag,sref.angle,sref.mirror)
-        self.fid.write(struct.pack(">2H",12,0x1003))
-        self.fid.write(struct.pack(">2i",
+        self.__emit(struct.pack(">2H",12,0x1003))
+        self.__emit(struct.pack(">2i",
                                    int(round(sref.x0*1000)),
                                    int(round(sref.y0*1000))))
-        self.fid.write(struct.pack(">2H",4,0x1100))
+        self.__emit(struct.pack(">2H",4,0x1100))
         
     def __write_aref(self,aref):
-        self.fid.write(struct.pack(">2H",4,0x0B00))
+        self.__emit(struct.pack(">2H",4,0x0B00))
         self.__write_string(aref.cellname, 0x1206)
         self.__write_strans(aref.mag,aref.angle,aref.mirror)
-        self.fid.write(struct.pack(">4H",8,0x1302,
+        self.__emit(struct.pack(">4H",8,0x1302,
                                    math.floor(aref.ncols),
                                    math.floor(aref.nrows)))
-        self.fid.write(struct.pack(">2H",28,0x1003))
-        self.fid.write(struct.pack(">2i",
+        self.__emit(struct.pack(">2H",28,0x1003))
+        self.__emit(struct.pack(">2i",
                                    int(round(aref.x0*1000)),
                                    int(round(aref.y0*1000))))
-        self.fid.write(struct.pack(">2i",
-                                   math.floor((aref.x0+aref.ax*aref.ncols)*1000),
-                                   math.floor((aref.y0+aref.ay*aref.ncols)*1000)))
-        self.fid.write(struct.pack(">2i",
-                                   math.floor((aref.x0+aref.bx*aref.nrows)*1000),
-                                   math.floor((aref.y0+aref.by*aref.nrows)*1000)))
-        self.fid.write(struct.pack(">2H",4,0x1100))
+        self.__emit(struct.pack(">2i",
+                                   int(round((aref.x0+aref.ax*aref.ncols)*1000)),
+                                   int(round((aref.y0+aref.ay*aref.ncols)*1000))))
+        self.__emit(struct.pack(">2i",
+                                   int(round((aref.x0+aref.bx*aref.nrows)*1000)),
+                                   int(round((aref.y0+aref.by*aref.nrows)*1000))))
+        self.__emit(struct.pack(">2H",4,0x1100))
                        
     def __large_polygons(self,gg: "GeomGroup"):
         group = [];
@@ -163,6 +274,11 @@ class GDSWriter:
                     newgrp.trapezoids(geom.layer)
                     group+=newgrp.group;
                     continue
+            if(geomtype==smsh.PolyArray):
+                if(np.max(np.diff(geom.offsets),initial=0)>8000):
+                    newgrp = geom.to_polygon()
+                    group+=self.__large_polygons(newgrp).group
+                    continue
             group+=[geom]
         gg.group=group
         return gg
@@ -182,16 +298,18 @@ class GDSWriter:
 
         """
         self.fid = open(filename,"wb")
+        self.__chunks = []
         #Write header
-        lt=time.localtime(time.time())
-        buf = np.array([6,2,3,28,258,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec]);
-        self.fid.write(struct.pack(">%sH" % buf.size,*buf));
+        self.timestamp = time.time()
+        lt=time.localtime(self.timestamp)
+        buf = np.array([6,2,3,28,258,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec],dtype=">u2");
+        self.__emit(buf.tobytes());
         # Library name
         self.__write_string(filename,518)
         # Units
-        self.fid.write(struct.pack(">2H",20,0x0305));
-        self.__write_real8(1e-3); 
-        self.__write_real8(1e-9);
+        self.__emit(struct.pack(">2H",20,0x0305));
+        self.__emit(_real8([1e-3,1e-9]))
+        self.__flush()
         
         print("Opened " + filename)
         
@@ -214,9 +332,13 @@ class GDSWriter:
 
         """
         print("Writing structure: " + structure_name)
-        lt=time.localtime(time.time())
-        buf = np.array([28,1282,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec]);
-        self.fid.write(struct.pack(">%sH" % buf.size,*buf));
+        self.__begin_structure(structure_name)
+        
+    def __begin_structure(self, structure_name: str):
+        # BGNSTR and STRNAME records
+        lt=time.localtime(self.timestamp)
+        buf = np.array([28,1282,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec,lt.tm_year,lt.tm_mon,lt.tm_mday,lt.tm_hour,lt.tm_min,lt.tm_sec],dtype=">u2");
+        self.__emit(buf.tobytes());
         self.__write_string(structure_name,1542)
         
     def write_geomgroup(self,geom_group: GeomGroup):
@@ -237,10 +359,18 @@ class GDSWriter:
 
         """
         geom_group = self.__large_polygons(geom_group)
+        # Consecutive polygons are encoded together
+        run = []
         for geom in geom_group.group:
             geomtype = type(geom);
             if(geomtype==smsh.Poly):
-                self.__write_polygon(geom)
+                run.append(geom)
+                continue
+            if(len(run)!=0):
+                self.__write_polyrun(run)
+                run = []
+            if(geomtype==smsh.PolyArray):
+                self.__write_polyarray(geom)
                 continue
             if(geomtype==smsh.Circle):
                 self.__write_circle(geom)
@@ -269,6 +399,12 @@ class GDSWriter:
                 g = geom.to_polygon(self.arcres)
                 self.__write_polygon(g.group[0]) # produces one geometry only
                 continue
+        if(len(run)!=0):
+            self.__write_polyrun(run)
+    
+    def __write_polyrun(self, polys: list):
+        pa = smsh.PolyArray.from_polys(polys,0)
+        self.__write_polygons(pa.int_data(),pa.offsets,np.array([p.layer for p in polys]))
         
     def close_structure(self):
         """
@@ -279,7 +415,8 @@ class GDSWriter:
         None.
 
         """
-        self.fid.write(struct.pack(">2H",4,1792));
+        self.__emit(struct.pack(">2H",4,1792));
+        self.__flush()
         
     def write_structure(self,structure_name: str,geom_group: 'GeomGroup'):
         """
@@ -306,29 +443,172 @@ class GDSWriter:
         self.write_geomgroup(geom_group)
         self.close_structure()
         
-    def write_pool(self,pool: dict):
+    def encode_structure(self, structure_name: str, geom_group: 'GeomGroup') -> bytes:
+        """
+        Encodes a GeomGroup as a named structure/cell without writing it to file.
+        The data can be written later with write_data(). Nothing is printed,
+        so that structures encoded in worker processes are logged by the 
+        parent when they are written.
+
+        Parameters
+        ----------
+        structure_name : str
+            A string with a valid GDS structure/cell name.
+        geom_group : 'GeomGroup'
+            The GeomGroup to be encoded into GDS format.
+
+        Returns
+        -------
+        bytes
+            The binary GDS data, from BGNSTR to ENDSTR.
+
+        """
+        chunks = self.__chunks
+        self.__chunks = []
+        self.__begin_structure(structure_name)
+        self.write_geomgroup(geom_group)
+        self.__emit(struct.pack(">2H",4,1792));
+        data = b"".join(self.__chunks)
+        self.__chunks = chunks
+        return data
+    
+    def write_data(self, data: bytes):
+        """
+        Writes binary GDS data (e.g. from encode_structure()) to the file.
+
+        Parameters
+        ----------
+        data : bytes
+            The binary data.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__write_data(data)
+        self.__flush()
+    
+    def __encode_pool(self, pool: dict, processes: int):
+        # Yields the names and encoded structures in the order of the pool. 
+        # Structures are encoded in batches by a process pool, each batch spans 
+        # consecutive structures with a similar amount of geometry.
+        # Should be closed when not run to the end (the pool is shut down then).
+        if(processes<=1 or len(pool)<2):
+            for sname,group in pool.items():
+                yield sname,self.encode_structure(sname,group)
+            return
+        names = list(pool.keys())
+        weight = np.cumsum([len(pool[sname].group)+1 for sname in names])
+        nbatch = min(len(names),4*processes)
+        cut = np.searchsorted(weight,weight[-1]*np.arange(1,nbatch)/nbatch)
+        batches = [b for b in np.split(np.arange(len(names)),np.unique(cut)) if b.size!=0]
+        global _worker_pool
+        if("fork" in multiprocessing.get_all_start_methods()):
+            # Workers inherit the pool, only the names are sent
+            context = multiprocessing.get_context("fork")
+            _worker_pool = pool
+            batches = [[names[i] for i in b] for b in batches]
+        else:
+            context = None
+            batches = [[(names[i],pool[names[i]]) for i in b] for b in batches]
+        settings = (self.circleres,self.arcres,self.timestamp)
+        try:
+            with ProcessPoolExecutor(max_workers=processes,mp_context=context) as executor:
+                jobs = [executor.submit(_encode_structures,settings,b) for b in batches]
+                for job in jobs:
+                    for item in job.result():
+                        yield item
+        finally:
+            _worker_pool = dict()
+        
+    def write_pool(self,pool: dict, processes: int = 1):
         """
         Writes all the structures in the dictionary using key name as structure
         reference name and value as the group to be written.
+        With more than one process, structures are encoded in parallel and 
+        written in the same order as in the dictionary.
 
         Parameters
         ----------
         pool : dict
             A dictionary containing structure names as keys and GeomGroup as values.
+        processes : int, optional
+            Number of processes used to encode the structures. The default is 1.
 
         Returns
         -------
         None.
 
         """
-        for sname,group in pool.items():
-            self.write_structure(sname, group)
+        with closing(self.__encode_pool(pool,processes)) as encoded:
+            for sname,data in encoded:
+                print("Writing structure: " + sname)
+                self.write_data(data)
             
-    def write_pool_use_cache(self,pool: dict, cache: dict):
+    def cell_digests(self, pool: dict) -> dict:
+        """
+        Computes a content digest for each structure in the dictionary.
+        The digest depends on the geometry (rounded to the GDS resolution) and 
+        on the digest of the referenced structures, but not on the structure names.
+        It is stable across sessions.
+
+        Parameters
+        ----------
+        pool : dict
+            A dictionary containing structure names as keys and GeomGroup as values.
+
+        Returns
+        -------
+        dict
+            A dictionary with structure names as keys and hex digests as values.
+
+        """
+        digests = dict()
+        def digest(sname):
+            if sname in digests:
+                return digests[sname]
+            h = hashlib.sha1()
+            group = pool[sname].group
+            polys = [g for g in group if type(g)==smsh.Poly]
+            if(len(polys)!=0):
+                h.update(np.array([p.layer for p in polys],dtype=np.int64).tobytes())
+                h.update(np.array([p.data.size for p in polys],dtype=np.int64).tobytes())
+                data = np.concatenate([p.data for p in polys])
+                h.update(np.round_(data*1000).astype(np.int64).tobytes())
+            for geom in group:
+                geomtype = type(geom)
+                if(geomtype==smsh.Poly):
+                    continue
+                h.update(geomtype.__name__.encode())
+                if(geomtype==smsh.PolyArray):
+                    h.update(np.array([geom.layer],dtype=np.int64).tobytes())
+                    h.update(np.asarray(geom.offsets,dtype=np.int64).tobytes())
+                    h.update(geom.int_data().astype(np.int64).tobytes())
+                    continue
+                for key,value in sorted(vars(geom).items()):
+                    if(key=="group" or key.startswith("_")):
+                        continue
+                    h.update(key.encode())
+                    if(key=="cellname" and value in pool):
+                        h.update(digest(value).encode())
+                    else:
+                        _digest_value(h,value)
+            digests[sname] = h.hexdigest()
+            return digests[sname]
+        for sname in pool.keys():
+            digest(sname)
+        return digests
+            
+    def write_pool_use_cache(self,pool: dict, cache: dict, cache_digests: dict,
+                             digests: dict = None, processes: int = 1) -> dict:
         """
         Writes all the structures in the dictionary using key name as structure
         reference name and value as the group to be written.
-        Uses GDS cache when available
+        Uses GDS cache when available: a structure is copied from the cache 
+        when a cached structure has the same content digest (see cell_digests()),
+        even if its name is different. Structure names and references are renamed
+        in the copied data.
 
         Parameters
         ----------
@@ -336,18 +616,56 @@ class GDSWriter:
             A dictionary containing structure names as keys and GeomGroup as values.
         cache: dict
             A dictionary containing structure names as keys and binary GDS data as values.
+        cache_digests : dict
+            A dictionary containing the content digest of the cached structures.
+        digests : dict, optional
+            The content digests of the structures in the pool, computed if None.
+            The default is None.
+        processes : int, optional
+            Number of processes used to encode the structures that are not
+            cached (see write_pool()). The default is 1.
 
         Returns
         -------
-        None.
+        dict
+            The content digests of the structures in the pool.
 
         """
-        for sname,group in pool.items():
-            if sname in cache.keys():
+        if(digests is None):
+            digests = self.cell_digests(pool)
+        cached = dict() # digest to cached structure name
+        for cname,dgst in cache_digests.items():
+            if cname in cache:
+                cached[dgst] = cname
+        current = dict() # digest to structure name
+        for sname,dgst in digests.items():
+            current[dgst] = sname
+        refnames = dict() # cached name to current name
+        for cname,dgst in cache_digests.items():
+            if(dgst in current and digests.get(cname)!=dgst):
+                refnames[cname] = current[dgst]
+        
+        encoded = self.__encode_pool({sname:group for sname,group in pool.items() 
+                                      if digests[sname] not in cached},processes)
+        with closing(encoded):
+            for sname,group in pool.items():
+                cname = cached.get(digests[sname])
+                if(cname is None):
+                    sname,data = next(encoded)
+                    print("Writing structure: " + sname)
+                    self.write_data(data)
+                    continue
                 print("Writing cached",sname)
-                self.__write_data(cache[sname])
-            else:
-                self.write_structure(sname, group)
+                hasrefs = len([g for g in group.group if type(g)==smsh.SRef or type(g)==smsh.ARef])!=0
+                if(cname!=sname or (hasrefs and len(refnames)!=0)):
+                    self.__write_data(_rename_structure(cache[cname],sname,refnames if hasrefs else dict()))
+                else:
+                    self.__write_data(cache[cname])
+                self.__flush()
+            # All structures are written, let the pool shut down normally
+            for item in encoded:
+                pass
+        return digests
         
     def close_library(self):
         """
@@ -358,10 +676,10 @@ class GDSWriter:
         None.
 
         """
-        self.fid.write(struct.pack('>2H',4,1024));
+        self.__emit(struct.pack('>2H',4,1024));
+        self.__flush()
         pos = self.fid.tell()
-        buf = np.zeros(2048-pos%2048,dtype=int);
-        self.fid.write(struct.pack("%sb" % buf.size,*buf))
+        self.fid.write(bytes(2048-pos%2048))
         print('Writing to GDS complete.')
         self.fid.close()
         
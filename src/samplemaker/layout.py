@@ -31,12 +31,40 @@ The cache uses the python `pickle` package to save the current geometry to file
 when exporting to GDS. When the script starts, if the cache is turned on and the
 cache file exist, the data is loaded in memory and updated only where necessary.
 
-Additionally, if a structure is not changed and a GDS file already exists, the 
-GDS data from the previous file is loaded and copied to the output file. 
+Additionally, if a GDS file already exists, the GDS data of unchanged structures
+is copied from the previous file to the output file. Structures are matched by
+a digest of their content, stored in a sidecar file (with .gdsidx extension), so
+they are re-used even if the cell names change between runs. The sidecar also
+stores a digest of the GDS file and is ignored if the file was written otherwise
+(e.g. by an export without cache).
 
 By default, the cache is disabled as for small masks with few polygons there is
 no significant advantage in run time. Using the cache is highly recommended for large masks.
 
+### Streaming export
+For masks that do not fit in memory, the `Mask.set_streaming` method opens the 
+GDS file immediately and writes device cells as soon as they are placed in the mask
+(via `Mask.addToMainCell` or `Mask.addCell`). 
+
+    mask.set_streaming(True)
+
+The geometry of written cells is released and only an empty stub is kept, so that 
+references and bounding boxes keep working. Flattening a streamed cell returns no 
+geometry. Streaming and the cache system cannot be used together. Streamed cells
+are not discarded at export time, even if they are not referenced.
+
+### Array extraction
+Devices placed many times on a regular grid (for example in device tables) are
+written as individual cell references. The `Mask.set_arrays` method replaces them 
+with array references at export time, which are much more compact.
+
+    mask.set_arrays(True)
+
+### OASIS export
+The mask can also be written in the OASIS format with `Mask.exportOASIS`. 
+OASIS files are several times smaller than GDS files, in particular for 
+patterns repeated on a lattice such as photonic crystals.
+
 ### Electron beam lithography and write-fields
 A write-field is a square area of the design where electron-beam lithography
 tools write without moving the stage. Within this area, the patterns are usually
@@ -92,10 +120,14 @@ This is done via the `DeviceTableAnnotations` class.
 from samplemaker.makers import make_aref, make_path, make_circle, make_text
 from samplemaker.shapes import GeomGroup, Box, SRef, ARef
 from samplemaker.gdswriter import GDSWriter
+from samplemaker.oasiswriter import OASISWriter
 from samplemaker.gdsreader import GDSReader
 from samplemaker.devices import Device
 from samplemaker import LayoutPool, _DevicePool, _DeviceCountPool, _DeviceLocalParamPool, _BoundingBoxPool
 import pickle # for cacheing
+import json
+import hashlib
+import os
 from copy import deepcopy
 import math
 
@@ -572,7 +604,7 @@ class DeviceTable:
         if(self._geometries==[]):
             self.__build_geomarray()
         
-        # Get all BB (NOTE: this is slow for large devices with lots of features)
+        # Get all BB (cached in the geometries and in the referenced cells)
         bboxes = [[self._geometries[j][i].bounding_box() for i in range(self.ncol)] for j in range(self.nrow)]
         self.pos_xy = [[[0,0] for i in range(self.ncol)] for j in range(self.nrow)]
         # Place them according to the numkey point
@@ -742,6 +774,10 @@ class Mask:
         self.mainsymbol = "CELL00"
         self.writefields=[]
         self.cache=False
+        self.streaming=False
+        self.arrays=False
+        self.__array_min_count=3
+        self.__gdsw=None
         self.clear()  # A new mask clears the pool
                 
     def clear(self):
@@ -759,6 +795,7 @@ class Mask:
         _DevicePool.clear()
         _BoundingBoxPool.clear()
         self.writefields.clear()
+        self.__streamed=dict() # streamed cell name -> names of the cells it references
         self.__basic_elements()
                
     def set_cache(self, cache: bool):
@@ -767,7 +804,7 @@ class Mask:
         is stored on disk (with .cache extension) and reloaded when the mask
         is created again (for example when running the same script multiple times).
         Addditionally, the cache system re-uses the GDS bitstream from a previously
-        generated GDS file. 
+        generated GDS file, for all cells whose content digest is unchanged. 
         Any changes made to the devices or instances are automatically detected
         and updated even if the cache is on.
         
@@ -784,9 +821,92 @@ class Mask:
         None.
 
         """
+        if(cache and self.streaming):
+            print("Cache is not available in streaming mode")
+            return
         self.cache=cache
         if(cache):
             self.__importCache()
+            
+    def set_streaming(self, streaming: bool):
+        """
+        Turns on or off the streaming export. When streaming is on, the GDS file
+        is opened immediately and device cells are written as soon as they are 
+        added to the mask (see `Mask.stream_cells`). Their geometry is then 
+        released from memory. This option is useful for masks that do not fit 
+        in memory. The file is completed by `Mask.exportGDS` as usual.
+        Streaming turns off the cache system.
+
+        Parameters
+        ----------
+        streaming : bool
+            Set to True to turn streaming on.
+
+        Returns
+        -------
+        None.
+
+        """
+        if(streaming and self.cache):
+            print("Cache is not available in streaming mode, turning cache off")
+            self.cache=False
+        self.streaming=streaming
+        
+    def set_arrays(self, arrays: bool, min_count: int = 3):
+        """
+        Turns on or off the extraction of arrays at export time. When turned on,
+        cell references placed on a regular lattice in any cell are replaced 
+        by array references (see `GeomGroup.extract_arrays`) before writing.
+        Arrays reduce the GDS size and the fracturing time of lithography tools.
+
+        Parameters
+        ----------
+        arrays : bool
+            Set to True to turn array extraction on.
+        min_count : int, optional
+            Minimum number of references to form an array. The default is 3.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.arrays=arrays
+        self.__array_min_count=min_count
+        
+    def __extract_arrays(self, cell: GeomGroup):
+        if(self.arrays):
+            cell.extract_arrays(self.__array_min_count)
+        
+    def stream_cells(self):
+        """
+        Writes all device cells that have not been written yet to the GDS file
+        and releases their geometry, keeping an empty cell in the pool for 
+        referencing. Called automatically when adding geometry to the mask in 
+        streaming mode.
+
+        Returns
+        -------
+        None.
+
+        """
+        if(not self.streaming):
+            return
+        if(self.__gdsw is None):
+            self.__remove_gds_index()
+            self.__gdsw = GDSWriter()
+            self.__gdsw.open_library(self.name + ".gds")
+        for cname in list(_DevicePool.values()):
+            if(cname in LayoutPool and cname not in self.__streamed):
+                cell = LayoutPool[cname]
+                _BoundingBoxPool[cname] = cell.bounding_box()
+                self.__extract_arrays(cell)
+                self.__gdsw.write_structure(cname, cell)
+                # The references are kept, the referenced cells are still needed
+                self.__streamed[cname] = set([g.cellname for g in cell.group 
+                                              if type(g)==SRef or type(g)==ARef])
+                cell.group = []
+                cell.invalidate_cache()
 
     def __basic_elements(self):
         # Adding a circle to the layout pool
@@ -814,6 +934,7 @@ class Mask:
             LayoutPool[self.mainsymbol] = geom_group
         else:
             LayoutPool[self.mainsymbol] += geom_group
+        self.stream_cells()
         
     def addCell(self, cellname: str, geom_group: GeomGroup):
         """
@@ -832,6 +953,8 @@ class Mask:
 
         """
         LayoutPool[cellname] = geom_group
+        _BoundingBoxPool[cellname] = geom_group.bounding_box()
+        self.stream_cells()
         
     def getCell(self, cellname: str) -> GeomGroup:
         """
@@ -855,6 +978,19 @@ class Mask:
             print("Cell named", cellname,"does not exist")
             return GeomGroup()
         
+    def __gds_file_digest(self) -> str:
+        # Digest of the GDS file, to check that it matches the .gdsidx sidecar
+        h = hashlib.sha1()
+        with open(self.name + ".gds","rb") as gdsfile:
+            for chunk in iter(lambda: gdsfile.read(1<<20),b""):
+                h.update(chunk)
+        return h.hexdigest()
+    
+    def __remove_gds_index(self):
+        # The sidecar only describes a GDS file written with the cache
+        if(os.path.exists(self.name + ".gdsidx")):
+            os.remove(self.name + ".gdsidx")
+    
     def __exportCache(self):
         print("Storing objects in cache file")
         cachefile=open(self.name+".cache","wb")
@@ -892,11 +1028,28 @@ class Mask:
         except IOError:
             pass
     
+    def __referenced_cells(self) -> set:
+        # Names of the cells reachable from the main cell. For streamed cells 
+        # (geometry released) the references recorded when writing are used.
+        reflist = set([self.mainsymbol])
+        todo = [(self.mainsymbol,LayoutPool[self.mainsymbol])]
+        visited = set()
+        while(len(todo)!=0):
+            cname,cell = todo.pop()
+            if id(cell) in visited:
+                continue
+            visited.add(id(cell))
+            refs = [(g.cellname,g.group) for g in cell.group if type(g)==SRef or type(g)==ARef]
+            if cname in self.__streamed:
+                refs+=[(r,LayoutPool[r]) for r in self.__streamed[cname] if r in LayoutPool]
+            for r,group in refs:
+                reflist.add(r)
+                todo.append((r,group))
+        return reflist
+    
     def __cleanup_cellref(self):
         # Remove useless references
-        reflist = set()
-        reflist = LayoutPool[self.mainsymbol].get_sref_list(reflist)
-        reflist.add(self.mainsymbol)
+        reflist = self.__referenced_cells()
         
         unref=[]
         unref_hsh=[]
@@ -906,6 +1059,7 @@ class Mask:
        
         for ref in unref:
             LayoutPool.pop(ref,None)
+            _BoundingBoxPool.pop(ref,None)
         for key,value in _DevicePool.items():
             if value in unref:
                 unref_hsh+=[key]
@@ -914,11 +1068,24 @@ class Mask:
             #_DeviceCountPool.pop(hsh,None)
             _DeviceLocalParamPool.pop(hsh,None)
             _DevicePool.pop(hsh,None)
+    
+    def __update_bounding_boxes(self):
+        # Stores the bounding box of every cell in the pool. Boxes are cached in 
+        # the cell groups, so each cell is only computed once.
+        for cname,cell in LayoutPool.items():
+            if(len(cell.group)!=0 or cname not in _BoundingBoxPool):
+                _BoundingBoxPool[cname] = cell.bounding_box()
         
     
-    def exportGDS(self):
+    def exportGDS(self, processes: int = 1):
         """
         Finalize the mask, perform cache operations, if any, and write to GDS.
+        
+        Parameters
+        ----------
+        processes : int, optional
+            Number of processes used to encode the cells, the output does not 
+            depend on it. Not used in streaming mode. The default is 1.
 
         Returns
         -------
@@ -926,25 +1093,82 @@ class Mask:
 
         """
     
+        if(self.streaming):
+            self.__export_streaming()
+            return
         self.__cleanup_cellref()
+        self.__update_bounding_boxes()
+        for cell in LayoutPool.values():
+            self.__extract_arrays(cell)
         if(self.cache): 
+            gdsr = GDSReader()
+            digests = dict()
             try:
-                gdsr = GDSReader()
-                gdsr.quick_read(self.name + ".gds")
-                gdsr.celldata.pop(self.mainsymbol,None)
+                with open(self.name + ".gdsidx","r") as idxfile:
+                    index = json.load(idxfile)
+                # The GDS file must be the one described by the sidecar
+                if(index.get("gds")==self.__gds_file_digest()):
+                    gdsr.quick_read(self.name + ".gds")
+                    gdsr.celldata.pop(self.mainsymbol,None)
+                    digests = index["cells"]
             except:
                 pass
+        else:
+            self.__remove_gds_index()
             
         gdsw = GDSWriter()
         gdsw.open_library(self.name + ".gds")
         if(self.cache):
-            gdsw.write_pool_use_cache(LayoutPool,gdsr.celldata)
+            digests = gdsw.write_pool_use_cache(LayoutPool,gdsr.celldata,digests,
+                                                processes=processes)
         else:
-            gdsw.write_pool(LayoutPool)
+            gdsw.write_pool(LayoutPool,processes)
         gdsw.close_library()
-        if(self.cache): self.__exportCache()
+        if(self.cache): 
+            with open(self.name + ".gdsidx","w") as idxfile:
+                json.dump({"gds": self.__gds_file_digest(), "cells": digests},idxfile)
+            self.__exportCache()
+    
+    def exportOASIS(self):
+        """
+        Finalize the mask and write to OASIS file (with .oas extension).
+        OASIS files are much smaller than GDS files, see `samplemaker.oasiswriter`.
+        The geometry is the same as in the GDS file, except for paths: OASIS 
+        has no round path ends, paths are written with square ends extended by
+        half their width.
+        Not available in streaming mode, the cache system is not used.
+
+        Returns
+        -------
+        None.
+
+        """
+        if(self.streaming):
+            print("OASIS export is not available in streaming mode")
+            return
+        self.__cleanup_cellref()
+        self.__update_bounding_boxes()
+        for cell in LayoutPool.values():
+            self.__extract_arrays(cell)
+        oasw = OASISWriter()
+        oasw.open_library(self.name + ".oas")
+        oasw.write_pool(LayoutPool)
+        oasw.close_library()
     
-    def importGDS(self, filename: str):
+    def __export_streaming(self):
+        # Writes the remaining cells and closes the streamed GDS file
+        self.stream_cells()
+        self.__cleanup_cellref()
+        pool = dict()
+        for cname,cell in LayoutPool.items():
+            if(cname not in self.__streamed):
+                self.__extract_arrays(cell)
+                pool[cname] = cell
+        self.__gdsw.write_pool(pool)
+        self.__gdsw.close_library()
+        self.__gdsw = None
+    
+    def importGDS(self, filename: str, processes: int = 1):
         """
         Import the full mask from GDS file.
 
@@ -952,6 +1176,9 @@ class Mask:
         ----------
         filename : str
             name of the GDS file to read from.
+        processes : int, optional
+            Number of processes used to decode the cells in parallel. 
+            The default is 1.
 
         Returns
         -------
@@ -965,12 +1192,17 @@ class Mask:
         mainsymbolcandidates = set()
 
         gdsr = GDSReader()
-        gdsr.quick_read(filename)
-        for cname in gdsr.celldata:
-            gg = gdsr.get_cell(cname)
-            self.addCell(cname, gg)
+        gdsr.open_library(filename)
+        try:
+            cellnames = gdsr.cell_names()
+            cells = gdsr.get_cells(cellnames,processes)
+        finally:
+            gdsr.close_library()
+        for cname in cellnames:
+            gg = cells[cname]
+            LayoutPool[cname] = gg
             reflist = gg.get_sref_list(reflist)
-        for cname in gdsr.celldata:
+        for cname in cellnames:
             if(cname not in reflist):
                 mainsymbolcandidates.add(cname)
         if len(mainsymbolcandidates)==1:
@@ -983,10 +1215,12 @@ class Mask:
                     nsubref=nrefs
                     self.mainsymbol=cname
         # Update references after reading
-        for cname in gdsr.celldata:
+        for cname in cellnames:
             for e in LayoutPool[cname].group:
                 if(type(e)==SRef or type(e)==ARef):
                     e.group = LayoutPool[e.cellname]
+            LayoutPool[cname].invalidate_cache()
+        self.__update_bounding_boxes()
         
 
         
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""
+Binary export to OASIS files.
+
+The `OASISWriter` class has the same interface as `samplemaker.gdswriter.GDSWriter`
+and should not be used directly but via the `samplemaker.layout.Mask` object
+(see `Mask.exportOASIS`).
+
+OASIS files are usually much smaller than GDS files with the same content:
+
+  - coordinates are variable-length integers and point lists are delta-encoded,
+  - layers, positions and shape sizes are modal, i.e. only written when they change,
+  - identical shapes and cell references are written once with a repetition.
+    Regular lattices are detected automatically (see `samplemaker.spatial.find_lattices`),
+    other positions are stored as a list of displacements.
+
+Rectangles are written with the dedicated OASIS record. Circles are written as 
+polygons with the same vertices as in GDS files (see `GDSWriter`), 
+so that both formats describe the same geometry.
+Unlike GDS, OASIS has no round path ends: paths are extended by half their 
+width instead (square ends), which covers slightly more area at both ends.
+Text size and orientation are not stored.
+
+"""
+
+import math
+import numpy as np
+import struct
+import samplemaker.shapes as smsh
+from samplemaker.shapes import GeomGroup
+from samplemaker.spatial import find_lattices
+
+def _uint(value: int) -> bytes:
+    # Unsigned integer, 7 bits per byte, least significant first
+    out = bytearray()
+    value = int(value)
+    while True:
+        if(value<128):
+            out.append(value)
+            return bytes(out)
+        out.append((value & 127) | 128)
+        value >>= 7
+
+def _uints(values, lengths: bool = False):
+    # Encodes an array of unsigned integers in a single pass, optionally
+    # returns the encoded length of each value
+    values = np.asarray(values,dtype=np.uint64).ravel()
+    nbytes = np.ones(values.size,dtype=np.int64)
+    if(values.size==0):
+        return (b"",nbytes) if lengths else b""
+    rest = values>>np.uint64(7)
+    while np.any(rest):
+        nbytes += rest>0
+        rest >>= np.uint64(7)
+    k = np.arange(np.max(nbytes),dtype=np.int64)
+    groups = ((values[:,None]>>(np.uint64(7)*k[None,:].astype(np.uint64))) & np.uint64(127)).astype(np.uint8)
+    groups[k[None,:]<nbytes[:,None]-1] |= 128
+    data = groups[k[None,:]<nbytes[:,None]].tobytes()
+    return (data,nbytes) if lengths else data
+
+def _sint(value: int) -> bytes:
+    # Signed integer, the sign is in the lowest bit
+    value = int(value)
+    return _uint((abs(value)<<1) | (value<0))
+
+def _real(value: float) -> bytes:
+    if(value==int(value)):
+        if(value>=0):
+            return _uint(0)+_uint(value)
+        return _uint(1)+_uint(-value)
+    return _uint(7)+struct.pack("<d",value)
+
+def _string(text: str) -> bytes:
+    data = text.encode()
+    return _uint(len(data))+data
+
+def _gdeltas(dx, dy) -> bytes:
+    # General displacements (second form of g-delta)
+    dx = np.asarray(dx,dtype=np.int64)
+    dy = np.asarray(dy,dtype=np.int64)
+    words = np.empty(2*dx.size,dtype=np.uint64)
+    words[0::2] = (np.abs(dx).astype(np.uint64)<<np.uint64(2)) | ((dx<0).astype(np.uint64)<<np.uint64(1)) | np.uint64(1)
+    words[1::2] = (np.abs(dy).astype(np.uint64)<<np.uint64(1)) | (dy<0).astype(np.uint64)
+    return _uints(words)
+
+def _point_lists(vertices: list) -> list:
+    # Point lists of polygons or paths (relative to their first vertex), all 
+    # encoded in a single pass. Manhattan lists use 2-deltas, the others g-deltas.
+    npts = np.array([len(v) for v in vertices],dtype=np.int64)
+    v = np.concatenate(vertices).astype(np.int64)
+    d = np.diff(v,axis=0)
+    keep = np.ones(len(d),dtype=bool)
+    keep[np.cumsum(npts)[:-1]-1] = False
+    d = d[keep]
+    dx = d[:,0]
+    dy = d[:,1]
+    ndelta = npts-1
+    owner = np.repeat(np.arange(len(npts)),ndelta)
+    manhattan = np.bincount(owner,weights=(dx!=0) & (dy!=0),minlength=len(npts))==0
+    dman = manhattan[owner]
+    # Words of each list: type, count, then one word per 2-delta or two per g-delta
+    nwords = 2+np.where(manhattan,ndelta,2*ndelta)
+    start = np.concatenate([[0],np.cumsum(nwords)[:-1]])
+    words = np.zeros(np.sum(nwords),dtype=np.uint64)
+    words[start] = np.where(manhattan,2,4)
+    words[start+1] = ndelta
+    first = np.concatenate([[0],np.cumsum(np.where(dman,1,2))[:-1]])
+    first += 2*(owner+1)
+    direction = np.where(dx>0,0,np.where(dy>0,1,np.where(dx<0,2,3)))
+    direction[(dx==0) & (dy==0)] = 0
+    mag = np.abs(dx)+np.abs(dy)
+    words[first[dman]] = (mag[dman]<<2) | direction[dman]
+    gx = ~dman
+    words[first[gx]] = (np.abs(dx[gx]).astype(np.uint64)<<np.uint64(2)) | ((dx[gx]<0).astype(np.uint64)<<np.uint64(1)) | np.uint64(1)
+    words[first[gx]+1] = (np.abs(dy[gx]).astype(np.uint64)<<np.uint64(1)) | (dy[gx]<0).astype(np.uint64)
+    data,nbytes = _uints(words,True)
+    ends = np.cumsum(nbytes)[np.cumsum(nwords)-1].tolist()
+    return [data[i0:i1] for i0,i1 in zip([0]+ends[:-1],ends)]
+
+def _repetition(ncols: int, nrows: int, a, b) -> bytes:
+    # Repetition record of a lattice with vectors a (ncols sites) and b (nrows sites)
+    if(ncols>1 and nrows>1):
+        if(a[1]==0 and b[0]==0 and a[0]>0 and b[1]>0):
+            return _uint(1)+_uints([ncols-2,nrows-2,a[0],b[1]])
+        if(a[0]==0 and b[1]==0 and a[1]>0 and b[0]>0):
+            return _uint(1)+_uints([nrows-2,ncols-2,b[0],a[1]])
+        return _uint(8)+_uints([ncols-2,nrows-2])+_gdeltas([a[0],b[0]],[a[1],b[1]])
+    n = max(ncols,nrows)
+    v = a if ncols>1 else b
+    if(v[1]==0 and v[0]>0):
+        return _uint(2)+_uints([n-2,v[0]])
+    if(v[0]==0 and v[1]>0):
+        return _uint(3)+_uints([n-2,v[1]])
+    return _uint(9)+_uint(n-2)+_gdeltas([v[0]],[v[1]])
+
+def _repetitions(pos, min_count: int = 3) -> list:
+    # Splits a set of positions into lattices and a list of arbitrary positions.
+    # Returns (x,y,repetition) tuples, repetition is None for single positions.
+    out = []
+    left = np.ones(len(pos),dtype=bool)
+    if(len(pos)>=min_count):
+        for members,ncols,nrows,a,b in find_lattices(pos,min_count):
+            out.append((pos[members[0],0],pos[members[0],1],_repetition(ncols,nrows,a,b)))
+            left[members] = False
+    rest = pos[left]
+    if(len(rest)==1):
+        out.append((rest[0,0],rest[0,1],None))
+    if(len(rest)>1):
+        d = np.diff(rest,axis=0)
+        out.append((rest[0,0],rest[0,1],_uint(10)+_uint(len(rest)-2)+_gdeltas(d[:,0],d[:,1])))
+    return out
+
+class OASISWriter:
+    """
+    OASIS output class
+    """
+
+    def __init__(self, circleres: int = 12, arcres: int = 32):
+        """
+        Initializes the OASIS writer.
+
+        Parameters
+        ----------
+        circleres : int, optional
+            Number of points to use for circles. The default is 12.
+        arcres : int, optional
+            Number of points used for ellipses, rings and arcs. The default is 32.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.circleres = circleres
+        self.arcres = arcres
+        self.xc = np.array([math.cos(i*2*math.pi/circleres) for i in range(circleres)])
+        self.yc = np.array([math.sin(i*2*math.pi/circleres) for i in range(circleres)])
+        self.min_repetition = 3 # Minimum size of a lattice repetition
+
+    def __emit(self, data: bytes):
+        # Records are collected and written in one block by __flush
+        self.__chunks.append(data)
+
+    def __flush(self):
+        self.fid.write(b"".join(self.__chunks))
+        self.__chunks = []
+
+    def __reset_modal(self):
+        # Modal variables are undefined at the beginning of each cell
+        self.__modal = dict()
+
+    def __modal_field(self, info: int, bit: int, name: str, value, data: bytes) -> tuple:
+        # Adds a field to a record only if its value differs from the modal value
+        if(self.__modal.get(name)==value):
+            return info,b""
+        self.__modal[name] = value
+        return info | bit,data
+
+    def __cellname(self, name: str) -> int:
+        # Implicit reference number of a cell name, written on first use
+        if name not in self.__names:
+            self.__names[name] = len(self.__names)
+            self.__emit(_uint(3)+_string(name))
+        return self.__names[name]
+
+    def open_library(self, filename: str):
+        """
+        Opens a new OASIS file for writing. To close, call close_library()
+
+        Parameters
+        ----------
+        filename : str
+            The name of the file to write into.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.fid = open(filename,"wb")
+        self.__chunks = []
+        self.__names = dict()
+        self.__reset_modal()
+        self.__emit(b"%SEMI-OASIS\r\n")
+        # START: version, 1 nm grid, table offsets (none) in this record
+        self.__emit(_uint(1)+_string("1.0")+_real(1000)+_uint(0)+_uints([0]*12))
+        self.__flush()
+        print("Opened " + filename)
+
+    def open_structure(self, structure_name: str):
+        """
+        Opens a new structure (or cell) in the existing OASIS stream.
+        The file should be already open using open_library()
+        It should be closed with close_structure()
+
+        Parameters
+        ----------
+        structure_name : str
+            A string with a valid cell name.
+
+        Returns
+        -------
+        None.
+
+        """
+        print("Writing structure: " + structure_name)
+        ref = self.__cellname(structure_name)
+        self.__emit(_uint(13)+_uint(ref))
+        self.__reset_modal()
+
+    def close_structure(self):
+        """
+        Closes the current structure. OASIS cells do not have an end record,
+        the data is written to file.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__flush()
+
+    def __write_polygon(self, layer: int, pl: bytes, x: int, y: int, rep: bytes):
+        info,fields = 0,b""
+        for bit,name,value,data in ((0x01,"layer",layer,_uint(layer)),
+                                    (0x02,"datatype",0,_uint(0))):
+            info,field = self.__modal_field(info,bit,name,value,data)
+            fields+=field
+        info,field = self.__modal_field(info,0x20,"polygon",pl,pl)
+        fields+=field
+        info,field = self.__position(info,x,y,rep)
+        self.__emit(_uint(21)+bytes([info])+fields+field)
+
+    def __write_rectangle(self, layer: int, w: int, h: int, x: int, y: int, rep: bytes):
+        info,fields = 0,b""
+        for bit,name,value,data in ((0x01,"layer",layer,_uint(layer)),
+                                    (0x02,"datatype",0,_uint(0))):
+            info,field = self.__modal_field(info,bit,name,value,data)
+            fields+=field
+        if(w==h):
+            info |= 0x80
+            info,field = self.__modal_field(info,0x40,"width",w,_uint(w))
+            self.__modal["height"] = w
+            fields+=field
+        else:
+            for bit,name,value in ((0x40,"width",w),(0x20,"height",h)):
+                info,field = self.__modal_field(info,bit,name,value,_uint(value))
+                fields+=field
+        info,field = self.__position(info,x,y,rep)
+        self.__emit(_uint(20)+bytes([info])+fields+field)
+
+    def __position(self, info: int, x: int, y: int, rep: bytes) -> tuple:
+        # Geometry position (X=0x10, Y=0x08) and repetition (R=0x04) fields,
+        # common to all geometry records
+        fields = b""
+        info,field = self.__modal_field(info,0x10,"geometry-x",x,_sint(x))
+        fields+=field
+        info,field = self.__modal_field(info,0x08,"geometry-y",y,_sint(y))
+        fields+=field
+        if(rep is not None):
+            info |= 0x04
+            fields+=rep
+        return info,fields
+
+    def __write_path(self, path):
+        v = np.round_(np.array([path.xpts,path.ypts],dtype="float64").T*1000).astype(np.int64)
+        if(len(v)<2):
+            return
+        hw = int(round(path.width*500))
+        info,fields = 0,b""
+        pl = _point_lists([v])[0]
+        for bit,name,value,data in ((0x01,"layer",path.layer,_uint(path.layer)),
+                                    (0x02,"datatype",0,_uint(0)),
+                                    (0x40,"halfwidth",hw,_uint(hw)),
+                                    (0x80,"extension",10,_uint(10)), # half-width at both ends
+                                    (0x20,"path",pl,pl)):
+            info,field = self.__modal_field(info,bit,name,value,data)
+            fields+=field
+        info,field = self.__position(info,v[0,0],v[0,1],None)
+        self.__emit(_uint(22)+bytes([info])+fields+field)
+
+    def __write_text(self, text):
+        if(text.text.replace(" ","")==""):
+            return
+        x = int(round(text.x0*1000))
+        y = int(round(text.y0*1000))
+        info,fields = 0,b""
+        for bit,name,value,data in ((0x40,"text",text.text,_string(text.text)),
+                                    (0x01,"textlayer",text.layer,_uint(text.layer)),
+                                    (0x02,"texttype",0,_uint(0)),
+                                    (0x10,"text-x",x,_sint(x)),
+                                    (0x08,"text-y",y,_sint(y))):
+            info,field = self.__modal_field(info,bit,name,value,data)
+            fields+=field
+        self.__emit(_uint(19)+bytes([info])+fields)
+
+    def __write_placement(self, ref, x: int, y: int, rep: bytes):
+        info,fields = 0,b""
+        if(ref.cellname in self.__names):
+            info,fields = self.__modal_field(info,0xC0,"cell",ref.cellname,
+                                             _uint(self.__names[ref.cellname]))
+        else:
+            info,fields = self.__modal_field(info,0x80,"cell",ref.cellname,_string(ref.cellname))
+        quarter = (ref.angle%360)/90
+        if(ref.mag==1 and abs(quarter-round(quarter))<1e-9):
+            rtype = 17
+            info |= (int(round(quarter))%4)<<1
+        else:
+            rtype = 18
+            if(ref.mag!=1):
+                info |= 0x04
+                fields+=_real(ref.mag)
+            if(ref.angle%360!=0):
+                info |= 0x02
+                fields+=_real(ref.angle%360)
+        if(ref.mirror):
+            info |= 0x01
+        for bit,name,value in ((0x20,"placement-x",x),(0x10,"placement-y",y)):
+            info,field = self.__modal_field(info,bit,name,value,_sint(value))
+            fields+=field
+        if(rep is not None):
+            info |= 0x08
+            fields+=rep
+        self.__emit(_uint(rtype)+bytes([info])+fields)
+
+    def write_geomgroup(self, geom_group: GeomGroup):
+        """
+        Writes a GeomGroup to OASIS stream. The file should be first opened with
+        open_library() followed by open_structure().
+        To be used for interactive writing only. See write_structure() for
+        direct writing (recommended)
+        Identical shapes and references are grouped in repetitions.
+
+        Parameters
+        ----------
+        geom_group : samplemaker.shapes.GeomGroup
+            The geometry to be written into OASIS format.
+
+        Returns
+        -------
+        None.
+
+        """
+        shapes = dict() # shape key to list of positions
+        refs = dict() # reference transformation to list of positions
+        for geom in geom_group.group:
+            geomtype = type(geom)
+            if(geomtype==smsh.Poly):
+                self.__add_polygon(shapes,geom.layer,geom.int_data())
+                continue
+            if(geomtype==smsh.PolyArray):
+                idata = geom.int_data()
+                for i in range(len(geom)):
+                    self.__add_polygon(shapes,geom.layer,idata[2*geom.offsets[i]:2*geom.offsets[i+1]])
+                continue
+            if(geomtype==smsh.Circle):
+                # Same polygon as in GDSWriter
+                p = smsh.Poly(geom.r*self.xc+geom.x0,geom.r*self.yc+geom.y0,geom.layer)
+                self.__add_polygon(shapes,geom.layer,p.int_data())
+                continue
+            if(geomtype==smsh.Path):
+                self.__write_path(geom)
+                continue
+            if(geomtype==smsh.Text):
+                self.__write_text(geom)
+                continue
+            if(geomtype==smsh.SRef):
+                key = (geom.cellname,geom.mag,geom.angle,geom.mirror)
+                refs.setdefault(key,[]).append((geom,int(round(geom.x0*1000)),int(round(geom.y0*1000))))
+                continue
+            if(geomtype==smsh.ARef):
+                a = [int(round(geom.ax*1000)),int(round(geom.ay*1000))]
+                b = [int(round(geom.bx*1000)),int(round(geom.by*1000))]
+                rep = None
+                if(geom.ncols*geom.nrows>1):
+                    rep = _repetition(geom.ncols,geom.nrows,a,b)
+                self.__write_placement(geom,int(round(geom.x0*1000)),int(round(geom.y0*1000)),rep)
+                continue
+            if(geomtype==smsh.Ellipse or geomtype==smsh.Ring or geomtype==smsh.Arc):
+                g = geom.to_polygon(self.arcres) # produces one geometry only
+                self.__add_polygon(shapes,g.group[0].layer,g.group[0].int_data())
+                continue
+
+        polygons = [key for key in shapes.keys() if key[0]=="P"]
+        if(len(polygons)!=0):
+            pls = _point_lists([np.frombuffer(key[2],dtype=np.int64).reshape(-1,2) for key in polygons])
+            pls = dict(zip(polygons,pls))
+        for key,pos in shapes.items():
+            for x,y,rep in _repetitions(np.array(pos,dtype=np.int64),self.min_repetition):
+                if(key[0]=="R"):
+                    self.__write_rectangle(key[1],key[2],key[3],x,y,rep)
+                else:
+                    self.__write_polygon(key[1],pls[key],x,y,rep)
+        for key,items in refs.items():
+            pos = np.array([(x,y) for g,x,y in items],dtype=np.int64)
+            for x,y,rep in _repetitions(pos,self.min_repetition):
+                self.__write_placement(items[0][0],x,y,rep)
+
+    def __add_polygon(self, shapes: dict, layer: int, idata):
+        # Polygons are stored relative to their first vertex, rectangles by size
+        v = np.asarray(idata,dtype=np.int64).reshape(-1,2)
+        if(len(v)>1 and v[0,0]==v[-1,0] and v[0,1]==v[-1,1]):
+            v = v[:-1]
+        if(len(v)<3):
+            return
+        if(len(v)==4):
+            x = v[:,0]
+            y = v[:,1]
+            if((x[0]==x[1] and y[1]==y[2] and x[2]==x[3] and y[3]==y[0]) or
+               (y[0]==y[1] and x[1]==x[2] and y[2]==y[3] and x[3]==x[0])):
+                x0 = np.min(x)
+                y0 = np.min(y)
+                w = np.max(x)-x0
+                h = np.max(y)-y0
+                if(w>0 and h>0):
+                    shapes.setdefault(("R",layer,int(w),int(h)),[]).append((x0,y0))
+                    return
+        shapes.setdefault(("P",layer,(v-v[0]).tobytes()),[]).append((v[0,0],v[0,1]))
+
+    def write_structure(self, structure_name: str, geom_group: 'GeomGroup'):
+        """
+        Write a GeomGroup into a named structure/cell.
+        This is equivalent to
+            open_structure(structure_name)
+            write_geomgroup(geom_group)
+            close_structure()
+
+        Parameters
+        ----------
+        structure_name : str
+            A string with a valid cell name.
+        geom_group : 'GeomGroup'
+            The GeomGroup to be written into OASIS format.
+
+        Returns
+        -------
+        None.
+
+        """
+        # Names must be defined outside the cell
+        for geom in geom_group.group:
+            if(type(geom)==smsh.SRef or type(geom)==smsh.ARef):
+                self.__cellname(geom.cellname)
+        self.open_structure(structure_name)
+        self.write_geomgroup(geom_group)
+        self.close_structure()
+
+    def write_pool(self, pool: dict):
+        """
+        Writes all the structures in the dictionary using key name as structure
+        reference name and value as the group to be written.
+
+        Parameters
+        ----------
+        pool : dict
+            A dictionary containing structure names as keys and GeomGroup as values.
+
+        Returns
+        -------
+        None.
+
+        """
+        for sname,group in pool.items():
+            self.write_structure(sname, group)
+
+    def close_library(self):
+        """
+        Closes the OASIS library and the file stream
+
+        Returns
+        -------
+        None.
+
+        """
+        # END record is 256 bytes long: padding string and no validation
+        self.__emit(_uint(2)+_uint(252)+bytes(252)+_uint(0))
+        self.__flush()
+        print('Writing to OASIS complete.')
+        self.fid.close()
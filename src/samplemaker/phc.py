@@ -430,7 +430,7 @@ def make_phc(crystal: "Crystal", scaling: float, cellparams: List[float], x0: fl
         params = [0.]*nargs
         for j in range(nargs):
             params[j] = crystal.params[j,i]*cellparams[j]
-        phc+=cellfun(xpos,ypos,params)   
+        phc.group+=cellfun(xpos,ypos,params).group
         
     phc.translate(x0,y0)
     return phc
@@ -469,14 +469,14 @@ def make_phc_inpoly(crystal: "Crystal", poly: "sm.Poly", scaling: float, cellpar
     """
     nargs = cellfun(0,0,"test");
     phc = GeomGroup();
-    for i in range(len(crystal.xpts)):
+    inside = poly.points_inside(np.asarray(crystal.xpts)*scaling,np.asarray(crystal.ypts)*scaling)
+    for i in np.flatnonzero(inside):
         xpos = crystal.xpts[i]*scaling
         ypos = crystal.ypts[i]*scaling
-        if(poly.point_inside(xpos,ypos)):
-            params = [0.]*nargs
-            for j in range(nargs):
-                params[j] = crystal.params[j,i]*cellparams[j]
-            phc+=cellfun(xpos,ypos,params)   
+        params = [0.]*nargs
+        for j in range(nargs):
+            params[j] = crystal.params[j,i]*cellparams[j]
+        phc.group+=cellfun(xpos,ypos,params).group
         
     phc.translate(x0,y0)
     return phc
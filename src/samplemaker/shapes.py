@@ -20,6 +20,11 @@ Additionally, the following non-GDS shapes are available:
 * `Ring`: elliptical or circular rings.
 * `Arc`: like rings but covering a sector angle only.
 
+Large numbers of polygons can be stored more efficiently as:
+
+* `PolyArray`: packed polygons of a single layer, sharing one coordinate buffer
+  (see `GeomGroup.pack`).
+
 Two more objects `Dot` and `Box` are available but not drawable.
 They are sometimes useful for calculations
 (e.g. bounding boxes or point transformations).
@@ -51,27 +56,514 @@ the method `GeomGroup.copy` instead:
     g1 = GeomGroup()
     g2 = g1 # Now both g1 and g2 refer to the same object 
     g2.set_layer(3) # Both g1 and g2 have changed layer to 3
-    g3 = g1.copy() # g3 is now a separate (deep) copy of g1.
+    g3 = g1.copy() # g3 is now a separate copy of g1.
     g3.set_layer(4) # Only g3 is set to layer 4.
     
 In combining multiple geometries, it is often convenient to perform shallow copies
 to save memory and computation time. For example
 
     geomA += geom2 # Shallow copy of geom2 into geomA. Any change to geom2 will affect geomA
-    geomB += geom2.copy() # Deep copy, any change to geom2 will not affect geomB
+    geomB += geom2.copy() # Separate copy, any change to geom2 will not affect geomB
+
+### Tiled boolean operations
+Boolean operations on very large layers can be run on a grid of tiles, optionally
+in parallel processes. The tiles are processed independently and stitched back
+without seams (inversions are not tiled):
+
+    smsh.set_boolean_tiling(100, processes=4) # 100 um tiles, 4 processes
+    geomA.boolean_union(1) # Tiled if the layer has at least 1000 polygons
+    smsh.set_boolean_tiling(0) # Back to the standard operations
+
+### Layer algebra
+Long chains of boolean operations between layers can be written with `LayerAlgebra`,
+which converts each layer only once and keeps the intermediate results in the
+boolean engine:
+
+    la = smsh.LayerAlgebra(geomA)
+    la[3] = (la[1] | la[2]) - la[4].resize(0.1)
+    la.apply() # Writes layer 3 back to geomA
+
+### Integer storage
+Polygons normally store float coordinates in um. With `set_int_storage(True)`,
+the results of boolean operations and imported GDS cells keep int32 coordinates
+in nm instead (half the memory, no rounding between operations). `Poly.data`
+still returns um, computed on demand. Any transformation goes back to float storage.
 
 
 """
 
 import numpy as np
-from copy import deepcopy
+from copy import deepcopy, copy
 import math
+import hashlib
 from pkg_resources import resource_filename
 import samplemaker.resources.boopy as boopy
 from typing import List
-from samplemaker import _BoundingBoxPool
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from contextlib import closing, nullcontext
+from itertools import islice, starmap
+from samplemaker import _BoundingBoxPool, LayoutPool
+from samplemaker.spatial import GridIndex, find_lattices
 
 _glyphs = dict()
+_mutation_count = 0 # incremented every time a shape or a GeomGroup is modified, used by caches
+
+class _CacheObserver:
+    # Version of the data a GeomGroup cache depends on. The elements of the group
+    # hold a link to it (_observers) and the cells referenced by the group hold
+    # it in their parents, so that a change anywhere below bumps the version.
+    __slots__ = ("version","parents","key")
+    
+    def __init__(self):
+        self.version = 0
+        self.parents = []
+        self.key = None # element list the links were made for
+    
+    def __reduce__(self):
+        # Links are not stored (pickle, deepcopy), they are made again when needed
+        return (_CacheObserver,())
+
+def _observe(obj, obs: _CacheObserver):
+    # Links a shape to the observer of a group containing it
+    cur = obj.__dict__.get("_observers")
+    if cur is None:
+        obj._observers = obs
+    elif type(cur)==list:
+        if obs not in cur:
+            cur.append(obs)
+    elif cur is not obs:
+        obj._observers = [cur,obs]
+
+def _touch(obj):
+    # Marks a shape or a group as modified: the caches of the groups containing
+    # it (or referencing it as a cell) are invalidated (see GeomGroup.__get_cache)
+    global _mutation_count
+    _mutation_count+=1
+    for obs in [obj.__dict__.get("_observers"),obj.__dict__.get("_cache_obs")]:
+        if obs is None:
+            continue
+        stack = list(obs) if type(obs)==list else [obs]
+        while len(stack)>0:
+            o = stack.pop()
+            if(o.version!=_mutation_count):
+                o.version = _mutation_count
+                stack+=o.parents
+
+# Vectorized polygon kernels. Polygons are given as a flat coordinate buffer
+# (X0,Y0,X1,Y1,...) and an offset array with the index of the first vertex of
+# each polygon followed by the total vertex count (see PolyArray).
+# Each vertex is paired with the previous one (wrapping around), as in the 
+# shoelace formula.
+
+def _prev_vertex(offsets):
+    prev = np.arange(-1,offsets[-1]-1)
+    full = offsets[1:]>offsets[:-1]
+    prev[offsets[:-1][full]] = offsets[1:][full]-1
+    return prev
+
+def _segment_sum(values, offsets):
+    # Sum of the vertex values of each polygon. np.add.reduceat does not 
+    # handle empty segments, so only the non-empty polygons are reduced 
+    # (empty polygons sum to zero).
+    res = np.zeros(offsets.size-1)
+    full = offsets[1:]>offsets[:-1]
+    if(np.any(full)):
+        res[full] = np.add.reduceat(values,offsets[:-1][full])
+    return res
+
+def _shoelace(data, offsets):
+    # Signed area of each polygon
+    x = data[0::2]
+    y = data[1::2]
+    prev = _prev_vertex(offsets)
+    shl = x[prev]*y-x*y[prev]
+    return _segment_sum(shl,offsets)/2
+
+def _centroids(data, offsets):
+    # Centroid coordinates of each polygon (NaN for polygons without area)
+    x = data[0::2]
+    y = data[1::2]
+    prev = _prev_vertex(offsets)
+    shl = x[prev]*y-x*y[prev]
+    area3 = 3*_segment_sum(shl,offsets)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cx = _segment_sum((x[prev]+x)*shl,offsets)/area3
+        cy = _segment_sum((y[prev]+y)*shl,offsets)/area3
+    return cx,cy
+
+def _perimeters(data, offsets):
+    # Sum of the segment lengths of each polygon
+    x = data[0::2]
+    y = data[1::2]
+    prev = _prev_vertex(offsets)
+    return _segment_sum(np.hypot(x-x[prev],y-y[prev]),offsets)
+
+def _points_in_ring(xv, yv, x, y):
+    # Crossing number test of many points against a single polygon.
+    # Points should be sorted by y, so that each edge only tests the points
+    # in its horizontal band.
+    c = np.zeros(x.size,dtype=bool)
+    xb = np.roll(xv,1)
+    yb = np.roll(yv,1)
+    i0 = np.searchsorted(y,np.minimum(yv,yb),side="left")
+    i1 = np.searchsorted(y,np.maximum(yv,yb),side="left")
+    for i in np.flatnonzero(i1>i0):
+        ys = y[i0[i]:i1[i]]
+        c[i0[i]:i1[i]] ^= x[i0[i]:i1[i]] < ((xb[i]-xv[i])*(ys-yv[i])/(yb[i]-yv[i])+xv[i])
+    return c
+
+def _affine_compose(M1, M2):
+    # Composition of two 2x3 affine matrices (M2 is applied first)
+    M = np.empty((2,3))
+    M[:,0:2] = M1[:,0:2]@M2[:,0:2]
+    M[:,2] = M1[:,0:2]@M2[:,2]+M1[:,2]
+    return M
+
+def _affine_data(data, M):
+    # Applies a 2x3 affine matrix to a flat X0,Y0,X1,Y1... buffer
+    out = np.empty(data.size)
+    x = data[0::2]
+    y = data[1::2]
+    if(M[0,0]==1 and M[1,1]==1 and M[0,1]==0 and M[1,0]==0):
+        out[0::2] = x+M[0,2]
+        out[1::2] = y+M[1,2]
+    else:
+        out[0::2] = M[0,0]*x+M[0,1]*y+M[0,2]
+        out[1::2] = M[1,0]*x+M[1,1]*y+M[1,2]
+    return out
+
+def _min_rotation(seq) -> int:
+    # Booth's algorithm: start index of the lexicographically minimal rotation
+    n = len(seq)
+    f = [-1]*(2*n)
+    k = 0
+    for j in range(1,2*n):
+        sj = seq[j%n]
+        i = f[j-k-1]
+        while i!=-1 and sj!=seq[(k+i+1)%n]:
+            if sj<seq[(k+i+1)%n]:
+                k = j-i-1
+            i = f[i]
+        if sj!=seq[(k+i+1)%n]:
+            # here i==-1
+            if sj<seq[k%n]:
+                k = j
+            f[j-k] = -1
+        else:
+            f[j-k] = i+1
+    return k
+
+def _copy_geom(geom):
+    # Copy of a single element sharing the immutable coordinate buffers.
+    # Shared buffers are made read-only, so that editing them in place fails
+    # instead of changing the other copies.
+    c = copy(geom)
+    c.__dict__.pop("_observers",None)
+    if(type(geom)==Poly or type(geom)==PolyArray):
+        for arr in [geom._data,geom._idata,getattr(geom,"offsets",None)]:
+            if(isinstance(arr,np.ndarray)):
+                arr.setflags(write=False)
+    elif(type(geom)==Path):
+        c.xpts = copy(geom.xpts)
+        c.ypts = copy(geom.ypts)
+    return c
+
+def _xy(x, y):
+    # Interleaves x and y coordinates in a new X0,Y0,X1,Y1... buffer
+    data = np.empty(2*x.size)
+    data[0::2] = x
+    data[1::2] = y
+    return data
+
+def _affine_leaves(geoms, M):
+    # Transformed copies of a list of shapes, polygons are transformed in a single pass
+    out = list(geoms)
+    ipoly = [k for k in range(len(geoms)) if type(geoms[k])==Poly]
+    if(len(ipoly)>1):
+        npts = np.array([geoms[k].data.size for k in ipoly])
+        data = _affine_data(np.concatenate([geoms[k].data for k in ipoly]),M)
+        for k,d in zip(ipoly,np.split(data,np.cumsum(npts[:-1]))):
+            p = Poly.__new__(Poly)
+            p.layer = geoms[k].layer
+            p.set_data(d)
+            out[k] = p
+    else:
+        ipoly = []
+    for k in set(range(len(geoms))).difference(ipoly):
+        out[k] = _affine_leaf(geoms[k],M)
+    return out
+
+def _affine_leaf(geom, M):
+    # Returns a transformed copy of a shape (no references).
+    # M is a similarity (magnification, mirror, rotation, translation) 
+    if(type(geom)==Poly):
+        p = Poly.__new__(Poly)
+        p.layer = geom.layer
+        p.set_data(_affine_data(geom.data,M))
+        return p
+    if(type(geom)==PolyArray):
+        return PolyArray(_affine_data(geom.data,M),geom.offsets,geom.layer)
+    g = _copy_geom(geom)
+    det = M[0,0]*M[1,1]-M[0,1]*M[1,0]
+    mag = math.sqrt(abs(det))
+    if(mag != 1):
+        g.scale(0,0,mag,mag)
+    if(det<0):
+        g.mirrorY(0)
+    rot = math.degrees(math.atan2(M[1,0],M[0,0]))
+    if(rot != 0):
+        g.rotate_translate(M[0,2],M[1,2],rot)
+    else:
+        g.translate(M[0,2],M[1,2])
+    return g
+
+# Tiled boolean engine. Large layers can be partitioned on a regular grid of 
+# tiles, each tile is clipped with a halo margin, processed by boopy (possibly
+# in a process pool) and cut back to its core. Result polygons touching a seam
+# between tiles are merged again in a final union, all others are taken as 
+# they are.
+
+_tiling = {"tile_size": 0, "processes": 1, "min_polygons": 1000}
+
+def set_boolean_tiling(tile_size: float, processes: int = 1, min_polygons: int = 1000):
+    """
+    Enables the tiled boolean engine for the boolean operations of
+    `GeomGroup` (union, difference, xor, intersection and resize).
+    Layers are partitioned on a square grid, each tile is processed separately
+    and the results are stitched back without seams. The result covers the 
+    same area as the non-tiled operation, although polygons may be split
+    differently. Tiling pays off when the result consists of many polygons
+    that are small compared to the tiles. `GeomGroup.invert` is never tiled,
+    its result is a single polygon spanning all tiles.
+
+    Parameters
+    ----------
+    tile_size : float
+        The tile size in um. Use 0 to disable tiling. Tiles should contain 
+        at least a few hundred polygons, otherwise the overhead per tile dominates.
+    processes : int, optional
+        Number of processes used to work on the tiles. The default is 1.
+    min_polygons : int, optional
+        Layers with fewer polygons are processed in one go. The default is 1000.
+
+    Returns
+    -------
+    None.
+
+    """
+    if(tile_size<0 or processes<1):
+        raise ValueError("set_boolean_tiling: tile_size must be >= 0 and processes >= 1")
+    _tiling["tile_size"] = tile_size
+    _tiling["processes"] = processes
+    _tiling["min_polygons"] = min_polygons
+
+# Integer storage. Polygons can keep their coordinates as int32 nanometres 
+# (the GDS database unit), the float coordinates in um are computed on demand.
+
+_int_storage = {"enabled": False}
+
+def set_int_storage(enabled: bool):
+    """
+    Selects the storage of the polygons created by boolean operations and
+    by the GDS reader. With integer storage, coordinates are kept as int32 
+    nanometres, halving the memory, and are passed to the boolean engine and to
+    the GDS writer without rounding. The float coordinates (`Poly.data`) are 
+    computed when needed. Existing geometries can be converted with
+    `GeomGroup.set_int_storage`.
+
+    Parameters
+    ----------
+    enabled : bool
+        True for integer storage, False for float storage (default).
+
+    Returns
+    -------
+    None.
+
+    """
+    _int_storage["enabled"] = enabled
+
+def _make_polys(idata, offsets, layer: int, int_storage: bool = None) -> list:
+    # Poly objects from an integer buffer with offsets, as views of a single buffer.
+    # The storage follows set_int_storage unless int_storage is given.
+    if(int_storage is None):
+        int_storage = _int_storage["enabled"]
+    if(int_storage):
+        idata = np.asarray(idata,dtype=np.int32)
+        setter = "set_int_data"
+    else:
+        idata = idata/1000.0
+        setter = "set_data"
+    polys = []
+    for j in range(offsets.size-1):
+        poly = Poly.__new__(Poly)
+        poly.layer = layer
+        getattr(poly,setter)(idata[2*offsets[j]:2*offsets[j+1]])
+        polys.append(poly)
+    return polys
+
+def _make_polyarray(idata, offsets, layer: int, int_storage: bool = None) -> "PolyArray":
+    # PolyArray from an integer buffer with offsets (storage as in _make_polys)
+    if(int_storage is None):
+        int_storage = _int_storage["enabled"]
+    if(int_storage):
+        pa = PolyArray([],offsets,layer)
+        pa.set_int_data(idata)
+        return pa
+    return PolyArray(idata/1000.0,offsets,layer)
+
+def _polygroup(idata, offsets):
+    # boopy PolyGroup from an integer coordinate buffer with offsets
+    pg = boopy.PolyGroup()
+    if(hasattr(pg,"addPolyArray")):
+        pg.addPolyArray(idata,offsets)
+    else:
+        # Older boopy builds without bulk transfer
+        for j in range(offsets.size-1):
+            pg.addPolyData(idata[2*offsets[j]:2*offsets[j+1]])
+    return pg
+
+def _polygroup_arrays(pg):
+    # Integer coordinate buffer and offsets of all polygons in a boopy PolyGroup
+    if(hasattr(pg,"getPolyArray")):
+        return pg.getPolyArray()
+    polys = [pg.getPoly(i) for i in range(pg.getPolyCount())]
+    counts = [len(p)//2 for p in polys]
+    offsets = np.zeros(len(polys)+1,dtype="int64")
+    offsets[1:] = np.cumsum(counts)
+    if(len(polys)==0):
+        return np.zeros(0,dtype="int64"),offsets
+    return np.concatenate(polys).astype("int64"),offsets
+
+def _polygroup_copy(pg):
+    # Independent copy of a boopy PolyGroup
+    if(hasattr(pg,"copy")):
+        return pg.copy()
+    # Older boopy builds without copy
+    return _polygroup(*_polygroup_arrays(pg))
+
+def _rect_polygroup(rect):
+    pg = boopy.PolyGroup()
+    x0,y0,x1,y1 = rect
+    pg.addPolyData([x0,y0,x1,y0,x1,y1,x0,y1,x0,y0])
+    return pg
+
+def _poly_bboxes(idata, offsets):
+    # Bounding box (x0,y0,x1,y1) of each polygon, polygons must not be empty
+    x = idata[0::2]
+    y = idata[1::2]
+    return (np.minimum.reduceat(x,offsets[:-1]),np.minimum.reduceat(y,offsets[:-1]),
+            np.maximum.reduceat(x,offsets[:-1]),np.maximum.reduceat(y,offsets[:-1]))
+
+def _select_polys(idata, offsets, sel):
+    # Coordinate buffer and offsets of the selected polygons
+    starts = 2*offsets[sel]
+    lengths = 2*offsets[sel+1]-starts
+    cum = np.cumsum(lengths)
+    idx = np.arange(cum[-1] if cum.size else 0)+np.repeat(starts-cum+lengths,lengths)
+    newoff = np.zeros(sel.size+1,dtype="int64")
+    newoff[1:] = cum//2
+    return idata[idx],newoff
+
+def _cut_polys(idata, offsets, rect):
+    # Cuts the polygons to a rectangle. Only the polygons crossing its edges 
+    # go through boopy, the others are kept as they are (they must not overlap).
+    if(offsets.size==1):
+        return idata,offsets
+    x0,y0,x1,y1 = _poly_bboxes(idata,offsets)
+    inside = (x0>=rect[0])&(y0>=rect[1])&(x1<=rect[2])&(y1<=rect[3])
+    if(np.all(inside)):
+        return idata,offsets
+    outside = (x1<=rect[0])|(y1<=rect[1])|(x0>=rect[2])|(y0>=rect[3])
+    pg = _polygroup(*_select_polys(idata,offsets,np.flatnonzero(~inside & ~outside)))
+    pg.intersection(_rect_polygroup(rect))
+    return _join_polys([_select_polys(idata,offsets,np.flatnonzero(inside)),
+                        _polygroup_arrays(pg)])
+
+def _join_polys(parts: list):
+    # Concatenates coordinate buffers with offsets
+    idata = np.concatenate([p[0] for p in parts])
+    offsets = np.concatenate([[0]]+[p[1][1:] for p in parts])
+    offsets[1:] += np.repeat(np.cumsum([0]+[p[1][-1] for p in parts[:-1]]),
+                             [p[1].size-1 for p in parts])
+    return idata,offsets
+
+def _boolean_tile(op, core, clip, seams, A, B, params):
+    # Performs one boolean operation within a tile. Returns the polygons in the
+    # tile core and a flag for those touching one of its seams (the core edges
+    # shared with other tiles, flags in seams as x0,y0,x1,y1).
+    if(op=="union"):
+        # No halo: the cut to the core merges the polygons as well
+        pgA = _polygroup(*A)
+        pgA.intersection(_rect_polygroup(core))
+        idata,offsets = _polygroup_arrays(pgA)
+    else:
+        if(op=="resize"):
+            pgA = _polygroup(*_cut_polys(*A,clip))
+            pgA.resize(*params)
+        else:
+            pgA = _polygroup(*A)
+            pgB = _polygroup(*B)
+            if(op=="difference"):
+                pgA.difference(pgB)
+            elif(op=="xor"):
+                pgA.exor(pgB)
+            elif(op=="intersection"):
+                pgA.intersection(pgB)
+        idata,offsets = _cut_polys(*_polygroup_arrays(pgA),core)
+    if(offsets.size==1):
+        return idata,offsets,np.zeros(0,dtype=bool)
+    x0,y0,x1,y1 = _poly_bboxes(idata,offsets)
+    seam = ((seams[0] & (x0<=core[0]))|(seams[1] & (y0<=core[1]))|
+            (seams[2] & (x1>=core[2]))|(seams[3] & (y1>=core[3])))
+    return idata,offsets,seam
+
+def _boolean_tiles(tasks: list) -> list:
+    # Worker for a batch of tiles (see _boolean_tile)
+    return [_boolean_tile(*t) for t in tasks]
+
+def _tile_bins(box, xe, ye, halo: int):
+    # Assigns polygons to the tiles whose clip area (tile extended by halo) 
+    # overlaps their bounding box. Tiles are numbered i*(len(ye)-1)+j. 
+    # Returns the polygon indices sorted by tile (by index within a tile) and
+    # the start of each tile in that list.
+    xe = np.asarray(xe,dtype="int64")
+    ye = np.asarray(ye,dtype="int64")
+    ntx = xe.size-1
+    nty = ye.size-1
+    i0 = np.searchsorted(xe[1:]+halo,box[0],side="right")
+    i1 = np.searchsorted(xe[:-1]-halo,box[2],side="left")
+    j0 = np.searchsorted(ye[1:]+halo,box[1],side="right")
+    j1 = np.searchsorted(ye[:-1]-halo,box[3],side="left")
+    ni = np.maximum(i1-i0,0)
+    nj = np.maximum(j1-j0,0)
+    counts = ni*nj
+    poly = np.repeat(np.arange(counts.size),counts)
+    k = np.arange(poly.size)-np.repeat(np.cumsum(counts)-counts,counts)
+    tile = (i0[poly]+k//nj[poly])*nty+j0[poly]+k%nj[poly]
+    order = np.argsort(tile,kind="stable")
+    starts = np.searchsorted(tile[order],np.arange(ntx*nty+1))
+    return poly[order],starts
+
+def _map_batches(fn, items, processes: int, batch_size: int):
+    # Ordered map of fn over batches of items in a process pool. Items are 
+    # taken from the iterator as the batches are submitted, with at most 
+    # 2*processes batches waiting, so that they are never all in memory.
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        items = iter(items)
+        pending = deque()
+        while True:
+            while(len(pending)<2*processes):
+                batch = list(islice(items,batch_size))
+                if(len(batch)==0):
+                    break
+                pending.append(executor.submit(fn,batch))
+            if(len(pending)==0):
+                return
+            for res in pending.popleft().result():
+                yield res
+
 
 class GeomGroup:
     def __init__(self):
@@ -84,6 +576,99 @@ class GeomGroup:
 
         """
         self.group = list();
+        self._cache = dict();
+    
+    def __getstate__(self):
+        # Cached data is not stored (pickle, deepcopy)
+        state = self.__dict__.copy()
+        state.pop("_cache",None)
+        state.pop("_cache_obs",None)
+        return state
+    
+    def __get_cache(self) -> dict:
+        # Returns the cache of derived data, cleared if the element list, the 
+        # elements or the cells they reference have been modified since it was filled.
+        # Changes are propagated to the observer of the group (see _touch), so 
+        # the check does not depend on the number of elements.
+        cache = self.__dict__.get("_cache")
+        if cache is None:
+            cache = self._cache = dict()
+        obs = self.__observer()
+        key = (id(self.group),len(self.group))
+        if(cache.get("_key")!=key or cache["_version"]!=obs.version):
+            cache.clear()
+            cache["_key"] = key
+            cache["_refs"] = len([g for g in self.group if type(g)==SRef or type(g)==ARef])!=0
+            self.__link(obs)
+            cache["_version"] = obs.version
+        return cache
+    
+    def __observer(self) -> _CacheObserver:
+        obs = self.__dict__.get("_cache_obs")
+        if obs is None:
+            obs = self._cache_obs = _CacheObserver()
+        return obs
+    
+    def __link(self, obs: _CacheObserver):
+        # Links the elements and the referenced cells (recursively) to the 
+        # observer, once for each element list
+        key = (id(self.group),len(self.group))
+        if(obs.key==key):
+            return
+        obs.key = key
+        for geom in self.group:
+            _observe(geom,obs)
+            if(type(geom)==SRef or type(geom)==ARef):
+                cobs = geom.group.__observer()
+                if obs not in cobs.parents:
+                    cobs.parents.append(obs)
+                geom.group.__link(cobs)
+    
+    def invalidate_cache(self):
+        """
+        Discards all data derived from the geometry and cached in the group 
+        (e.g. the spatial index). This is done automatically by all methods that 
+        modify the group or its elements. It should only be called after 
+        modifying attributes of the elements directly (e.g. `geom.group[0].layer = 2`).
+
+        Returns
+        -------
+        None.
+
+        """
+        for geom in self.group:
+            _touch(geom)
+        _touch(self)
+        self._cache = dict()
+        self.__observer().key = None
+    
+    def __changed(self):
+        # The element list has changed (but not the elements themselves)
+        _touch(self)
+        self._cache = dict()
+        self.__observer().key = None
+    
+    def __translate_cache(self, cache: dict, dx: float, dy: float):
+        # Updates the cached data (validated before moving the elements) after a translation
+        _touch(self)
+        cache["_version"] = self.__observer().version
+        if "sindex" in cache:
+            cache["sindex"][0].translate(dx,dy)
+        if "bbox" in cache:
+            cache["bbox"].llx+=dx
+            cache["bbox"].lly+=dy
+        if "select" in cache and not cache["_refs"] and cache["select"][2].all():
+            # Same elements, only the position columns change
+            columns = cache["select"][1]
+            for name,d in [("x",dx),("llx",dx),("urx",dx),("y",dy),("lly",dy),("ury",dy)]:
+                if name in columns:
+                    columns[name] = columns[name]+d
+        else:
+            cache.pop("select",None)
+        # Any other derived data is discarded
+        for name in list(cache.keys()):
+            if name not in ["_key","_refs","_version","sindex","bbox","select"]:
+                cache.pop(name)
     
     def __add__(self,other : 'GeomGroup') -> 'GeomGroup':
         """
@@ -119,10 +704,16 @@ class GeomGroup:
 
         """
         self.group.append(geom)
+        self.__changed()
         
     def copy(self) -> "GeomGroup":
         """
-        Makes a deep copy of the object.
+        Makes a copy of the object.
+        Coordinate arrays are shared with the original until either side 
+        transforms them (all transformations replace the arrays instead of 
+        modifying them). The shared arrays are read-only, assign new arrays 
+        (e.g. with `Poly.set_data`) instead of editing them in place. Referenced cells (SREF/AREF) are never duplicated, the 
+        copied references point to the same cell geometry.
 
         Returns
         -------
@@ -130,18 +721,25 @@ class GeomGroup:
             A detached copy of self.
 
         """
-        return deepcopy(self)
+        g = GeomGroup()
+        g.group = [_copy_geom(geom) for geom in self.group]
+        return g
     
-    def flatten(self, layer_list: List[int] = []) -> "GeomGroup":
+    def flatten(self, layer_list: List[int] = [], packed: bool = False) -> "GeomGroup":
         """
         Flattens the entire group. Turns all SREF and AREF objects in flattened objects.
         All references to cell are removed. A new flattened group is returned and no 
         changes are made to the calling object.
+        The reference transformations are accumulated while descending the hierarchy,
+        so that each element is copied and transformed only once.
 
         Parameters
         ----------
         layer_list : List[int], optional
             A list of layers that should be used when flattening. The default is [] (=all).
+        packed : bool, optional
+            If True, all polygons are returned as one `PolyArray` per layer. 
+            The default is False.
 
         Returns
         -------
@@ -150,25 +748,37 @@ class GeomGroup:
 
         """
         g = GeomGroup()
-        if len(layer_list) == 0:
-            for geom in self.group:            
-                if(type(geom)==SRef or type(geom)==ARef):
-                    flatg=geom.group.flatten()
-                    flatg=geom.place_group(flatg)
-                    g+=flatg
-                else:
-                    g.add(deepcopy(geom))
-        else:
-            for geom in self.group:            
-                if(type(geom)==SRef or type(geom)==ARef):
-                    flatg=geom.group.flatten(layer_list)
-                    flatg=geom.place_group(flatg)
-                    g+=flatg
-                else:
-                    if(geom.layer in layer_list):
-                        g.add(deepcopy(geom))
+        self.__flatten_into(np.array([[1.,0.,0.],[0.,1.,0.]]),layer_list,g.group)
+        if(packed):
+            g.pack()
         return g
     
+    def __flatten_into(self, M, layer_list: List[int], out: list):
+        # Appends to out all the elements transformed by the 2x3 affine matrix M
+        leaves = []
+        for geom in self.group:
+            if(type(geom)!=SRef and type(geom)!=ARef):
+                if(len(layer_list)==0 or geom.layer in layer_list):
+                    leaves.append(geom)
+                continue
+            out+=_affine_leaves(leaves,M)
+            leaves = []
+            if(type(geom)==SRef):
+                geom.group.__flatten_into(_affine_compose(M,geom.transform_matrix()),layer_list,out)
+            elif(type(geom)==ARef):
+                # Flatten the cell once, then replicate it on the lattice
+                sub = []
+                geom.group.__flatten_into(_affine_compose(M,geom.transform_matrix()),layer_list,sub)
+                out+=sub
+                for i in range(geom.ncols):
+                    for j in range(geom.nrows):
+                        if(i==0 and j==0): continue
+                        dx = i*geom.ax+j*geom.bx
+                        dy = i*geom.ay+j*geom.by
+                        T = np.array([[1.,0.,M[0,0]*dx+M[0,1]*dy],[0.,1.,M[1,0]*dx+M[1,1]*dy]])
+                        out+=_affine_leaves(sub,T)
+        out+=_affine_leaves(leaves,M)
+    
     def get_sref_list(self, sref_list=set()):
         """
         Returns a unique list of strings with the 
@@ -231,8 +841,10 @@ class GeomGroup:
         Reference to the the object.
 
         """
+        cache = self.__get_cache()
         for geom in self.group:
             geom.translate(dx,dy)
+        self.__translate_cache(cache,dx,dy)
         return self
     
     def rotate_translate(self, dx: float, dy: float, rot: float):
@@ -257,6 +869,7 @@ class GeomGroup:
         """
         for geom in self.group:
             geom.rotate_translate(dx,dy,rot)
+        self.__changed()
         return self
     
     def rotate(self,x0: float,y0: float,rot: float):
@@ -279,6 +892,7 @@ class GeomGroup:
         """
         for geom in self.group:
             geom.rotate(x0,y0,rot)
+        self.__changed()
         return self
     
     def scale(self,x0: float,y0: float,scale_x: float,scale_y: float):
@@ -303,6 +917,7 @@ class GeomGroup:
         """
         for geom in self.group:
             geom.scale(x0,y0,scale_x,scale_y)
+        self.__changed()
         return self
     
     def mirrorX(self,x0: float):
@@ -321,6 +936,7 @@ class GeomGroup:
         """
         for geom in self.group:
             geom.mirrorX(x0)
+        self.__changed()
         return self
 
     def mirrorY(self,y0: float):
@@ -339,6 +955,7 @@ class GeomGroup:
         """
         for geom in self.group:
             geom.mirrorY(y0)
+        self.__changed()
         return self
     
     def __entity_count(self, recursive: bool = True, layer_wise: bool = False, layer:int = 0) -> dict:
@@ -347,6 +964,7 @@ class GeomGroup:
         if(layer_wise):
             lfgroup = [g for g in self.group if g.layer==layer]        
         cnt["NPoly"] = len([g for g in lfgroup if type(g)==Poly])
+        cnt["NPoly"]+= sum([len(g) for g in lfgroup if type(g)==PolyArray])
         cnt["NPath"] = len([g for g in lfgroup if type(g)==Path])
         cnt["NText"] = len([g for g in lfgroup if type(g)==Text])
         cnt["NCircle"] = len([g for g in lfgroup if type(g)==Circle])
@@ -419,11 +1037,44 @@ class GeomGroup:
             The box representing the bounding box of the geometry.
 
         """
-        if len(self.group)!=0:
-            bb = self.group[0].bounding_box()
-            
+        cache = self.__get_cache()
+        if "bbox" not in cache:
+            cache["bbox"] = self.__bounding_box()
+        bb = cache["bbox"]
+        return Box(bb.llx,bb.lly,bb.width,bb.height)
+    
+    def __bounding_box(self) -> 'Box':
+        # Polygons are combined in a single pass (per storage type), other 
+        # elements one by one. Integer storage is read without conversion.
+        fdata = []
+        idata = []
+        for geom in self.group:
+            if(type(geom)==Poly or type(geom)==PolyArray):
+                if(geom._idata is not None):
+                    idata.append(geom._idata)
+                else:
+                    fdata.append(geom._data)
+        ext = []
+        for polys,scale in [(fdata,1),(idata,1000.0)]:
+            polys = [data for data in polys if data.size!=0]
+            if len(polys)!=0:
+                data = np.concatenate(polys)
+                ext.append((np.min(data[0::2])/scale,np.min(data[1::2])/scale,
+                            np.max(data[0::2])/scale,np.max(data[1::2])/scale))
+        bb = None
+        if len(ext)!=0:
+            llx = min(e[0] for e in ext)
+            lly = min(e[1] for e in ext)
+            bb = Box(llx,lly,max(e[2] for e in ext)-llx,max(e[3] for e in ext)-lly)
         for geom in self.group:
-            bb.combine(geom.bounding_box())
+            if(type(geom)==Poly or type(geom)==PolyArray):
+                continue
+            if bb is None:
+                bb = geom.bounding_box()
+            else:
+                bb.combine(geom.bounding_box())
+        if bb is None:
+            return Box(0,0,0,0)
         return bb
     
     def to_boxes(self, layer: int) -> 'GeomGroup':
@@ -447,6 +1098,10 @@ class GeomGroup:
         bb = GeomGroup()
         for geom in self.group:
             if(geom.layer==layer):
+                if(type(geom)==PolyArray):
+                    for p in geom.to_polygon().group:
+                        bb+=p.bounding_box().toRect()
+                    continue
                 bb+=geom.bounding_box().toRect()
         bb.set_layer(layer)
         return bb
@@ -467,6 +1122,8 @@ class GeomGroup:
         """
         for geom in self.group:
             geom.layer=layer
+            _touch(geom)
+        self.__changed()
         return self
             
     
@@ -592,47 +1249,87 @@ class GeomGroup:
                          'urx': "upper right x position of the bb",
                          'ury': "upper right y position of the bb"}
         code = compile(query_str,"<string>","eval")
-        sflat = self
-        if(len(self.get_sref_list())!=0):
-           sflat=self.flatten()
-        # Pre-allocate Bounding boxes
-        bbs = [g.bounding_box() for g in sflat.group]
         for name in code.co_names:
             if(name not in allowed_names):
                 raise NameError(f"Use of expression {name} not allowed")
-        
-            # Prepare the local variable dictionary
-            
-            if name=="A": # Prepare area array
-                allowed_names[name]=np.array([g.area() for g in sflat.group])
-            if name=="P": # Prepare area array
-                allowed_names[name]=np.array([g.perimeter() for g in sflat.group])
-            if name=="L": # Prepare layer array
-                allowed_names[name]=np.array([g.layer for g in sflat.group])
-            if name=="W": # Prepare width array
-                allowed_names[name]=np.array([b.width for b in bbs])
-            if name=="H": # Prepare height array
-                allowed_names[name]=np.array([b.height for b in bbs])
-            if name=="x" or name=="y": # Prepare centroid array
-                allowed_names["x"]=np.array([g.centroid()[0] for g in sflat.group])
-                allowed_names["y"]=np.array([g.centroid()[1] for g in sflat.group])
-            if name=="llx": # Prepare LL array
-                allowed_names["llx"]=np.array([b.llx for b in bbs])
-            if name=="lly": # Prepare LL array
-                allowed_names["lly"]=np.array([b.lly for b in bbs])
-            if name=="urx": # Prepare UR array
-                allowed_names["urx"]=np.array([b.urx() for b in bbs])
-            if name=="ury": # Prepare UR array
-                allowed_names["ury"]=np.array([b.ury() for b in bbs])            
-            if name=="T": # Prepare type array
-                allowed_names[name]=np.array([str(g.__class__.__name__) for g in sflat.group])
-            
+        # The property columns are kept in cache for successive queries
+        rows,columns,own = self.__select_table()
+        for name in code.co_names:
+            allowed_names[name] = self.__select_column(name,rows,columns)
                 
         # Now execute
         g = GeomGroup()
         sel = eval(code, {"__builtins__": {}}, allowed_names)
-        g.group[:] = [sflat.group[i] for i,val in enumerate(sel) if val]
+        sel = np.broadcast_to(np.asarray(sel,dtype=bool),(len(rows),))
+        # Elements of the group are returned as they are, the others (from 
+        # references or packed polygons) are copied as the table is cached
+        g.group[:] = [rows[i] if own[i] else _copy_geom(rows[i]) for i in np.flatnonzero(sel)]
         return g
+    
+    def __select_table(self):
+        # Elements used by select (flattened, polygon arrays split), the 
+        # dictionary of the property columns computed so far and a flag for
+        # the rows that are elements of the group
+        cache = self.__get_cache()
+        if "select" not in cache:
+            sflat = self
+            if(cache["_refs"]):
+                sflat = self.flatten()
+            rows = []
+            own = []
+            for g in sflat.group:
+                if(type(g)==PolyArray):
+                    split = g.to_polygon().group
+                    rows+=split
+                    own+=[False]*len(split)
+                else:
+                    rows.append(g)
+                    own.append(sflat is self)
+            cache["select"] = (rows,dict(),np.array(own,dtype=bool))
+        return cache["select"]
+    
+    def __select_column(self, name: str, rows: list, columns: dict):
+        # Computes (once) the column of a property used by select
+        if name in columns:
+            return columns[name]
+        ispoly = np.array([type(g)==Poly for g in rows],dtype=bool)
+        others = np.flatnonzero(~ispoly)
+        pa = PolyArray.from_polys([rows[i] for i in np.flatnonzero(ispoly)],0)
+        def column(pvalues, fun):
+            values = np.zeros(len(rows))
+            values[ispoly] = pvalues
+            for i in others:
+                values[i] = fun(rows[i])
+            return values
+        if name in ["A","P","x","y"]:
+            # Polygon properties are calculated in one pass
+            cx,cy = pa.centroids()
+            columns["A"] = column(pa.areas(),lambda g: g.area())
+            columns["P"] = column(pa.perimeters(),lambda g: g.perimeter())
+            columns["x"] = column(cx,lambda g: g.centroid()[0])
+            columns["y"] = column(cy,lambda g: g.centroid()[1])
+        elif name in ["W","H","llx","lly","urx","ury"]:
+            llx,lly,urx,ury = pa.bounding_boxes()
+            bbs = [rows[i].bounding_box() for i in others]
+            columns["llx"] = np.zeros(len(rows))
+            columns["lly"] = np.zeros(len(rows))
+            columns["W"] = np.zeros(len(rows))
+            columns["H"] = np.zeros(len(rows))
+            columns["llx"][ispoly] = llx
+            columns["lly"][ispoly] = lly
+            columns["W"][ispoly] = urx-llx
+            columns["H"][ispoly] = ury-lly
+            columns["llx"][others] = [b.llx for b in bbs]
+            columns["lly"][others] = [b.lly for b in bbs]
+            columns["W"][others] = [b.width for b in bbs]
+            columns["H"][others] = [b.height for b in bbs]
+            columns["urx"] = columns["llx"]+columns["W"]
+            columns["ury"] = columns["lly"]+columns["H"]
+        elif name=="L":
+            columns[name] = np.array([g.layer for g in rows])
+        elif name=="T":
+            columns[name] = np.array([str(g.__class__.__name__) for g in rows])
+        return columns[name]
        
     def find_matching_patterns(self, pattern: "GeomGroup", layer: int):        
         """
@@ -663,18 +1360,33 @@ class GeomGroup:
         psearch.boolean_union(layer)
         if(len(psearch.group)!=1):
             print("It is only possible to search for a single polygon shape")
-        plook = self.copy().boolean_union(layer)
-        b1 = psearch.bounding_box()
-        psearch.translate(-b1.cx(),-b1.cy())
+        index = self.__pattern_index(layer)
         g2 = psearch.group[0]
-        res = []
-        for g in plook.group:
-            if(type(g)==Poly):
-                bb=g.bounding_box()
-                g.translate(-bb.cx(),-bb.cy())
-                if(g.identical_to(g2)):
-                     res+=[[bb.cx(),bb.cy()]]   
-        return res
+        return [list(c) for c in index.get(g2.signature(),[])]
+    
+    def __pattern_index(self, layer: int):
+        # Unites the layer and maps the translation-invariant signature of each 
+        # polygon to the centers of its bounding boxes. Kept in cache for 
+        # repeated searches.
+        patterns = self.__get_cache().setdefault("patterns",dict())
+        if layer not in patterns:
+            plook = GeomGroup()
+            plook.group = [g for g in self.group if (type(g)==Poly or type(g)==PolyArray) and g.layer==layer]
+            plook.boolean_union(layer)
+            plook.unpack()
+            polys = plook.group
+            index = dict()
+            if(len(polys)!=0):
+                pa = PolyArray.from_polys(polys,layer)
+                starts = pa.offsets[:-1]
+                x = pa.data[0::2]
+                y = pa.data[1::2]
+                cx = (np.maximum.reduceat(x,starts)+np.minimum.reduceat(x,starts))/2
+                cy = (np.maximum.reduceat(y,starts)+np.minimum.reduceat(y,starts))/2
+                for p,c in zip(polys,zip(cx.tolist(),cy.tolist())):
+                    index.setdefault(p.signature(),[]).append(c)
+            patterns[layer] = index
+        return patterns[layer]
         
             
     def get_area(self)->float:
@@ -691,10 +1403,28 @@ class GeomGroup:
         for i in range(len(self.group)):
             if(type(self.group[i])==SRef or type(self.group[i])==ARef):
                 area+=self.group[i].group.get_area(); 
-            else:
+            elif(type(self.group[i])!=Poly and type(self.group[i])!=PolyArray):
                 area+=self.group[i].area()
+        area+=np.sum(self.get_poly_metrics()[0])
         return float(round(area*1e6))/1e6
     
+    def get_poly_metrics(self) -> tuple:
+        """
+        Calculates area, centroid and perimeter of all polygons in the group
+        (`Poly` and `PolyArray` elements, in order of appearance) in a single 
+        vectorized pass. Other elements and references are ignored.
+
+        Returns
+        -------
+        tuple
+            Four arrays with area, centroid x, centroid y and perimeter of each polygon.
+
+        """
+        polys = [g for g in self.group if type(g)==Poly or type(g)==PolyArray]
+        pa = PolyArray.from_polys(polys,0)
+        cx,cy = pa.centroids()
+        return pa.areas(),cx,cy,pa.perimeters()
+    
     def path_to_poly(self):
         """
         Converts all path objects in the current group to polygons
@@ -711,6 +1441,7 @@ class GeomGroup:
         
         self.group[:] = [g for g in self.group if not type(g)==Path]
         self.group = self.group+paths.group
+        self.__changed()
         
     def text_to_poly(self):
         """
@@ -728,6 +1459,7 @@ class GeomGroup:
 
         self.group[:] = [g for g in self.group if not type(g)==Text]
         self.group = self.group+polys.group
+        self.__changed()
 
     def all_to_poly(self, Npts_circ: int=12, Npts_arc: int=32, split_arc: bool =False ):
         """
@@ -742,7 +1474,7 @@ class GeomGroup:
         polys = GeomGroup();
         for i in range(len(self.group)):
             g = self.group[i]
-            if(type(g)==Poly):
+            if(type(g)==Poly or type(g)==PolyArray):
                 polys+=self.group[i].to_polygon()
             if(type(g)==Text):
                 polys+=self.group[i].to_polygon()
@@ -761,6 +1493,7 @@ class GeomGroup:
 
         self.group[:] = [g for g in self.group if type(g)==SRef or type(g)==ARef]
         self.group = self.group+polys.group    
+        self.__changed()
     
     def poly_to_circle(self, thresh: float = 0.95, vcount: int = 10, include_refs: bool = True):
         """
@@ -782,6 +1515,7 @@ class GeomGroup:
         None.
 
         """
+        self.unpack()
         polys = GeomGroup();
         for i in range(len(self.group)):
             if (type(self.group[i])==Poly):
@@ -800,6 +1534,7 @@ class GeomGroup:
         
         self.group[:] = [g for g in self.group if type(g)==SRef or type(g)==ARef]
         self.group = self.group+polys.group    
+        self.__changed()
     
     def in_polygons(self, x: float,y:float) -> bool:
         """
@@ -818,12 +1553,155 @@ class GeomGroup:
             True if coorinate is inside the polygon.
 
         """
-        for i in range(len(self.group)):
-            if(type(self.group[i])==Poly):
-                if(self.group[i].point_inside(x,y)):
+        for g in self.query_point(x,y).group:
+            if(type(g)==Poly or type(g)==PolyArray):
+                if(g.point_inside(x,y)):
                     return True
         return False
     
+    def points_inside(self, xs, ys):
+        """
+        Checks if many coordinates are inside the GeomGroup polygons (vectorized
+        version of `GeomGroup.in_polygons`).
+
+        Parameters
+        ----------
+        xs : array-like
+            x coordinates.
+        ys : array-like
+            y coordinates.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean array (same shape as xs), True if the coordinate is inside a polygon.
+
+        """
+        polys = [g for g in self.group if type(g)==Poly or type(g)==PolyArray]
+        return PolyArray.from_polys(polys,0).points_inside(xs,ys)
+    
+    def spatial_index(self) -> GridIndex:
+        """
+        Returns the spatial index of the group, a grid of the bounding boxes
+        of all elements (each polygon in `PolyArray` elements is indexed separately).
+        The index is built the first time it is needed and kept until the 
+        group is modified. Translations update the index without rebuilding it.
+
+        Returns
+        -------
+        samplemaker.spatial.GridIndex
+            The index, item numbers are listed in the order of the elements.
+
+        """
+        cache = self.__get_cache()
+        if "sindex" not in cache:
+            boxes = []
+            elem = []
+            sub = []
+            for i in range(len(self.group)):
+                geom = self.group[i]
+                if(type(geom)==PolyArray):
+                    boxes.append(np.array(geom.bounding_boxes()))
+                    elem.append(np.full(len(geom),i))
+                    sub.append(np.arange(len(geom)))
+                else:
+                    bb = geom.bounding_box()
+                    boxes.append(np.array([[bb.llx],[bb.lly],[bb.urx()],[bb.ury()]]))
+                    elem.append([i])
+                    sub.append([-1])
+            if(len(boxes)==0):
+                boxes = [np.zeros((4,0))]
+                elem = [[]]
+                sub = [[]]
+            boxes = np.concatenate(boxes,axis=1)
+            cache["sindex"]=(GridIndex(boxes[0],boxes[1],boxes[2],boxes[3]),
+                             np.concatenate(elem).astype(int),np.concatenate(sub).astype(int))
+        return cache["sindex"][0]
+    
+    def __index_group(self, items) -> "GeomGroup":
+        # Builds a group from the spatial index item numbers
+        sindex,elem,sub = self.__get_cache()["sindex"]
+        g = GeomGroup()
+        items = np.sort(items)
+        el,first = np.unique(elem[items],return_index=True)
+        first = np.append(first,items.size)
+        for k in range(el.size):
+            geom = self.group[el[k]]
+            if(type(geom)==PolyArray):
+                geom = geom.subset(sub[items[first[k]:first[k+1]]])
+            g.group.append(geom)
+        return g
+    
+    def query_window(self, llx: float, lly: float, urx: float, ury: float) -> "GeomGroup":
+        """
+        Selects the elements whose bounding box intersects a rectangular window.
+        Uses the spatial index of the group (see `GeomGroup.spatial_index`).
+        References are not expanded.
+
+        Parameters
+        ----------
+        llx : float
+            Lower-left x coordinate of the window.
+        lly : float
+            Lower-left y coordinate of the window.
+        urx : float
+            Upper-right x coordinate of the window.
+        ury : float
+            Upper-right y coordinate of the window.
+
+        Returns
+        -------
+        GeomGroup
+            A new group with the selected elements (packed polygons are copied).
+
+        """
+        items = self.spatial_index().query_window(llx,lly,urx,ury)
+        return self.__index_group(items)
+    
+    def query_point(self, x: float, y: float) -> "GeomGroup":
+        """
+        Selects the elements whose bounding box contains a given point.
+        Use `GeomGroup.in_polygons` to test whether the point is inside the polygons.
+
+        Parameters
+        ----------
+        x : float
+            x coordinate.
+        y : float
+            y coordinate.
+
+        Returns
+        -------
+        GeomGroup
+            A new group with the selected elements (packed polygons are copied).
+
+        """
+        items = self.spatial_index().query_point(x,y)
+        return self.__index_group(items)
+    
+    def nearest(self, x: float, y: float) -> "GeomGroup":
+        """
+        Finds the element closest to a point, measuring the distance from 
+        the element bounding box.
+
+        Parameters
+        ----------
+        x : float
+            x coordinate.
+        y : float
+            y coordinate.
+
+        Returns
+        -------
+        GeomGroup
+            A new group with the nearest element (empty if the group is empty).
+
+        """
+        item = self.spatial_index().nearest(x,y)
+        if(item<0):
+            return GeomGroup()
+        return self.__index_group(np.array([item]))
+    
     def keep_refs_only(self):
         """
         Keeps only the Sref and Aref (can be used to keep a skeleton of the structure)
@@ -834,29 +1712,262 @@ class GeomGroup:
 
         """
         self.group[:] =  [g for g in self.group if type(g)==SRef or type(g)==ARef]
-        
-                   
+        self.__changed()
+
+    def pack(self):
+        """
+        Packs all polygons of the group in a single `PolyArray` per layer.
+        Packed polygons are stored in flat coordinate buffers, so that group-wide
+        transformations (translate, rotate, scale, mirror) act on all polygons
+        of a layer with a single NumPy operation. Boolean operations and GDS
+        export work directly on packed polygons. Individual `Poly` objects can
+        be obtained again with `GeomGroup.unpack`.
+        Other elements (paths, circles, references, ...) are not affected.
+        The packed polygons of a layer take the position of the first polygon
+        of that layer in the group, so the drawing order is kept.
+
+        Returns
+        -------
+        Reference to the the object.
+
+        """
+        layers = dict()
+        slots = dict()
+        group = []
+        for geom in self.group:
+            if(type(geom)==Poly or type(geom)==PolyArray):
+                if geom.layer not in layers:
+                    layers[geom.layer]=[]
+                    slots[geom.layer]=len(group)
+                    group.append(None) # replaced by the layer array
+                layers[geom.layer].append(geom)
+            else:
+                group.append(geom)
+        for layer,polys in layers.items():
+            group[slots[layer]] = PolyArray.from_polys(polys,layer)
+        self.group = group
+        self.__changed()
+        return self
+
+    def unpack(self):
+        """
+        Converts all packed polygons (`PolyArray`) back to individual `Poly`
+        objects.
+
+        Returns
+        -------
+        Reference to the the object.
+
+        """
+        if(len([g for g in self.group if type(g)==PolyArray])==0):
+            return self
+        group = []
+        for geom in self.group:
+            if(type(geom)==PolyArray):
+                group+=geom.to_polygon().group
+            else:
+                group.append(geom)
+        self.group = group
+        self.__changed()
+        return self
+
+    
+    def set_int_storage(self, enabled: bool = True):
+        """
+        Converts the polygons of the group (not the referenced cells) to integer 
+        storage in nm or back to float storage in um (see `set_int_storage`).
+        Conversion to integers snaps the coordinates to the 1 nm grid.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            True for integer storage, False for float storage. The default is True.
+
+        Returns
+        -------
+        Reference to the object.
+
+        """
+        for geom in self.group:
+            if((type(geom)==Poly or type(geom)==PolyArray) and geom.is_int_storage()!=enabled):
+                if(enabled):
+                    geom.set_int_data(geom.int_data())
+                else:
+                    geom.data = geom.data
+        self.__changed()
+        return self
     
     def __get_boopy__(self,layer: int):
-        pg0 = boopy.PolyGroup()
-        for i in range(len(self.group)):
-            if(type(self.group[i])==Poly and self.group[i].layer==layer):
-                pdata = self.group[i].int_data()
-                pg0.addPolyData(pdata)
-        return pg0
+        return _polygroup(*self.__layer_arrays__(layer))
     
-    def __set_boopy__(self, pg0,layer: int):
-        npoly = pg0.getPolyCount()
-        polys = GeomGroup();
-        for i in range(npoly):
-            poly = Poly([],[],layer)
-            pdata = np.array(pg0.getPoly(i))
-            pdata =pdata/1000.0
-            poly.set_data(pdata)
-            polys.add(poly)
-        self.group = self.group + polys.group
+    def __set_boopy__(self, pg0,layer: int, packed: bool = False):
+        idata,offsets = _polygroup_arrays(pg0)
+        self.__set_arrays(idata,offsets,layer,packed)
+        
+    def __replace_boopy__(self, pg0, layer: int):
+        # Replaces the polygons in a layer, keeping them packed if they were
+        packed = self.__remove_polys(layer)
+        self.__set_boopy__(pg0, layer, packed)
+        
+    def __remove_polys(self, layer: int) -> bool:
+        # Removes all polygons in a layer, returns True if some were packed
+        packed = len([g for g in self.group if type(g)==PolyArray and g.layer==layer])!=0
+        self.group[:] = [g for g in self.group if not ((type(g)==Poly or type(g)==PolyArray) and g.layer==layer)]
+        self.__changed()
+        return packed
+    
+    def __layer_arrays__(self, layer: int):
+        # Integer coordinate buffer and offsets of all polygons in a layer
+        polys = [g for g in self.group if (type(g)==Poly or type(g)==PolyArray) and g.layer==layer]
+        pa = PolyArray.from_polys(polys,layer)
+        # Empty polygons are dropped
+        return pa.int_data(),np.unique(pa.offsets)
+    
+    def __set_arrays(self, idata, offsets, layer: int, packed: bool = False):
+        if(packed):
+            if(offsets.size>1):
+                self.group.append(_make_polyarray(idata,offsets,layer))
+        else:
+            self.group+=_make_polys(idata,offsets,layer)
+        self.__changed()
+    
+    def __boolean_tiled(self, op: str, layer: int, targetB: "GeomGroup" = None, layerB: int = 0, 
+                        params: tuple = ()) -> bool:
+        # Runs a boolean operation with the tiled engine (see set_boolean_tiling).
+        # Returns False if tiling is disabled or the layer is too small.
+        tsize = round(_tiling["tile_size"]*1000)
+        if(tsize<=0):
+            return False
+        A = self.__layer_arrays__(layer)
+        B = (np.zeros(0,dtype="int64"),np.zeros(1,dtype="int64"))
+        if(targetB is not None):
+            B = targetB.__layer_arrays__(layerB)
+        if(A[1].size+B[1].size-2<_tiling["min_polygons"]):
+            return False
+        boxA = _poly_bboxes(*A) if A[1].size>1 else None
+        boxB = _poly_bboxes(*B) if B[1].size>1 else None
+        # Extent of the result and halo margin of the tiles
+        halo = 0
+        boxes = [boxA]
+        if(op=="xor"):
+            boxes.append(boxB)
+        boxes = [b for b in boxes if b is not None]
+        if(len(boxes)==0):
+            extent = None
+        else:
+            extent = [min(b[0].min() for b in boxes),min(b[1].min() for b in boxes),
+                      max(b[2].max() for b in boxes),max(b[3].max() for b in boxes)]
+            if(op=="resize"):
+                grow = max(params[0],0)
+                extent = [extent[0]-grow,extent[1]-grow,extent[2]+grow,extent[3]+grow]
+                halo = 2*abs(params[0])+1
+        xe = []
+        ye = []
+        if(extent is not None):
+            xe = list(range(int(extent[0]),int(extent[2]),tsize))+[int(extent[2])]
+            ye = list(range(int(extent[1]),int(extent[3]),tsize))+[int(extent[3])]
+        ntiles = max(len(xe)-1,0)*max(len(ye)-1,0)
+        useB = boxB is not None and op not in ("union","resize")
+        # The polygons of each tile are found once for all tiles
+        if(ntiles>0 and boxA is not None):
+            binA = _tile_bins(boxA,xe,ye,halo)
+        if(ntiles>0 and useB):
+            binB = _tile_bins(boxB,xe,ye,halo)
+        
+        def tasks():
+            empty = (np.zeros(0,dtype="int64"),np.zeros(1,dtype="int64"))
+            for i in range(len(xe)-1):
+                for j in range(len(ye)-1):
+                    t = i*(len(ye)-1)+j
+                    core = (xe[i],ye[j],xe[i+1],ye[j+1])
+                    clip = (core[0]-halo,core[1]-halo,core[2]+halo,core[3]+halo)
+                    seams = (i>0,j>0,i<len(xe)-2,j<len(ye)-2)
+                    At = empty
+                    Bt = empty
+                    if(boxA is not None):
+                        At = _select_polys(A[0],A[1],binA[0][binA[1][t]:binA[1][t+1]])
+                    if(useB):
+                        Bt = _select_polys(B[0],B[1],binB[0][binB[1][t]:binB[1][t+1]])
+                    # Skip tiles with an empty result
+                    if(op=="xor"):
+                        if(At[1].size+Bt[1].size==2):
+                            continue
+                    elif(op=="intersection"):
+                        if(At[1].size==1 or Bt[1].size==1):
+                            continue
+                    elif(At[1].size==1):
+                        continue
+                    yield (op,core,clip,seams,At,Bt,params)
+        
+        processes = _tiling["processes"]
+        if(processes>1 and ntiles>1):
+            results = closing(_map_batches(_boolean_tiles,tasks(),processes,
+                                           max(1,min(16,ntiles//(4*processes)))))
+        else:
+            results = nullcontext(starmap(_boolean_tile,tasks()))
+        # Stitching: polygons touching a tile edge are merged again
+        parts = []
+        pgS = boopy.PolyGroup()
+        with results as tiles:
+            for idata,offsets,seam in tiles:
+                for j in np.flatnonzero(seam):
+                    pgS.addPolyData(idata[2*offsets[j]:2*offsets[j+1]])
+                keep = np.flatnonzero(~seam)
+                if(keep.size>0):
+                    parts.append(_select_polys(idata,offsets,keep))
+        pgS.assign()
+        parts.append(_polygroup_arrays(pgS))
+        idata,offsets = _join_polys(parts)
+        packed = self.__remove_polys(layer)
+        self.__set_arrays(idata,offsets,layer,packed)
+        return True
+    
+    def __apply_to_cells(self, method: str, *args, mag_layer: int = None, angle_layer: int = None):
+        # Runs a method once on each unique cell referenced by the group (recursively).
+        # If mag_layer is given, the cells with polygons in that layer must be placed
+        # with an overall magnification of 1. If angle_layer is given, they must be
+        # placed with an overall rotation multiple of 180 degrees.
+        # The placements are checked before any cell is modified.
+        cells = dict()
+        places = dict() # cellname: set of (magnification, rotation, mirrored)
+        stack = [(self,1,0,False)]
+        while len(stack)>0:
+            g,mag,angle,mirror = stack.pop()
+            for geom in g.group:
+                if(type(geom)==SRef or type(geom)==ARef):
+                    # A mirrored parent reverses the rotation of its references
+                    a = angle-geom.angle if mirror else angle+geom.angle
+                    place = (mag*geom.mag,round(a%360,9)%360,mirror!=bool(geom.mirror))
+                    if(geom.cellname not in cells):
+                        cells[geom.cellname] = geom.group
+                        places[geom.cellname] = set()
+                    if(place not in places[geom.cellname]):
+                        places[geom.cellname].add(place)
+                        stack.append((geom.group,)+place)
+        
+        def has_polys(cell, layer):
+            return any((type(g)==Poly or type(g)==PolyArray) and g.layer==layer for g in cell.group)
+        
+        for cname,cell in cells.items():
+            mags = set(p[0] for p in places[cname])
+            if(mag_layer is not None and mags!={1} and has_polys(cell,mag_layer)):
+                raise ValueError(method+": cell "+cname+" is placed with magnification "+
+                                 ", ".join(str(m) for m in sorted(mags))+
+                                 ", use hierarchical=False or flatten it first")
+            angles = set(p[1] for p in places[cname])
+            if(angle_layer is not None and not angles<={0,180} and has_polys(cell,angle_layer)):
+                raise ValueError(method+": cell "+cname+" is placed with rotation "+
+                                 ", ".join(str(a) for a in sorted(angles))+
+                                 ", use hierarchical=False or flatten it first")
+        for cname,cell in cells.items():
+            if(len(cell.group)!=0):
+                getattr(cell,method)(*args)
+        # Boxes of modified cells (and of the cells containing them)
+        for cname,cell in cells.items():
+            if(cname in _BoundingBoxPool and len(cell.group)!=0):
+                _BoundingBoxPool[cname] = cell.bounding_box()
     
-    def boolean_union(self,layer: int):
+    def boolean_union(self,layer: int, hierarchical: bool = False):
         """
         Performs a full boolean union (OR) of all polygons in the group matching a layer
         All other elements (circles, paths, texts) are ignored unless they have been already
@@ -866,19 +1977,30 @@ class GeomGroup:
         ----------
         layer : int
             The layer in which the union should be performed.
+        hierarchical : bool, optional
+            If True, the operation is also performed once on each cell referenced 
+            by the group (recursively), keeping the references. Cells are 
+            processed separately, shapes in different cells are not merged.
+            The cells are modified in the LayoutPool, so references to the same 
+            cells from outside the group are affected as well.
+            The default is False.
 
         Returns
         -------
         Reference to the the object.
 
         """
+        if(hierarchical):
+            self.__apply_to_cells("boolean_union",layer)
+        if(self.__boolean_tiled("union",layer)):
+            return self
         # Get the boost python data
         pg0 = self.__get_boopy__(layer)
         # Remove the old polygons
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layer)]
+        packed = self.__remove_polys(layer)
         pg0.assign()
         # Put back the boost python data 
-        self.__set_boopy__(pg0, layer)
+        self.__set_boopy__(pg0, layer, packed)
         return self
 
     def boolean_difference(self, targetB: "GeomGroup", layerA: int, layerB: int):
@@ -902,15 +2024,17 @@ class GeomGroup:
         Reference to the the object.
 
         """
+        if(self.__boolean_tiled("difference",layerA,targetB,layerB)):
+            return self
         # Get the boost python data
         pgA = self.__get_boopy__(layerA)
         pgB = targetB.__get_boopy__(layerB)
         # Difference
         pgA.difference(pgB)
         # Remove the old polygons
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layerA)]
+        packed = self.__remove_polys(layerA)
         # Put back the boost python data (merge is automatically done)
-        self.__set_boopy__(pgA, layerA)
+        self.__set_boopy__(pgA, layerA, packed)
         return self
         
     def boolean_xor(self, targetB: "GeomGroup", layerA: int, layerB: int):
@@ -934,15 +2058,17 @@ class GeomGroup:
         Reference to the the object.
 
         """
+        if(self.__boolean_tiled("xor",layerA,targetB,layerB)):
+            return self
         # Get the boost python data
         pgA = self.__get_boopy__(layerA)
         pgB = targetB.__get_boopy__(layerB)
         # Difference
         pgA.exor(pgB)
         # Remove the old polygons
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layerA)]
+        packed = self.__remove_polys(layerA)
         # Put back the boost python data (merge is automatically done)
-        self.__set_boopy__(pgA, layerA)
+        self.__set_boopy__(pgA, layerA, packed)
         return self
         
     def boolean_intersection(self, targetB: "GeomGroup", layerA: int, layerB: int):
@@ -966,18 +2092,21 @@ class GeomGroup:
         Reference to the the object.
 
         """
+        if(self.__boolean_tiled("intersection",layerA,targetB,layerB)):
+            return self
         # Get the boost python data
         pgA = self.__get_boopy__(layerA)
         pgB = targetB.__get_boopy__(layerB)
         # Difference
         pgA.intersection(pgB)
         # Remove the old polygons
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layerA)]
+        packed = self.__remove_polys(layerA)
         # Put back the boost python data (merge is automatically done)
-        self.__set_boopy__(pgA, layerA)
+        self.__set_boopy__(pgA, layerA, packed)
         return self
         
-    def poly_resize(self, offset: float, layer: int, corner_fill_arc: bool = False, num_circle_segments: int = 0):
+    def poly_resize(self, offset: float, layer: int, corner_fill_arc: bool = False, num_circle_segments: int = 0,
+                    hierarchical: bool = False):
         """
         Offsets the polygon by a certain distance. Acts only on polygons and on
         a single layer. 
@@ -992,16 +2121,35 @@ class GeomGroup:
             Rounds the convex corners. The default is False.
         num_circle_segments : int, optional
             If corner_fill_arc is True, the number of segments to be used for arc filling. The default is 0.
+        hierarchical : bool, optional
+            If True, the operation is also performed once on each cell referenced 
+            by the group (recursively), keeping the references. Cells are 
+            processed separately, shapes in different cells are not merged.
+            The cells are modified in the LayoutPool, so references to the same 
+            cells from outside the group are affected as well.
+            The default is False.
+
+        Raises
+        ------
+        ValueError
+            If hierarchical is True and a referenced cell with polygons in the layer
+            is placed with a magnification other than 1 (the offset would be scaled).
+            No cell is modified in that case.
 
         Returns
         -------
         Reference to the the object.
 
         """
+        if(hierarchical):
+            self.__apply_to_cells("poly_resize",offset,layer,corner_fill_arc,num_circle_segments,
+                                  mag_layer=layer)
+        if(self.__boolean_tiled("resize",layer,params=(round(offset*1000),corner_fill_arc,num_circle_segments))):
+            return self
         pg0 = self.__get_boopy__(layer)
         pg0.resize(round(offset*1000),corner_fill_arc, num_circle_segments)
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layer)]
-        self.__set_boopy__(pg0, layer)
+        packed = self.__remove_polys(layer)
+        self.__set_boopy__(pg0, layer, packed)
         return self
         
     def poly_anisotropic_resize(self, angles: list, deltas: list, layer: int):
@@ -1024,9 +2172,11 @@ class GeomGroup:
         Reference to the the object.
 
         """
+        self.unpack()
         for i in range(len(self.group)):
             if(type(self.group[i])==Poly and self.group[i].layer==layer):
                 self.group[i].anisotropic_resize(angles,deltas)
+        self.__changed()
         return self
     
     def poly_outlining(self, offset: float, layer: int, distance: float = 0, corner_fill_arc: bool = False, num_circle_segments: int = 0):
@@ -1060,20 +2210,20 @@ class GeomGroup:
             pgorig.resize(round(distance*1000),corner_fill_arc,num_circle_segments)
         else:
             pg0.resize(round(offset*1000),corner_fill_arc, num_circle_segments)
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layer)]
+        packed = self.__remove_polys(layer)
         if(offset>0):
             pg0.difference(pgorig)
-            self.__set_boopy__(pg0,layer)
+            self.__set_boopy__(pg0,layer,packed)
         else:
             pgorig.difference(pg0)
-            self.__set_boopy__(pgorig,layer)
+            self.__set_boopy__(pgorig,layer,packed)
             
         #Circles
         for i in range(len(self.group)):
             if type(self.group[i])==Circle:
                 g = self.group[i]
                 self.group[i] = Arc(g.x0,g.y0,g.r+offset/2+distance,g.r+offset/2+distance,g.layer,0,offset,0,360)            
-                
+        self.__changed()
         return self
     
     def invert(self, layer: int, offset: float = 0):      
@@ -1095,7 +2245,6 @@ class GeomGroup:
         reference to the inverted object.
 
         """
-        pg0 = self.__get_boopy__(layer)
         sel = self.select_layer(layer)
         if len(sel.group)==0: 
             return self
@@ -1103,15 +2252,16 @@ class GeomGroup:
         bb.set_layer(layer)
         if(offset!=0):
             bb.poly_resize(offset, layer)
+        pg0 = self.__get_boopy__(layer)
         pgm = bb.__get_boopy__(layer)
         pgm.difference(pg0)
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layer)]        
-        self.__set_boopy__(pgm, layer)
+        packed = self.__remove_polys(layer)
+        self.__set_boopy__(pgm, layer, packed)
         
         return self
         
        
-    def trapezoids(self,layer: int):
+    def trapezoids(self,layer: int, hierarchical: bool = False):
         """
         Converts and fractures all polygons in a set of trapezoids.
 
@@ -1119,16 +2269,32 @@ class GeomGroup:
         ----------
         layer : int
             the layer to be fractured.
+        hierarchical : bool, optional
+            If True, the operation is also performed once on each cell referenced 
+            by the group (recursively), keeping the references. Cells are 
+            processed separately, shapes in different cells are not merged.
+            The cells are modified in the LayoutPool, so references to the same 
+            cells from outside the group are affected as well.
+            The default is False.
+
+        Raises
+        ------
+        ValueError
+            If hierarchical is True and a referenced cell with polygons in the layer
+            is rotated by an angle that is not a multiple of 180 degrees (the 
+            trapezoids would not have vertical sides). No cell is modified in that case.
 
         Returns
         -------
         Reference to the the object.
 
         """
+        if(hierarchical):
+            self.__apply_to_cells("trapezoids",layer,angle_layer=layer)
         pg0 = self.__get_boopy__(layer)
         pg0.trapezoids()
-        self.group[:] = [g for g in self.group if not (type(g)==Poly and g.layer==layer)]
-        self.__set_boopy__(pg0, layer)
+        packed = self.__remove_polys(layer)
+        self.__set_boopy__(pg0, layer, packed)
         return self
     
     def poly_filter(self, keep_str: str) -> int:
@@ -1169,61 +2335,445 @@ class GeomGroup:
 
         """
         ndisc = 0
+        self.unpack()
         for g in self.group:
             if(type(g)==Poly):
                 ndisc+=g.three_point_filter(keep_str)
+        self.__changed()
         return ndisc
-
-class Dot:
-    def __init__(self,x,y):
-        self.x=x
-        self.y=y
-    
-    def translate(self,dx,dy):
-        self.x+=dx
-        self.y+=dy
-        
-    def rotate(self,x0,y0,rot):
-        xc=self.x-x0
-        yc=self.y-y0
-        cost = math.cos(rot/180*math.pi)
-        sint = math.sin(rot/180*math.pi)
-        self.x=cost*xc-sint*yc+x0
-        self.y=sint*xc+cost*yc+y0
-    
-    def rotate_translate(self, x0, y0, rot):
-        cost = math.cos(rot/180*math.pi)
-        sint = math.sin(rot/180*math.pi)
-        x=self.x
-        y=self.y
-        self.x = (cost*(x)-sint*(y)+x0)
-        self.y = (sint*(x)+cost*(y)+y0)
     
-    def scale(self,x0,y0,scale_x,scale_y):
-        self.x = (self.x-x0)*scale_x+x0
-        self.y = (self.y-y0)*scale_y+y0
-        
-    def mirrorX(self,x0):
-        self.x = 2*x0-self.x
-        
-    def mirrorY(self,y0):
-        self.y = 2*y0-self.y
-   
-class Box:
-    def __init__(self,llx: float, lly: float, width: float, height: float):
-        '''
-        Initialize a box object (not for drawing)
-
-        Parameters
-        ----------
-        llx : float
-            lower-left x-coordinate.
-        lly : float
-            lower-left y-coordinate.
-        width : float
-            width of the box.
-        height : float
-            height of the box.
+    def remove_duplicates(self) -> int:
+        """
+        Removes polygons that are identical to another polygon in the group 
+        (same layer and same vertices on the nanometer grid, regardless of the 
+        starting vertex). The first occurrence is kept. All layers are used.
+
+        Returns
+        -------
+        int
+            The number of polygons removed.
+
+        """
+        self.unpack()
+        polys = [g for g in self.group if type(g)==Poly and g.data.size!=0]
+        if(len(polys)<2):
+            return 0
+        # Only polygons with same layer, vertex count and box can be identical 
+        pa = PolyArray.from_polys(polys,0)
+        idata = pa.int_data()
+        offsets = pa.offsets
+        starts = offsets[:-1]
+        x = idata[0::2]
+        y = idata[1::2]
+        # The closing point is not counted (as in the canonical form)
+        closed = (x[starts]==x[offsets[1:]-1]) & (y[starts]==y[offsets[1:]-1]) & (np.diff(offsets)>1)
+        keys = zip([p.layer for p in polys],(np.diff(offsets)-closed).tolist(),
+                   np.minimum.reduceat(x,starts).tolist(),np.minimum.reduceat(y,starts).tolist(),
+                   np.maximum.reduceat(x,starts).tolist(),np.maximum.reduceat(y,starts).tolist())
+        buckets = dict()
+        for p,key in zip(polys,keys):
+            buckets.setdefault(key,[]).append(p)
+        remove = set()
+        for bucket in buckets.values():
+            if(len(bucket)<2):
+                continue
+            seen = set()
+            for p in bucket:
+                cf = p.canonical_form()
+                if cf in seen:
+                    remove.add(id(p))
+                else:
+                    seen.add(cf)
+        if(len(remove)!=0):
+            self.group = [g for g in self.group if id(g) not in remove]
+            self.__changed()
+        return len(remove)
+
+    def extract_arrays(self, min_count: int = 3) -> int:
+        """
+        Replaces cell references placed on a regular lattice by array 
+        references (ARef). References to the same cell with the same 
+        magnification, rotation and mirroring are grouped, then 1D and 2D lattices
+        are searched among their positions (on the nanometer grid).
+        References that do not belong to any lattice are left untouched.
+
+        Parameters
+        ----------
+        min_count : int, optional
+            Minimum number of references to form an array. The default is 3.
+
+        Returns
+        -------
+        int
+            The number of references replaced by arrays.
+
+        """
+        sets = dict()
+        for i,g in enumerate(self.group):
+            if(type(g)==SRef):
+                key = (g.cellname,round(g.mag,9),round(g.angle%360,9),bool(g.mirror))
+                sets.setdefault(key,[]).append(i)
+        arrays = dict() # index of the first reference to the new ARef
+        remove = set()
+        for key,idx in sets.items():
+            if(len(idx)<min_count):
+                continue
+            refs = [self.group[i] for i in idx]
+            pos = np.round_(np.array([[r.x0,r.y0] for r in refs],dtype="float64")*1000).astype(np.int64)
+            for members,ncols,nrows,a,b in find_lattices(pos,min_count):
+                ref = refs[members[0]]
+                arrays[idx[min(members)]] = ARef(pos[members[0],0]/1000,pos[members[0],1]/1000,
+                                                 ref.cellname,ref.group,ncols,nrows,
+                                                 a[0]/1000,a[1]/1000,b[0]/1000,b[1]/1000,
+                                                 ref.mag,ref.angle,ref.mirror)
+                remove.update([idx[i] for i in members])
+        if(len(remove)==0):
+            return 0
+        group = []
+        for i,g in enumerate(self.group):
+            if i in arrays:
+                group.append(arrays[i])
+            if i not in remove:
+                group.append(g)
+        self.group = group
+        self.__changed()
+        return len(remove)
+    
+    def extract_hierarchy(self, min_count: int = 4, prefix: str = "_HX") -> int:
+        """
+        Moves polygons that are repeated by translation into new cells and 
+        replaces them with cell references (arrays when placed on a lattice).
+        Polygons are compared by their canonical form (see `Poly.canonical_form`).
+        Different polygons that are always repeated together (with the same
+        relative placement) are stored in the same cell. 
+        The new cells are added to the layout pool. Their name is derived from
+        their content, so identical cells are shared between groups.
+
+        Parameters
+        ----------
+        min_count : int, optional
+            Minimum number of repetitions to create a cell. The default is 4.
+        prefix : str, optional
+            Prefix of the new cell names. The default is "_HX".
+
+        Returns
+        -------
+        int
+            The number of polygons replaced by references.
+
+        """
+        self.unpack()
+        classes = dict() # shape (relative to its first vertex) to instances
+        for i,g in enumerate(self.group):
+            if(type(g)==Poly):
+                cf = g.canonical_form()
+                if(len(cf)<3):
+                    continue
+                v = np.array(cf,dtype=np.int64)
+                key = (g.layer,(v-v[0]).tobytes())
+                classes.setdefault(key,[]).append((i,cf[0]))
+        # Shapes with the same relative placement are repeated together
+        clusters = dict() 
+        for key,inst in classes.items():
+            if(len(inst)<min_count):
+                continue
+            anchors = np.array([a for i,a in inst],dtype=np.int64)
+            order = np.lexsort((anchors[:,1],anchors[:,0]))
+            anchors = anchors[order]
+            pattern = (anchors-anchors[0]).tobytes()
+            clusters.setdefault(pattern,[]).append((key,anchors,[inst[k][0] for k in order]))
+        if(len(clusters)==0):
+            return 0
+        
+        remove = set()
+        refs = GeomGroup()
+        for members in clusters.values():
+            members.sort(key=lambda m: m[0])
+            lead = members[0][1]
+            cell = GeomGroup()
+            h = hashlib.sha1()
+            for key,anchors,idx in members:
+                v = np.frombuffer(key[1],dtype=np.int64).reshape(-1,2)+(anchors[0]-lead[0])
+                cell.add(Poly(v[:,0]/1000,v[:,1]/1000,key[0]))
+                h.update(repr(key[0]).encode())
+                h.update(v.tobytes())
+                remove.update(idx)
+            cellname = prefix+"_"+h.hexdigest()[:10]
+            if cellname not in LayoutPool:
+                LayoutPool[cellname] = cell
+                _BoundingBoxPool[cellname] = cell.bounding_box()
+            cell = LayoutPool[cellname]
+            for x0,y0 in lead.tolist():
+                refs.add(SRef(x0/1000,y0/1000,cellname,cell,1.0,0,False))
+        refs.extract_arrays(min_count)
+        self.group = [g for i,g in enumerate(self.group) if i not in remove]+refs.group
+        self.__changed()
+        return len(remove)
+    
+class LayerExpr:
+    def __init__(self, algebra: "LayerAlgebra", op: str, args: tuple, params: tuple = ()):
+        """
+        Initialize a node of a layer expression. Expressions are created from 
+        `LayerAlgebra` (e.g. `la[1]`) and combined with the operators | (union),
+        & (intersection), - (difference), ^ (xor) and the `LayerExpr.resize` method.
+
+        Parameters
+        ----------
+        algebra : LayerAlgebra
+            The layer algebra the expression refers to.
+        op : str
+            The operation ("layer","union","intersection","difference","xor","resize").
+        args : tuple
+            The layer number for "layer" nodes, the operand expressions otherwise.
+        params : tuple, optional
+            Extra parameters of the operation. The default is ().
+
+        Returns
+        -------
+        None.
+
+        """
+        self.algebra = algebra
+        self.op = op
+        self.args = args
+        self.params = params
+        
+    def __or__(self, other: "LayerExpr") -> "LayerExpr":
+        return LayerExpr(self.algebra,"union",(self,other))
+    
+    def __and__(self, other: "LayerExpr") -> "LayerExpr":
+        return LayerExpr(self.algebra,"intersection",(self,other))
+    
+    def __sub__(self, other: "LayerExpr") -> "LayerExpr":
+        return LayerExpr(self.algebra,"difference",(self,other))
+    
+    def __xor__(self, other: "LayerExpr") -> "LayerExpr":
+        return LayerExpr(self.algebra,"xor",(self,other))
+    
+    def resize(self, offset: float, corner_fill_arc: bool = False, num_circle_segments: int = 0) -> "LayerExpr":
+        """
+        Offsets the polygons of the expression (see `GeomGroup.poly_resize`).
+
+        Parameters
+        ----------
+        offset : float
+            Positive or negative offset (resizing) amount.
+        corner_fill_arc : bool, optional
+            Rounds the convex corners. The default is False.
+        num_circle_segments : int, optional
+            If corner_fill_arc is True, the number of segments to be used for arc filling. The default is 0.
+
+        Returns
+        -------
+        LayerExpr
+            The resized expression.
+
+        """
+        return LayerExpr(self.algebra,"resize",(self,),
+                         (round(offset*1000),corner_fill_arc,num_circle_segments))
+    
+    def evaluate(self, owned: bool = True):
+        """
+        Evaluates the expression in boopy form.
+
+        Parameters
+        ----------
+        owned : bool, optional
+            If False, the result may be shared with the layer algebra and 
+            should not be modified. The default is True.
+
+        Returns
+        -------
+        boopy.PolyGroup
+            The evaluated polygons.
+
+        """
+        if(self.op=="layer"):
+            return self.algebra.get_boopy(self.args[0],owned)
+        pgA = self.args[0].evaluate()
+        if(self.op=="resize"):
+            pgA.resize(*self.params)
+            return pgA
+        pgB = self.args[1].evaluate(owned=False)
+        if(self.op=="union"):
+            pgA.merge(pgB)
+        elif(self.op=="intersection"):
+            pgA.intersection(pgB)
+        elif(self.op=="difference"):
+            pgA.difference(pgB)
+        elif(self.op=="xor"):
+            pgA.exor(pgB)
+        return pgA
+    
+class LayerAlgebra:
+    def __init__(self, geom: GeomGroup):
+        """
+        Initialize a layer algebra on a geometry, to chain many boolean operations
+        between layers. Each layer is converted to boopy form only once, the
+        intermediate results are kept in boopy form and only the layers 
+        requested in `LayerAlgebra.apply` are converted back to polygons:
+            
+            la = LayerAlgebra(geom)
+            la[3] = (la[1] | la[2]) - la[4].resize(0.1)
+            la[5] = la[3] & la[6]
+            la.apply([5]) # Only layer 5 is written to geom
+        
+        The geometry should not be modified until `LayerAlgebra.apply` is called.
+        Only polygons are considered, all other elements should be converted to 
+        polygons first.
+
+        Parameters
+        ----------
+        geom : GeomGroup
+            The geometry providing the source layers and receiving the results.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.geom = geom
+        self.__layers = dict() # layer: boopy form
+        self.__assigned = list()
+        
+    def get_boopy(self, layer: int, owned: bool = False):
+        """
+        Returns the boopy form of a layer. The layer is converted only once, 
+        further copies are made directly from the converted boopy form.
+
+        Parameters
+        ----------
+        layer : int
+            The layer number.
+        owned : bool, optional
+            If False, the returned object is shared with the layer algebra and
+            should not be modified. The default is False.
+
+        Returns
+        -------
+        boopy.PolyGroup
+            The polygons in the layer.
+
+        """
+        pg = self.__layers.get(layer)
+        if pg is None:
+            pg = _polygroup(*self.geom.__layer_arrays__(layer))
+            self.__layers[layer] = pg
+        if(owned):
+            return _polygroup_copy(pg)
+        return pg
+    
+    def __getitem__(self, layer: int) -> LayerExpr:
+        return LayerExpr(self,"layer",(layer,))
+    
+    def __setitem__(self, layer: int, expr: LayerExpr):
+        self.__layers[layer] = expr.evaluate()
+        if layer not in self.__assigned:
+            self.__assigned.append(layer)
+        
+    def evaluate(self, expr: LayerExpr, layer: int) -> GeomGroup:
+        """
+        Evaluates an expression into a new geometry.
+
+        Parameters
+        ----------
+        expr : LayerExpr
+            The expression to be evaluated.
+        layer : int
+            The layer of the resulting polygons.
+
+        Returns
+        -------
+        GeomGroup
+            The resulting polygons.
+
+        """
+        g = GeomGroup()
+        g.__set_boopy__(expr.evaluate(owned=False),layer)
+        return g
+    
+    def apply(self, layers: list = None):
+        """
+        Writes the assigned layers to the geometry, replacing the polygons
+        in those layers.
+
+        Parameters
+        ----------
+        layers : list, optional
+            The layers to be written. The default is None (all assigned layers).
+
+        Raises
+        ------
+        ValueError
+            If a layer was not assigned, nothing is written in that case.
+
+        Returns
+        -------
+        GeomGroup
+            Reference to the geometry.
+
+        """
+        if layers is None:
+            layers = list(self.__assigned)
+        layers = list(dict.fromkeys(layers))
+        for layer in layers:
+            if layer not in self.__assigned:
+                raise ValueError("LayerAlgebra.apply: layer "+str(layer)+" was not assigned")
+        for layer in layers:
+            self.geom.__replace_boopy__(self.get_boopy(layer),layer)
+            self.__assigned.remove(layer)
+        return self.geom
+    
+class Dot:
+    def __init__(self,x,y):
+        self.x=x
+        self.y=y
+    
+    def translate(self,dx,dy):
+        self.x+=dx
+        self.y+=dy
+        
+    def rotate(self,x0,y0,rot):
+        xc=self.x-x0
+        yc=self.y-y0
+        cost = math.cos(rot/180*math.pi)
+        sint = math.sin(rot/180*math.pi)
+        self.x=cost*xc-sint*yc+x0
+        self.y=sint*xc+cost*yc+y0
+    
+    def rotate_translate(self, x0, y0, rot):
+        cost = math.cos(rot/180*math.pi)
+        sint = math.sin(rot/180*math.pi)
+        x=self.x
+        y=self.y
+        self.x = (cost*(x)-sint*(y)+x0)
+        self.y = (sint*(x)+cost*(y)+y0)
+    
+    def scale(self,x0,y0,scale_x,scale_y):
+        self.x = (self.x-x0)*scale_x+x0
+        self.y = (self.y-y0)*scale_y+y0
+        
+    def mirrorX(self,x0):
+        self.x = 2*x0-self.x
+        
+    def mirrorY(self,y0):
+        self.y = 2*y0-self.y
+   
+class Box:
+    def __init__(self,llx: float, lly: float, width: float, height: float):
+        '''
+        Initialize a box object (not for drawing)
+
+        Parameters
+        ----------
+        llx : float
+            lower-left x-coordinate.
+        lly : float
+            lower-left y-coordinate.
+        width : float
+            width of the box.
+        height : float
+            height of the box.
 
         Returns
         -------
@@ -1378,96 +2928,108 @@ class Poly:
     def set_data(self, data):
         self.data = data
         self.Npts = math.floor(self.data.size/2)
+    
+    # The coordinates are stored either as float um (_data) or as int32 nm 
+    # (_idata, see set_int_storage). Assigning data switches to float storage.
+    @property
+    def data(self):
+        if(self._idata is None):
+            return self._data
+        return self._idata/1000.0
+    
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._idata = None
+        self.__dict__.pop("_canonical",None)
+        _touch(self)
+    
+    def __getstate__(self):
+        # The cached canonical form and the links to the group caches are not 
+        # stored (pickle, copies)
+        state = self.__dict__.copy()
+        state.pop("_canonical",None)
+        state.pop("_observers",None)
+        return state
+        
+    def __setstate__(self, state):
+        # Objects stored before the integer storage was introduced
+        if "data" in state:
+            state["_data"] = state.pop("data")
+            state["_idata"] = None
+        self.__dict__.update(state)
         
     def int_data(self):
-        return np.round_(self.data*1000).astype(int)
+        if(self._idata is None):
+            return np.round_(self._data*1000).astype(int)
+        return self._idata.astype(int)
     
     def set_int_data(self, idata):
-        self.data = idata.astype("float64")/1000;
-        self.Npts = self.data.size/2
+        # Integer storage of the coordinates in nm
+        self._idata = np.asarray(idata,dtype=np.int32)
+        self._data = None
+        self.__dict__.pop("_canonical",None)
+        _touch(self)
+        self.Npts = math.floor(self._idata.size/2)
+        
+    def is_int_storage(self) -> bool:
+        return self._idata is not None
     
     def __init__(self,xpts,ypts,layer):
         self.layer = layer
         self.set_points(xpts,ypts)
         
+    # Note: transformations never modify the data array in place, as it can 
+    # be shared between copies (see GeomGroup.copy)
     def translate(self,dx,dy):
-        self.data[0::2]+=dx
-        self.data[1::2]+=dy        
+        self.data = _xy(self.data[0::2]+dx,self.data[1::2]+dy)
     
     def rotate_translate(self,x0,y0,rot):
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
-        x = np.copy(self.data[0::2])
-        y = np.copy(self.data[1::2])
-        self.data[0::2] = (cost*(x)-sint*(y)+x0)
-        self.data[1::2] = (sint*(x)+cost*(y)+y0)
+        x = self.data[0::2]
+        y = self.data[1::2]
+        self.data = _xy(cost*(x)-sint*(y)+x0,sint*(x)+cost*(y)+y0)
         
     def rotate(self,x0,y0,rot):
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
-        x = np.copy(self.data[0::2])
-        y = np.copy(self.data[1::2])
-        self.data[0::2] = cost*(x-x0)-sint*(y-y0)+x0
-        self.data[1::2] = sint*(x-x0)+cost*(y-y0)+y0
+        x = self.data[0::2]
+        y = self.data[1::2]
+        self.data = _xy(cost*(x-x0)-sint*(y-y0)+x0,sint*(x-x0)+cost*(y-y0)+y0)
     
     def scale(self,x0,y0,scale_x,scale_y):
         x = self.data[0::2]
         y = self.data[1::2]
-        self.data[0::2] = scale_x*(x-x0)+x0
-        self.data[1::2] = scale_y*(y-y0)+y0
+        self.data = _xy(scale_x*(x-x0)+x0,scale_y*(y-y0)+y0)
             
     def mirrorX(self,x0):
-        self.data[0::2] = 2*x0-self.data[0::2]
+        self.data = _xy(2*x0-self.data[0::2],self.data[1::2])
 
     def mirrorY(self,y0):
-        self.data[1::2] = 2*y0-self.data[1::2]
+        self.data = _xy(self.data[0::2],2*y0-self.data[1::2])
         
     def bounding_box(self):
-        llx = min(self.data[0::2])
-        urx = max(self.data[0::2])
-        lly = min(self.data[1::2])
-        ury = max(self.data[1::2])
+        data = self.data
+        llx = np.min(data[0::2])
+        urx = np.max(data[0::2])
+        lly = np.min(data[1::2])
+        ury = np.max(data[1::2])
         return Box(llx,lly,urx-llx,ury-lly)
     
+    def __offsets(self):
+        return np.array([0,self.data.size//2])
+    
     def area(self):
-        area = 0.0;
-        x = self.data[0::2]
-        y = self.data[1::2]
-        n = int(len(x))
-        j = n-1
-        for i in range(n):
-            area += x[j]*y[i] - x[i]*y[j]
-            j=i
-        return float(round(1e6*abs(area / 2.0)))/1.0e6
+        area = _shoelace(self.data,self.__offsets())[0]
+        return float(round(1e6*abs(area)))/1.0e6
     
     def centroid(self):
-        cx=0;
-        cy=0;
-        area=0;        
-        x = self.data[0::2]
-        y = self.data[1::2]
-        n = int(len(x))
-        j = n-1
-        for i in range(n):
-            shl = x[j]*y[i] - x[i]*y[j]
-            area +=  shl
-            cx+=(x[j]+x[i])*shl
-            cy+=(y[j]+y[i])*shl
-            j=i
-        cx/=3*area
-        cy/=3*area
-        return cx,cy
+        cx,cy = _centroids(self.data,self.__offsets())
+        return cx[0],cy[0]
     
     def perimeter(self):
-        p = 0;
-        x = self.data[0::2]
-        y = self.data[1::2]
-        n = int(len(x))
-        j = n-1
-        for i in range(n):
-            p+=np.sqrt((x[i]-x[j])**2+(y[i]-y[j])**2)
-            j=i
-        return p
+        return _perimeters(self.data,self.__offsets())[0]
     
     def three_point_filter(self,keep_str: str) -> int:
         """
@@ -1589,24 +3151,73 @@ class Poly:
             g.add(Circle(cx,cy,r_avg,self.layer))
         return g
         
+    def signature(self) -> tuple:
+        """
+        Translation-invariant signature of the polygon, i.e. the integer (nm) 
+        vertices relative to the lower-left corner of the bounding box, starting
+        from the lexicographically smallest rotation. Two polygons have the 
+        same signature if they are identical up to a translation.
+
+        Returns
+        -------
+        tuple
+            The signature as a tuple of (x,y) integer pairs, can be hashed.
+
+        """
+        cf = self.canonical_form()
+        if(len(cf)==0):
+            return cf
+        x0 = min(v[0] for v in cf)
+        y0 = min(v[1] for v in cf)
+        return tuple((v[0]-x0,v[1]-y0) for v in cf)
+    
+    def canonical_form(self) -> tuple:
+        """
+        Canonical form of the polygon: the integer (nm) vertices, without the 
+        closing point, starting from the lexicographically smallest rotation.
+        The result is cached until the polygon data changes.
+
+        Returns
+        -------
+        tuple
+            The canonical form as a tuple of (x,y) integer pairs, can be hashed.
+
+        """
+        # The storage array identifies the data (new arrays on every change)
+        token = self._idata if self._idata is not None else self._data
+        cached = self.__dict__.get("_canonical")
+        if(cached is not None and cached[0] is token):
+            return cached[1]
+        v = self.int_data().reshape(-1,2)
+        if(len(v)>1 and v[0,0]==v[-1,0] and v[0,1]==v[-1,1]):
+            v = v[:-1]
+        pts = [tuple(p) for p in v.tolist()]
+        if(len(pts)!=0):
+            k = _min_rotation(pts)
+            pts = pts[k:]+pts[:k]
+        self._canonical = (token,tuple(pts))
+        return self._canonical[1]
+        
     def identical_to(self, p2: "Poly"):
-        x = self.data[0::2]
-        y = self.data[1::2]
-        x2 = p2.data[0::2]
-        y2 = p2.data[1::2]
-        x3 = np.append(x,x)
-        y3 = np.append(y,y)
-        for e in range(0, len(x)):
-            k = 0
-            for w in range(e, e + len(x)):
-                if x2[k]==x3[w] and y2[k]==y3[w]:
-                    k+= 1
-                else:
-                    break
-            # if all n elements are same circularly
-            if k == len(x):
-                return True
-        return False
+        """
+        Checks if two polygons have the same vertices (on the nanometer grid),
+        regardless of the starting vertex.
+
+        Parameters
+        ----------
+        p2 : "Poly"
+            The polygon to compare.
+
+        Returns
+        -------
+        bool
+            True if the polygons are identical.
+
+        """
+        if(self.data.size!=p2.data.size):
+            if(abs(self.data.size-p2.data.size)!=2):
+                return False
+        return self.canonical_form()==p2.canonical_form()
 
     def point_inside(self,x,y):
         c = False
@@ -1630,6 +3241,26 @@ class Poly:
             bpy = fpy
         return c
     
+    def points_inside(self, xs, ys):
+        """
+        Tests whether many points are inside the polygon in one vectorized call.
+        Equivalent to calling `Poly.point_inside` on each point.
+
+        Parameters
+        ----------
+        xs : array-like
+            x coordinates of the points.
+        ys : array-like
+            y coordinates of the points.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean array (same shape as xs), True if the point is inside.
+
+        """
+        return PolyArray.from_polys([self],self.layer).points_inside(xs,ys)
+    
     def anisotropic_resize(self,angle,deltas):
         """
         Performs an anisotropic offset of the polygon 
@@ -1684,6 +3315,332 @@ class Poly:
         self.set_points(xpts, ypts)
         
 
+class PolyArray:
+    def __init__(self, data, offsets, layer):
+        """
+        Initialize a packed array of polygons sharing the same layer.
+        The vertices of all polygons are stored in a single flat buffer
+        (X0,Y0,X1,Y1,... as in `Poly.data`, each polygon closed by repeating 
+        its first point) and an offset array tells where each polygon starts.
+        Use `GeomGroup.pack` to create it from existing polygons.
+
+        Parameters
+        ----------
+        data : array-like
+            Flat coordinate buffer in um.
+        offsets : array-like
+            Index of the first vertex of each polygon, followed by the total 
+            number of vertices (length is number of polygons + 1).
+        layer : int
+            The layer of all polygons.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.data = np.asarray(data,dtype="float64")
+        self.offsets = np.asarray(offsets,dtype="int64")
+        self.layer = layer
+    
+    def __getstate__(self):
+        # Cached derived data is not stored (pickle, copies)
+        state = self.__dict__.copy()
+        state.pop("_canonical",None)
+        state.pop("_observers",None)
+        return state
+    
+    def __setstate__(self, state):
+        # Objects stored before the integer storage was introduced
+        if "data" in state:
+            state["_data"] = state.pop("data")
+            state["_idata"] = None
+        self.__dict__.update(state)
+    
+    @classmethod
+    def from_polys(cls, polys: list, layer: int) -> "PolyArray":
+        """
+        Packs a list of Poly (or PolyArray) objects into a single PolyArray.
+
+        Parameters
+        ----------
+        polys : list
+            The Poly or PolyArray objects to be packed.
+        layer : int
+            The layer of the packed array.
+
+        Returns
+        -------
+        PolyArray
+            The packed polygons.
+
+        """
+        counts = []
+        for p in polys:
+            if(type(p)==PolyArray):
+                counts.append(np.diff(p.offsets))
+            else:
+                counts.append([(p._data if p._idata is None else p._idata).size//2])
+        if(len(polys)==0):
+            return cls([],[0],layer)
+        offsets = np.zeros(1,dtype="int64")
+        offsets = np.append(offsets,np.cumsum(np.concatenate(counts)))
+        if(all(p._idata is not None for p in polys)):
+            # Integer storage is kept if all polygons use it
+            pa = cls([],offsets,layer)
+            pa.set_int_data(np.concatenate([p._idata for p in polys]))
+            return pa
+        return cls(np.concatenate([p.data for p in polys]),offsets,layer)
+    
+    def __len__(self):
+        return self.offsets.size-1
+    
+    def get_poly(self, i: int) -> "Poly":
+        """
+        Materializes the i-th polygon as a Poly object (detached copy).
+
+        Parameters
+        ----------
+        i : int
+            Index of the polygon.
+
+        Returns
+        -------
+        Poly
+            The polygon.
+
+        """
+        p = Poly([],[],self.layer)
+        if(self._idata is None):
+            p.set_data(self._data[2*self.offsets[i]:2*self.offsets[i+1]].copy())
+        else:
+            p.set_int_data(self._idata[2*self.offsets[i]:2*self.offsets[i+1]].copy())
+        return p
+        
+    def subset(self, indices) -> "PolyArray":
+        """
+        Creates a new PolyArray with a selection of the polygons.
+
+        Parameters
+        ----------
+        indices : array-like
+            Indices (or boolean mask) of the polygons to keep.
+
+        Returns
+        -------
+        PolyArray
+            A new PolyArray with copies of the selected polygons.
+
+        """
+        indices = np.arange(len(self))[indices]
+        counts = self.offsets[indices+1]-self.offsets[indices]
+        # Index of each selected vertex in the original buffer
+        vtx = np.repeat(self.offsets[indices]-np.cumsum(counts)+counts,counts)+np.arange(np.sum(counts))
+        offsets = np.append(0,np.cumsum(counts))
+        if(self._idata is not None):
+            pa = PolyArray([],offsets,self.layer)
+            pa.set_int_data(np.stack((self._idata[2*vtx],self._idata[2*vtx+1]),axis=1).reshape(-1))
+            return pa
+        data = np.empty(2*vtx.size)
+        data[0::2] = self._data[2*vtx]
+        data[1::2] = self._data[2*vtx+1]
+        return PolyArray(data,offsets,self.layer)
+    
+    def bounding_boxes(self) -> tuple:
+        """
+        Calculates the bounding box of each polygon in one pass.
+
+        Returns
+        -------
+        tuple
+            Four arrays with llx, lly, urx, ury of each polygon.
+
+        """
+        if(self.offsets[-1]==0):
+            return tuple(np.zeros(len(self)) for i in range(4))
+        starts = self.offsets[:-1]
+        data = self.data
+        x = data[0::2]
+        y = data[1::2]
+        return (np.minimum.reduceat(x,starts),np.minimum.reduceat(y,starts),
+                np.maximum.reduceat(x,starts),np.maximum.reduceat(y,starts))
+        
+    # As for Poly, the data array is replaced and never modified in place
+    def translate(self,dx,dy):
+        self.data = _xy(self.data[0::2]+dx,self.data[1::2]+dy)
+    
+    def rotate_translate(self,x0,y0,rot):
+        cost = math.cos(rot/180*math.pi)
+        sint = math.sin(rot/180*math.pi)
+        x = self.data[0::2]
+        y = self.data[1::2]
+        self.data = _xy(cost*x-sint*y+x0,sint*x+cost*y+y0)
+        
+    def rotate(self,x0,y0,rot):
+        cost = math.cos(rot/180*math.pi)
+        sint = math.sin(rot/180*math.pi)
+        x = self.data[0::2]-x0
+        y = self.data[1::2]-y0
+        self.data = _xy(cost*x-sint*y+x0,sint*x+cost*y+y0)
+    
+    def scale(self,x0,y0,scale_x,scale_y):
+        self.data = _xy(scale_x*(self.data[0::2]-x0)+x0,scale_y*(self.data[1::2]-y0)+y0)
+            
+    def mirrorX(self,x0):
+        self.data = _xy(2*x0-self.data[0::2],self.data[1::2])
+
+    def mirrorY(self,y0):
+        self.data = _xy(self.data[0::2],2*y0-self.data[1::2])
+        
+    def bounding_box(self):
+        data = self.data
+        if(data.size==0):
+            return Box(0,0,0,0)
+        llx = np.min(data[0::2])
+        urx = np.max(data[0::2])
+        lly = np.min(data[1::2])
+        ury = np.max(data[1::2])
+        return Box(llx,lly,urx-llx,ury-lly)
+    
+    def areas(self):
+        """
+        Calculates the area of each polygon in one pass.
+
+        Returns
+        -------
+        numpy.ndarray
+            The area of each polygon.
+
+        """
+        return np.round(1e6*np.abs(_shoelace(self.data,self.offsets)))/1.0e6
+    
+    def centroids(self):
+        """
+        Calculates the centroid of each polygon in one pass.
+
+        Returns
+        -------
+        tuple
+            Two arrays with the x and y coordinates of the centroids.
+
+        """
+        return _centroids(self.data,self.offsets)
+    
+    def perimeters(self):
+        """
+        Calculates the perimeter of each polygon in one pass.
+
+        Returns
+        -------
+        numpy.ndarray
+            The perimeter of each polygon.
+
+        """
+        return _perimeters(self.data,self.offsets)
+    
+    def area(self):
+        return float(np.sum(self.areas()))
+    
+    def centroid(self):
+        # Area-weighted centroid of all polygons, the average vertex position
+        # is used when the polygons have no area
+        a = self.areas()
+        atot = np.sum(a)
+        if(atot==0):
+            if(self.data.size==0):
+                return 0.0,0.0
+            return float(np.mean(self.data[0::2])),float(np.mean(self.data[1::2]))
+        cx,cy = self.centroids()
+        use = a>0
+        return np.sum(a[use]*cx[use])/atot,np.sum(a[use]*cy[use])/atot
+    
+    def perimeter(self):
+        return float(np.sum(self.perimeters()))
+    
+    def point_inside(self,x,y):
+        for i in range(len(self)):
+            if(self.get_poly(i).point_inside(x,y)):
+                return True
+        return False
+    
+    def points_inside(self, xs, ys):
+        """
+        Tests whether many points are inside any of the polygons.
+        Points outside the bounding box of a polygon are rejected before 
+        performing the test on the polygon edges.
+
+        Parameters
+        ----------
+        xs : array-like
+            x coordinates of the points.
+        ys : array-like
+            y coordinates of the points.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean array (same shape as xs), True if the point is inside.
+
+        """
+        xs = np.asarray(xs,dtype="float64")
+        shape = xs.shape
+        xs = xs.reshape(-1)
+        ys = np.asarray(ys,dtype="float64").reshape(-1)
+        order = np.argsort(ys,kind="stable")
+        xsort = xs[order]
+        ysort = ys[order]
+        inside = np.zeros(xs.size,dtype=bool)
+        llx,lly,urx,ury = self.bounding_boxes()
+        j0 = np.searchsorted(ysort,lly,side="left")
+        j1 = np.searchsorted(ysort,ury,side="right")
+        data = self.data
+        for i in np.flatnonzero(j1>j0):
+            xband = xsort[j0[i]:j1[i]]
+            idx = j0[i]+np.flatnonzero((xband>=llx[i]) & (xband<=urx[i]))
+            if(idx.size==0):
+                continue
+            xv = data[2*self.offsets[i]:2*self.offsets[i+1]:2]
+            yv = data[2*self.offsets[i]+1:2*self.offsets[i+1]:2]
+            inside[idx] |= _points_in_ring(xv,yv,xsort[idx],ysort[idx])
+        result = np.zeros(xs.size,dtype=bool)
+        result[order] = inside
+        return result.reshape(shape)
+    
+    # Storage as in Poly: float um (_data) or int32 nm (_idata)
+    @property
+    def data(self):
+        if(self._idata is None):
+            return self._data
+        return self._idata/1000.0
+    
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._idata = None
+        self.__dict__.pop("_canonical",None)
+        _touch(self)
+        
+    def int_data(self):
+        if(self._idata is None):
+            return np.round_(self._data*1000).astype(int)
+        return self._idata.astype(int)
+    
+    def set_int_data(self, idata):
+        # Integer storage of the coordinates in nm
+        self._idata = np.asarray(idata,dtype=np.int32)
+        self._data = None
+        self.__dict__.pop("_canonical",None)
+        _touch(self)
+        
+    def is_int_storage(self) -> bool:
+        return self._idata is not None
+        
+    def to_polygon(self):
+        g = GeomGroup()
+        g.group = [self.get_poly(i) for i in range(len(self))]
+        return g
+        
+
 class Path:
     def __init__(self,xpts,ypts,width,layer):
         self.xpts = xpts
@@ -1693,11 +3650,13 @@ class Path:
         self.Npts = len(xpts)
     
     def translate(self,dx,dy):
+        _touch(self)
         for i in range(self.Npts):
             self.xpts[i]=self.xpts[i]+dx
             self.ypts[i]=self.ypts[i]+dy
             
     def rotate_translate(self,x0,y0,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         for i in range(self.Npts):
@@ -1707,6 +3666,7 @@ class Path:
             self.ypts[i]=sint*(x)+cost*(y)+y0
        
     def rotate(self,x0,y0,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         for i in range(self.Npts):
@@ -1716,6 +3676,7 @@ class Path:
             self.ypts[i]=sint*(x-x0)+cost*(y-y0)+y0
     
     def scale(self,x0,y0,scale_x,scale_y):
+        _touch(self)
         for i in range(self.Npts):
             x=self.xpts[i]
             y=self.ypts[i]
@@ -1724,10 +3685,12 @@ class Path:
             self.width*=scale_x
             
     def mirrorX(self,x0):
+        _touch(self)
         for i in range(self.Npts):
             self.xpts[i]=2*x0-self.xpts[i]
 
     def mirrorY(self,y0):
+        _touch(self)
         for i in range(self.Npts):
             self.ypts[i]=2*y0-self.ypts[i]
             
@@ -1839,10 +3802,12 @@ class Text:
         self.layer=layer
         
     def translate(self,dx,dy):
+        _touch(self)
         self.x0+=dx
         self.y0+=dy
     
     def rotate_translate(self, dx,dy,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         xv = self.x0;
@@ -1852,6 +3817,7 @@ class Text:
         self.angle += rot
     
     def rotate(self,xc,yc,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         xv = self.x0-xc;
@@ -1861,16 +3827,19 @@ class Text:
         self.angle += rot
         
     def scale(self,xc,yc,scale_x,scale_y):
+        _touch(self)
         self.x0 = scale_x*(self.x0-xc)+xc
         self.y0 = scale_y*(self.y0-yc)+yc
         self.height *= scale_y
         self.width *=scale_x
         
     def mirrorX(self,xc):
+        _touch(self)
         self.x0 = 2*xc-self.x0
         self.angle=180-self.angle
 
     def mirrorY(self,yc):
+        _touch(self)
         self.y0 = 2*yc-self.y0
         self.angle=-self.angle
         
@@ -1895,7 +3864,7 @@ class Text:
             if(c==' '):
                 offset+=self.height
             if c in _glyphs:
-                letter = deepcopy(_glyphs[c][0])
+                letter = _glyphs[c][0].copy()
                 letter.set_layer(self.layer)
                 letter.scale(0, 0, self.height,self.height)
                 for p in letter.group:
@@ -1926,10 +3895,12 @@ class RefBase:
         self.layer = 0 # Unused
     
     def translate(self,dx,dy):
+        _touch(self)
         self.x0+=dx
         self.y0+=dy
         
     def rotate_translate(self,dx,dy,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         xv = self.x0;
@@ -1940,6 +3911,7 @@ class RefBase:
         self.angle = self.angle%360
         
     def rotate(self,xc,yc,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         xv = self.x0-xc;
@@ -1950,23 +3922,43 @@ class RefBase:
         self.angle = self.angle%360
         
     def scale(self,xc,yc,scale_x,scale_y):
+        _touch(self)
         self.x0 = scale_x*(self.x0-xc)+xc
         self.y0 = scale_y*(self.y0-yc)+yc
         self.mag *= scale_x
         
     def mirrorX(self,xc):
+        _touch(self)
         self.x0 = 2*xc-self.x0
         self.mirror=not self.mirror
         self.angle=180-self.angle
         self.angle = self.angle%360
 
     def mirrorY(self,yc):
+        _touch(self)
         self.y0 = 2*yc-self.y0
         self.mirror = not self.mirror
         self.angle = -self.angle
         
     def centroid(self):
         return self.x0,self.y0
+    
+    def transform_matrix(self):
+        """
+        The placement of the reference as a 2x3 affine matrix 
+        (magnification, mirror, rotation and translation).
+
+        Returns
+        -------
+        numpy.ndarray
+            The 2x3 matrix [[a,b,x0],[c,d,y0]].
+
+        """
+        cost = math.cos(self.angle/180*math.pi)
+        sint = math.sin(self.angle/180*math.pi)
+        m = -self.mag if self.mirror else self.mag
+        return np.array([[self.mag*cost,-m*sint,self.x0],
+                         [self.mag*sint,m*cost,self.y0]])
                 
 class SRef(RefBase):
     def __init__(self,x0,y0,cellname,group,mag,angle,mirror):
@@ -1975,7 +3967,9 @@ class SRef(RefBase):
         self.group = group
     
     def bounding_box(self):
-        if(self.cellname in _BoundingBoxPool):
+        # The cell geometry (with its cached box) is used when available, 
+        # the box pool covers cells whose geometry has been released.
+        if(len(self.group.group)==0 and self.cellname in _BoundingBoxPool):
             bb = _BoundingBoxPool[self.cellname]
         else:
             bb = self.group.bounding_box()
@@ -2015,8 +4009,9 @@ class ARef(SRef):
     def bounding_box(self):
         bb=SRef.bounding_box(self);
         bbn = deepcopy(bb)
-        for i in range(self.ncols):
-            for j in range(self.nrows):
+        # The lattice is linear, the extremes are in the corner sites
+        for i in set([0,self.ncols-1]):
+            for j in set([0,self.nrows-1]):
                 dx = i*self.ax+j*self.bx
                 dy = i*self.ay+j*self.by
                 bbn.combine(Box(bb.llx+dx,bb.lly+dy,bb.width,bb.height))
@@ -2043,10 +4038,12 @@ class Circle:
         self.layer=layer
         
     def translate(self,dx,dy):
+        _touch(self)
         self.x0+=dx
         self.y0+=dy
 
     def rotate_translate(self,xc,yc,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         x = self.x0
@@ -2055,6 +4052,7 @@ class Circle:
         self.y0 = sint*x+cost*y+yc
     
     def rotate(self,xc,yc,rot):
+        _touch(self)
         cost = math.cos(rot/180*math.pi)
         sint = math.sin(rot/180*math.pi)
         x = self.x0
@@ -2063,14 +4061,17 @@ class Circle:
         self.y0 = sint*(x-xc)+cost*(y-yc)+yc
         
     def scale(self,xc,yc,scale_x,scale_y):
+        _touch(self)
         self.x0 = scale_x*(self.x0-xc)+xc
         self.y0 = scale_y*(self.y0-yc)+yc
         self.r = scale_x*self.r
         
     def mirrorX(self,xc):
+        _touch(self)
         self.x0 = 2*xc-self.x0
 
     def mirrorY(self,yc):
+        _touch(self)
         self.y0 = 2*yc-self.y0
         
     def bounding_box(self):
@@ -2102,22 +4103,27 @@ class Ellipse(Circle):
         self.rot=rot
     
     def rotate_translate(self, xc,yc,rot):
+        _touch(self)
         Circle.rotate_translate(self, xc, yc, rot)
         self.rot+=rot
         
     def rotate(self,xc,yc,rot):
+        _touch(self)
         Circle.rotate(self,xc,yc,rot)
         self.rot+=rot
     
     def scale(self,xc,yc,scale_x,scale_y):
+        _touch(self)
         Circle.scale(self,xc,yc,scale_x,scale_y)
         self.r1*=scale_y
         
     def mirrorX(self, xc):
+        _touch(self)
         Circle.mirrorX(self,xc)
         self.rot=180-self.rot
     
     def mirrorY(self, yc):
+        _touch(self)
         Circle.mirrorY(self,yc)
         self.rot=-self.rot
     
@@ -2150,6 +4156,7 @@ class Ring(Ellipse):
         self.w=w
         
     def scale(self,xc,yc,scale_x,scale_y):
+        _touch(self)
         Ellipse.scale(self,xc,yc,scale_x,scale_y)
         self.w*=scale_x
     
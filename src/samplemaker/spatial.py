@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial indexing of bounding boxes.
+
+The `GridIndex` class stores a set of axis-aligned boxes in a uniform grid, so that
+window queries, point queries and nearest-neighbour lookups only test the boxes
+in the neighbourhood of the query instead of scanning all of them.
+
+The index should not be used directly, it is built and cached automatically by
+`samplemaker.shapes.GeomGroup` (see `GeomGroup.query_window`, `GeomGroup.query_point`
+and `GeomGroup.nearest`).
+
+The `find_lattices` function finds regular arrays in a set of positions, it is 
+used to build array references (see `GeomGroup.extract_arrays`) and repetitions
+in OASIS files.
+"""
+
+import numpy as np
+import math
+
+class GridIndex:
+    """
+    Uniform grid index over a set of boxes.
+    """
+
+    # Boxes spanning more than this number of cells are stored separately
+    # and tested at every query.
+    max_cells_per_box = 64
+
+    def __init__(self, llx, lly, urx, ury, cell_size: float = 0):
+        """
+        Builds the index.
+
+        Parameters
+        ----------
+        llx, lly, urx, ury : array-like
+            Lower-left and upper-right coordinates of the boxes.
+        cell_size : float, optional
+            Size of the grid cells. The default is 0 (automatic, based on
+            the average box size and density).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.llx = np.asarray(llx,dtype="float64")
+        self.lly = np.asarray(lly,dtype="float64")
+        self.urx = np.asarray(urx,dtype="float64")
+        self.ury = np.asarray(ury,dtype="float64")
+        n = self.llx.size
+        if n==0:
+            self.x0 = 0
+            self.y0 = 0
+            self.cs = 1
+            self.nx = 1
+            self.ny = 1
+            self.cell_start = np.zeros(2,dtype="int64")
+            self.cell_items = np.zeros(0,dtype="int64")
+            self.large = np.zeros(0,dtype="int64")
+            return
+        self.x0 = np.min(self.llx)
+        self.y0 = np.min(self.lly)
+        width = max(np.max(self.urx)-self.x0,1e-9)
+        height = max(np.max(self.ury)-self.y0,1e-9)
+        if(cell_size<=0):
+            # Average box size, but not more than ~n cells in total
+            avg = np.mean(np.maximum(self.urx-self.llx,self.ury-self.lly))
+            cell_size = max(avg,math.sqrt(width*height/n),1e-9)
+        self.cs = cell_size
+        self.nx = int(min(math.floor(width/cell_size)+1,4*n+1))
+        self.ny = int(min(math.floor(height/cell_size)+1,4*n+1))
+
+        ix0,iy0 = self.__cell(self.llx,self.lly)
+        ix1,iy1 = self.__cell(self.urx,self.ury)
+        w = ix1-ix0+1
+        counts = w*(iy1-iy0+1)
+        islarge = counts>self.max_cells_per_box
+        self.large = np.flatnonzero(islarge)
+        counts[islarge]=0
+        # Expand each box into the list of cells it covers
+        item = np.repeat(np.arange(n),counts)
+        k = np.arange(item.size)-np.repeat(np.cumsum(counts)-counts,counts)
+        cells = (iy0[item]+k//w[item])*self.nx+ix0[item]+k%w[item]
+        order = np.argsort(cells,kind="stable")
+        self.cell_items = item[order]
+        self.cell_start = np.zeros(self.nx*self.ny+1,dtype="int64")
+        self.cell_start[1:] = np.cumsum(np.bincount(cells,minlength=self.nx*self.ny))
+
+    def __cell(self, x, y):
+        ix = np.clip(np.floor((np.asarray(x)-self.x0)/self.cs),0,self.nx-1).astype("int64")
+        iy = np.clip(np.floor((np.asarray(y)-self.y0)/self.cs),0,self.ny-1).astype("int64")
+        return ix,iy
+
+    def __len__(self):
+        return self.llx.size
+
+    def translate(self, dx: float, dy: float):
+        """
+        Shifts all boxes (and the grid) without rebuilding the index.
+
+        Parameters
+        ----------
+        dx : float
+            Shift in x direction.
+        dy : float
+            Shift in y direction.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.llx = self.llx+dx
+        self.urx = self.urx+dx
+        self.lly = self.lly+dy
+        self.ury = self.ury+dy
+        self.x0 += dx
+        self.y0 += dy
+
+    def __candidates(self, llx, lly, urx, ury):
+        ix0,iy0 = self.__cell(llx,lly)
+        ix1,iy1 = self.__cell(urx,ury)
+        chunks = [self.large]
+        for iy in range(iy0,iy1+1):
+            c0 = self.cell_start[iy*self.nx+ix0]
+            c1 = self.cell_start[iy*self.nx+ix1+1]
+            chunks.append(self.cell_items[c0:c1])
+        return np.unique(np.concatenate(chunks))
+
+    def query_window(self, llx: float, lly: float, urx: float, ury: float):
+        """
+        Finds all boxes intersecting a window (including touching boxes).
+
+        Parameters
+        ----------
+        llx : float
+            Lower-left x coordinate of the window.
+        lly : float
+            Lower-left y coordinate of the window.
+        urx : float
+            Upper-right x coordinate of the window.
+        ury : float
+            Upper-right y coordinate of the window.
+
+        Returns
+        -------
+        numpy.ndarray
+            Sorted indices of the boxes.
+
+        """
+        if len(self)==0:
+            return np.zeros(0,dtype="int64")
+        idx = self.__candidates(llx,lly,urx,ury)
+        sel = (self.llx[idx]<=urx) & (self.urx[idx]>=llx) & (self.lly[idx]<=ury) & (self.ury[idx]>=lly)
+        return idx[sel]
+
+    def query_point(self, x: float, y: float):
+        """
+        Finds all boxes containing a point.
+
+        Parameters
+        ----------
+        x : float
+            x coordinate.
+        y : float
+            y coordinate.
+
+        Returns
+        -------
+        numpy.ndarray
+            Sorted indices of the boxes.
+
+        """
+        return self.query_window(x,y,x,y)
+
+    def distance(self, idx, x: float, y: float):
+        """
+        Distance between a point and a set of boxes (zero if inside).
+
+        Parameters
+        ----------
+        idx : array-like
+            Indices of the boxes.
+        x : float
+            x coordinate.
+        y : float
+            y coordinate.
+
+        Returns
+        -------
+        numpy.ndarray
+            The distances.
+
+        """
+        dx = np.maximum(np.maximum(self.llx[idx]-x,x-self.urx[idx]),0)
+        dy = np.maximum(np.maximum(self.lly[idx]-y,y-self.ury[idx]),0)
+        return np.hypot(dx,dy)
+
+    def nearest(self, x: float, y: float) -> int:
+        """
+        Finds the box closest to a point.
+
+        Parameters
+        ----------
+        x : float
+            x coordinate.
+        y : float
+            y coordinate.
+
+        Returns
+        -------
+        int
+            Index of the nearest box, -1 if the index is empty.
+
+        """
+        if len(self)==0:
+            return -1
+        # Grow a search window until something is found
+        r = self.cs/2
+        span = max(self.nx,self.ny)*self.cs+abs(x-self.x0)+abs(y-self.y0)
+        idx = self.query_window(x-r,y-r,x+r,y+r)
+        while idx.size==0 and r<span:
+            r*=2
+            idx = self.query_window(x-r,y-r,x+r,y+r)
+        if idx.size==0:
+            idx = np.arange(len(self))
+        # Any box closer than the best candidate lies within that radius
+        d = np.min(self.distance(idx,x,y))
+        idx = self.query_window(x-d,y-d,x+d,y+d)
+        return int(idx[np.argmin(self.distance(idx,x,y))])
+
+def find_lattices(pos, min_count: int) -> list:
+    """
+    Finds regular 1D and 2D lattices in a set of integer positions. 
+    The search is greedy: the lowest remaining position is the origin, the first
+    lattice vector points to the nearest position and the second one to the 
+    nearest complete row. Duplicate positions and positions that do not belong
+    to any lattice are not returned.
+    Positions are hashed on a uniform grid, the neighbours of each origin are 
+    searched in growing squares of grid cells around it.
+
+    Parameters
+    ----------
+    pos : numpy.ndarray
+        Nx2 array of integer positions.
+    min_count : int
+        Minimum number of positions in a lattice.
+
+    Returns
+    -------
+    list
+        List of tuples (indices, ncols, nrows, a, b) for each lattice, where 
+        `indices` are the positions in the lattice (the origin first), `ncols` 
+        and `nrows` the number of sites along the lattice vectors `a` and `b`.
+
+    """
+    pos = np.asarray(pos,dtype=np.int64)
+    site = dict()
+    for i in range(len(pos)):
+        site.setdefault((pos[i,0],pos[i,1]),i)
+    alive = np.zeros(len(pos),dtype=bool)
+    alive[list(site.values())] = True
+    nalive = len(site)
+    order = [i for i in np.lexsort((pos[:,0],pos[:,1])) if alive[i]]
+    found = []
+    if(nalive==0):
+        return found
+    
+    # Grid of the unique positions, about one position per cell on a full lattice
+    upos = pos[alive]
+    extent = max(int(np.max(upos[:,0])-np.min(upos[:,0])),int(np.max(upos[:,1])-np.min(upos[:,1])),1)
+    cell = max(1,int(math.ceil(extent/math.sqrt(nalive))))
+    gx = pos[:,0]//cell
+    gy = pos[:,1]//cell
+    grid = dict()
+    for i in np.flatnonzero(alive):
+        grid.setdefault((gx[i],gy[i]),[]).append(i)
+    gxmin = min(k[0] for k in grid)
+    gxmax = max(k[0] for k in grid)
+    gymin = min(k[1] for k in grid)
+    gymax = max(k[1] for k in grid)
+    
+    def neighbours(i, R):
+        # Alive sites after i (in y,x order) in the cells within R of the cell 
+        # of i, sorted by distance (ties by index). Sites closer than R*cell 
+        # are certainly all there.
+        near = []
+        for cx in range(max(gx[i]-R,gxmin),min(gx[i]+R,gxmax)+1):
+            for cy in range(max(gy[i]-R,gymin),min(gy[i]+R,gymax)+1):
+                near+=grid.get((cx,cy),[])
+        near = np.array(near,dtype=np.int64)
+        near = near[alive[near]]
+        d = pos[near]-pos[i]
+        after = (d[:,1]>0) | ((d[:,1]==0) & (d[:,0]>0))
+        near = near[after]
+        dist = np.hypot(d[after,0],d[after,1])
+        srt = np.lexsort((near,dist))
+        return near[srt],dist[srt]
+    
+    def line(o,v):
+        # Number of consecutive sites from o along v
+        n = 0
+        while (o[0]+n*v[0],o[1]+n*v[1]) in site and alive[site[(o[0]+n*v[0],o[1]+n*v[1])]]:
+            n+=1
+        return n
+    
+    for i in order:
+        if(not alive[i]):
+            continue
+        if(nalive<min_count):
+            break
+        o = pos[i]
+        Rmax = max(gx[i]-gxmin,gxmax-gx[i],gy[i]-gymin,gymax-gy[i])
+        R = 1
+        while True:
+            cand,dist = neighbours(i,R)
+            complete = R>=Rmax
+            if(not complete):
+                # Only the sites certainly in distance order
+                sure = dist<=R*cell
+                cand = cand[sure]
+                dist = dist[sure]
+            if(cand.size==0 or (not complete and 1.001*dist[0]>R*cell)):
+                if(complete):
+                    break
+                R*=2
+                continue
+            # First vector: longest line among the nearest sites
+            d = pos[cand]-o
+            a = None
+            for ja in cand[:4][dist[:4]<=1.001*dist[0]]:
+                n = line(o,pos[ja]-o)
+                if(a is None or n>ncols):
+                    a = pos[ja]-o
+                    ncols = n
+            offline = cand[d[:,0]*a[1]-d[:,1]*a[0]!=0]
+            if(complete or offline.size>=8):
+                break
+            R*=2
+        if(cand.size==0):
+            continue
+        nrows = 1
+        b = np.array([-a[1],a[0]])
+        # Second vector: nearest site off the first line starting a full row
+        for j in offline[:8]:
+            v = pos[j]-o
+            n = 1
+            while line(o+n*v,a)>=ncols:
+                n+=1
+            if(n>1):
+                b = v
+                nrows = n
+                break
+        if(ncols*nrows<min_count):
+            continue
+        members = []
+        for r in range(nrows):
+            for c in range(ncols):
+                k = site[(o[0]+c*a[0]+r*b[0],o[1]+c*a[1]+r*b[1])]
+                members.append(k)
+                alive[k] = False
+        nalive-=len(members)
+        found.append((members,ncols,nrows,a,b))
+    return found
@@ -37,6 +37,14 @@ def __GeomGetPatches(grp: "GeomGroup"):
             tmpp.set_facecolor(lcolor)
             patches.append(tmpp)
             continue
+        if(geomtype==smsh.PolyArray):
+            data = geom.data
+            for i in range(len(geom)):
+                xy = np.reshape(data[2*geom.offsets[i]:2*geom.offsets[i+1]],(-1,2))
+                tmpp = Polygon(xy,True)
+                tmpp.set_facecolor(lcolor)
+                patches.append(tmpp)
+            continue
         if(geomtype==smsh.Circle):
             tmpc = Circle((geom.x0, geom.y0), geom.r)
             tmpc.set_facecolor(lcolor)